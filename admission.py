@@ -0,0 +1,89 @@
+"""
+Admission control for filter requests. Before anything is generated or
+scanned, a request is costed from the pool size and its survivor count,
+which counting.py gives exactly for sessions with a known lineage, as long
+as counting is cheap; otherwise the survivors are unknown and only the
+scan is costed. The costs are checked against a memory and a time budget:
+
+- 'run': within both budgets; run as asked.
+- 'count': the survivors would not fit the memory budget, so only the
+  counts are returned. Streaming requests hold no result and skip this.
+- 'job': the scan would outlast the time budget of a synchronous request,
+  so it runs as a background job (see jobs.py) instead.
+- 'reject': not even a job or a stream would finish within the job limit,
+  or a job's result would not fit in memory.
+
+LOTTERY_MEMORY_BUDGET_MB, LOTTERY_TIME_BUDGET and LOTTERY_MAX_JOB_SECONDS
+set the budgets. LOTTERY_SCAN_RATE is the assumed filter throughput, in
+rows per second.
+"""
+import os
+
+from features import INDEX_ROW_BYTES
+
+MEMORY_BUDGET = int(os.environ.get('LOTTERY_MEMORY_BUDGET_MB', 1024)) * 1024 * 1024
+# Below gunicorn's default 30 s worker timeout
+TIME_BUDGET = float(os.environ.get('LOTTERY_TIME_BUDGET', 20))
+MAX_JOB_SECONDS = float(os.environ.get('LOTTERY_MAX_JOB_SECONDS', 900))
+SCAN_RATE = float(os.environ.get('LOTTERY_SCAN_RATE', 20e6))
+
+RUN = 'run'
+COUNT = 'count'
+JOB = 'job'
+REJECT = 'reject'
+
+
+class Admission:
+    """
+    The decision for one request and the estimates behind it.
+    """
+
+    def __init__(self, action, reason, rows, survivors, result_bytes, seconds):
+        self.action = action
+        self.reason = reason
+        self.rows = rows
+        self.survivors = survivors
+        self.result_bytes = result_bytes
+        self.seconds = seconds
+
+    def report(self):
+        return {
+            'action': self.action,
+            'reason': self.reason,
+            'rows': self.rows,
+            'survivors': self.survivors,
+            'estimatedBytes': self.result_bytes,
+            'estimatedSeconds': round(self.seconds, 3),
+        }
+
+
+def _megabytes(size):
+    return f"{size / (1024 * 1024):,.0f} MB"
+
+
+def admit(rows, scanned, survivors, choose, streaming=False, background=False):
+    """
+    Decides how to serve a request that scans `scanned` of `rows`
+    combinations and keeps `survivors` of them (None when unknown).
+    `background` is set for requests that are already jobs.
+    """
+    # Unknown survivors are bounded by an input that is already held
+    result_bytes = 0 if streaming or survivors is None else survivors * (choose + INDEX_ROW_BYTES)
+    seconds = scanned / SCAN_RATE
+
+    def decide(action, reason=None):
+        return Admission(action, reason, rows, survivors, result_bytes, seconds)
+
+    if seconds > MAX_JOB_SECONDS:
+        return decide(REJECT, f"Filtering would scan {scanned:,} combinations, about {seconds:,.1f} s, "
+                              f"over the {MAX_JOB_SECONDS:,.0f} s limit; narrow the filters or use /count")
+    if result_bytes > MEMORY_BUDGET:
+        reason = (f"{survivors:,} combinations would take about {_megabytes(result_bytes)}, "
+                  f"over the {_megabytes(MEMORY_BUDGET)} memory budget")
+        if background:
+            return decide(REJECT, reason + "; narrow the filters or stream the results")
+        return decide(COUNT, reason + "; returning counts only, stream to get the combinations")
+    if seconds > TIME_BUDGET and not streaming and not background:
+        return decide(JOB, f"Filtering would scan {scanned:,} combinations, about {seconds:,.1f} s, "
+                           f"over the {TIME_BUDGET:,.1f} s request budget; running it as a job")
+    return decide(RUN)
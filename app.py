@@ -1,8 +1,48 @@
-from flask import Flask, jsonify, request
-from itertools import combinations
-import random
+from flask import Flask, Response, g, jsonify, request
+import hashlib
+import json
+import os
+import numpy as np
+from combinatorics import CombinationPool
+from compression import ENCODINGS, BodyCache, compressible, compress, negotiate
+from admission import JOB, REJECT, RUN, admit
+from cache import ResultCache, result_key
+from counting import COUNTABLE, Constraints, CountTooLarge, affordable, count, count_stages, countable
+from features import INDEX_ROW_BYTES, combo_stats, index_block
+from generator import SCAN_FRACTION, generate
+from history import current_history
+from incremental import PipelineRun
+from jobs import DONE, PROGRESS_ROWS, JobStore
+from jsonprovider import CombinationJSONProvider
+from metrics import Metrics, RequestTimer, counting_iter
+from paging import decode_cursor, page_fields, page_matrix, page_params
+from parallel import run_pipeline_parallel
+from pipeline import iter_pipeline, parse_filters, parse_pipeline, plan
+from poolstore import POOL_DIR, PoolStore
+from sampling import draw_ranks, sampler_for
+from sessions import SessionStore
+from streaming import NDJSON_MIMETYPE, STREAM_FORMATS, stream_response
+from vectorized import Block, filter_combinations, iter_blocks, to_matrix
+from wire import BINARY_MIMETYPES, binary_response, decode
 
 app = Flask(__name__)
+# Responses may hold combinations as matrices; see jsonprovider.py
+app.json = CombinationJSONProvider(app)
+sessions = SessionStore()
+result_cache = ResultCache(shared_dir=os.environ.get('LOTTERY_CACHE_DIR'))
+metrics = Metrics()
+pool_store = PoolStore(POOL_DIR) if POOL_DIR else None
+compressed_bodies = BodyCache()
+jobs = JobStore()
+
+# Send a Server-Timing header on every response, not only on ?timing=1
+SERVER_TIMING = os.environ.get('LOTTERY_SERVER_TIMING') == '1'
+
+# Part of every /calc ETag; bump it when the /calc response format changes
+CALC_ETAG_VERSION = 1
+
+# Seconds between keep-alive comments on idle job event streams
+SSE_KEEPALIVE = 15
 
 def apply_sum_filter(combo, min_sum, max_sum):
     combo_sum = sum(combo)
@@ -47,23 +87,16 @@ def apply_include_filter(combinations, must_include):
 def apply_exclude_filter(combo, must_exclude):
     return not any(num in combo for num in must_exclude)
 
-def random_combinations(combinations, num_sets):
-    if not combinations:
+def random_combinations(combinations, num_sets, seed=None, replace=False):
+    if len(combinations) == 0:
         return []
     try:
         num_sets = int(num_sets)
-        if num_sets <= 0:
-            return []
-        # Use random.sample if we want fewer sets than available
-        if num_sets <= len(combinations):
-            return random.sample(combinations, num_sets)
-        # If we want more sets than available, repeat the process
-        result = []
-        while len(result) < num_sets:
-            needed = min(num_sets - len(result), len(combinations))
-            result.extend(random.sample(combinations, needed))
-        return result
-    except:
+        # Sample positions rather than rows so pools that are generated on
+        # demand are never materialized. Without replacement there are at
+        # most as many sets as combinations; with it, sets may repeat.
+        return [combinations[i] for i in draw_ranks(len(combinations), num_sets, seed, replace)]
+    except (TypeError, ValueError):
         return []
 
 @app.route('/')
@@ -151,6 +184,30 @@ def home():
                 margin: 5px 0;
                 border-radius: 4px;
             }
+            .combo-list {
+                position: relative;
+                overflow-y: auto;
+            }
+            .combo-rows {
+                position: absolute;
+                top: 0;
+                left: 0;
+                right: 0;
+            }
+            .combo-rows .combo {
+                position: absolute;
+                left: 0;
+                right: 0;
+                height: 46px;
+                margin: 0;
+                box-sizing: border-box;
+                overflow: hidden;
+                white-space: nowrap;
+            }
+            .find {
+                margin-bottom: 8px;
+                font-size: 0.9em;
+            }
             .stats {
                 color: #666;
                 font-size: 0.9em;
@@ -330,12 +387,205 @@ def home():
             </div>
         </div>
 
+        <script type="text/js-worker" id="results-worker">
+            // Holds result rows as typed arrays, one page per /results
+            // request, and answers the main thread's requests for the rows
+            // it has to draw, with their stats.
+            const PAGE_ROWS = 10000;
+            const MAX_PAGES = 256;
+            // Local filters fetch every row; above this, use the server filters
+            const LOCAL_FILTER_MAX = 2000000;
+            const HEADER_BYTES = 14;
+            const lists = {};
+
+            self.onmessage = function(event) {
+                const msg = event.data;
+                if (msg.op === 'open') {
+                    lists[msg.list] = {
+                        name: msg.list,
+                        sessionId: msg.sessionId,
+                        total: msg.total,
+                        choose: msg.choose,
+                        totalNumbers: msg.totalNumbers,
+                        origin: msg.origin,
+                        pages: new Map(),
+                        loading: new Map(),
+                        matches: null,
+                        findId: 0
+                    };
+                } else if (msg.op === 'range') {
+                    sendRange(lists[msg.list], msg).catch(error => fail(msg.list, error));
+                } else if (msg.op === 'find') {
+                    find(lists[msg.list], msg.numbers).catch(error => fail(msg.list, error));
+                }
+            };
+
+            function fail(name, error) {
+                self.postMessage({op: 'error', list: name, message: error.message});
+            }
+
+            function fetchPage(list, index) {
+                const url = new URL('/results', list.origin);
+                url.search = new URLSearchParams({sessionId: list.sessionId, offset: index * PAGE_ROWS, limit: PAGE_ROWS});
+                // Binary rows when every number fits a byte, JSON otherwise
+                const accept = list.totalNumbers <= 255 ? 'application/x-lottery-rows, application/json;q=0.5' : 'application/json';
+                return fetch(url, {headers: {Accept: accept}}).then(response => {
+                    if (!response.headers.get('Content-Type').startsWith('application/json')) {
+                        return response.arrayBuffer().then(buffer => new Uint8Array(buffer, HEADER_BYTES));
+                    }
+                    return response.json().then(data => {
+                        if (data.error) {
+                            throw new Error(data.error);
+                        }
+                        return Uint16Array.from(data.combinations.flat());
+                    });
+                });
+            }
+
+            function withStats(list, rows) {
+                const choose = list.choose;
+                const count = rows.length / choose;
+                const half = Math.floor(list.totalNumbers / 2);
+                const sum = new Uint32Array(count);
+                const even = new Uint8Array(count);
+                const low = new Uint8Array(count);
+                for (let i = 0, j = 0; i < count; i++) {
+                    for (let c = 0; c < choose; c++, j++) {
+                        const n = rows[j];
+                        sum[i] += n;
+                        even[i] += (n & 1) === 0;
+                        low[i] += n <= half;
+                    }
+                }
+                return {rows, sum, even, low};
+            }
+
+            function loadPage(list, index) {
+                const page = list.pages.get(index);
+                if (page) {
+                    // Most recently used pages are evicted last
+                    list.pages.delete(index);
+                    list.pages.set(index, page);
+                    return Promise.resolve(page);
+                }
+                if (!list.loading.has(index)) {
+                    list.loading.set(index, fetchPage(list, index).then(rows => {
+                        const loaded = withStats(list, rows);
+                        list.loading.delete(index);
+                        list.pages.set(index, loaded);
+                        if (list.pages.size > MAX_PAGES) {
+                            list.pages.delete(list.pages.keys().next().value);
+                        }
+                        return loaded;
+                    }, error => {
+                        list.loading.delete(index);
+                        throw error;
+                    }));
+                }
+                return list.loading.get(index);
+            }
+
+            async function sendRange(list, msg) {
+                const count = Math.max(msg.end - msg.start, 0);
+                const positions = new Float64Array(count);
+                for (let i = 0; i < count; i++) {
+                    positions[i] = list.matches ? list.matches[msg.start + i] : msg.start + i;
+                }
+                const pageIndexes = [...new Set(Array.from(positions, p => Math.floor(p / PAGE_ROWS)))];
+                const pages = new Map();
+                for (const index of pageIndexes) {
+                    pages.set(index, await loadPage(list, index));
+                }
+                const choose = list.choose;
+                const rows = new Uint16Array(count * choose);
+                const sum = new Uint32Array(count);
+                const even = new Uint8Array(count);
+                const low = new Uint8Array(count);
+                for (let i = 0; i < count; i++) {
+                    const page = pages.get(Math.floor(positions[i] / PAGE_ROWS));
+                    const row = positions[i] % PAGE_ROWS;
+                    rows.set(page.rows.subarray(row * choose, (row + 1) * choose), i * choose);
+                    sum[i] = page.sum[row];
+                    even[i] = page.even[row];
+                    low[i] = page.low[row];
+                }
+                self.postMessage({op: 'rows', list: list.name, seq: msg.seq, start: msg.start, count, rows, sum, even, low},
+                                 [rows.buffer, sum.buffer, even.buffer, low.buffer]);
+            }
+
+            async function find(list, numbers) {
+                const findId = ++list.findId;
+                if (!numbers.length) {
+                    list.matches = null;
+                    self.postMessage({op: 'found', list: list.name, count: list.total});
+                    return;
+                }
+                if (list.total > LOCAL_FILTER_MAX) {
+                    throw new Error(`Too many rows to filter here; use the filters above`);
+                }
+                const choose = list.choose;
+                let matches = new Uint32Array(1024);
+                let found = 0;
+                for (let index = 0; index * PAGE_ROWS < list.total; index++) {
+                    const rows = (await loadPage(list, index)).rows;
+                    if (findId !== list.findId) {
+                        return;
+                    }
+                    for (let row = 0; row * choose < rows.length; row++) {
+                        const combo = rows.subarray(row * choose, (row + 1) * choose);
+                        if (numbers.every(n => combo.includes(n))) {
+                            if (found === matches.length) {
+                                const grown = new Uint32Array(matches.length * 2);
+                                grown.set(matches);
+                                matches = grown;
+                            }
+                            matches[found++] = index * PAGE_ROWS + row;
+                        }
+                    }
+                    self.postMessage({op: 'finding', list: list.name, scanned: Math.min((index + 1) * PAGE_ROWS, list.total)});
+                }
+                list.matches = matches.subarray(0, found);
+                self.postMessage({op: 'found', list: list.name, count: found});
+            }
+        </script>
         <script>
-            let currentCombinations = [];
+            let currentSessionId = null;
             let totalNumbers = 11;
+            let chooseCount = 6;
             const filterOrder = ['include', 'exclude', 'sum', 'consecutive', 'even_odd', 'random'];
             let currentFilterIndex = 0;
             
+            // Result lists only draw the rows in view; the rows themselves
+            // live in the worker
+            const ROW_HEIGHT = 52;
+            const LIST_HEIGHT = 300;
+            const OVERSCAN_ROWS = 5;
+            // Browsers cap element heights; taller lists scroll proportionally
+            const MAX_SCROLL_HEIGHT = 8000000;
+            const resultLists = {};
+            let rangeSeq = 0;
+            const resultsWorker = new Worker(URL.createObjectURL(new Blob(
+                [document.getElementById('results-worker').textContent], {type: 'text/javascript'})));
+            
+            resultsWorker.onmessage = function(event) {
+                const msg = event.data;
+                const list = resultLists[msg.list];
+                if (!list) {
+                    return;
+                }
+                if (msg.op === 'rows') {
+                    renderRows(list, msg);
+                } else if (msg.op === 'finding') {
+                    list.findStatus.textContent = `Scanning ${msg.scanned} of ${list.total}...`;
+                } else if (msg.op === 'found') {
+                    list.count = msg.count;
+                    list.findStatus.textContent = msg.count === list.total ? '' : `${msg.count} of ${list.total}`;
+                    layoutList(list);
+                } else if (msg.op === 'error') {
+                    list.findStatus.textContent = 'Error: ' + msg.message;
+                }
+            };
+            
             window.onload = function() {
                 disableAllFilters();
             }
@@ -377,23 +627,22 @@ def home():
                 const total = parseInt(document.getElementById('total').value);
                 const choose = parseInt(document.getElementById('choose').value);
                 totalNumbers = total;
+                chooseCount = choose;
                 
                 createNumberGrid('includeGrid');
                 createNumberGrid('excludeGrid');
                 
-                fetch('/calc', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({total: total, choose: choose})
-                })
+                // GET, so the browser revalidates the page with its ETag
+                const query = new URLSearchParams({total: total, choose: choose, limit: 0});
+                fetch(`/calc?${query}`)
                 .then(response => response.json())
                 .then(data => {
                     if (data.error) {
                         alert(data.error);
                         return;
                     }
-                    currentCombinations = data.combinations;
-                    updateFilterResult('initial', data.total, data.combinations);
+                    currentSessionId = data.sessionId;
+                    showResults('initial', data.sessionId, data.total);
                     enableNextFilter(0);
                 });
             }
@@ -404,9 +653,10 @@ def home():
                 console.log('Selected numbers:', selectedNumbers);
                 
                 const data = {
-                    combinations: currentCombinations,
+                    sessionId: currentSessionId,
                     filterType: 'include',
-                    mustInclude: selectedNumbers
+                    mustInclude: selectedNumbers,
+                    limit: 0
                 };
                 
                 fetch('/filter', {
@@ -422,10 +672,7 @@ def home():
                         updateStatus('include', 'Error: ' + data.error);
                         return;
                     }
-                    currentCombinations = data.combinations;
-                    updateFilterResult('include', data.total, data.combinations);
-                    updateStatus('include', 'Done');
-                    moveToNextFilter('include');
+                    handleFilterResult('include', data, () => moveToNextFilter('include'));
                 })
                 .catch(error => {
                     console.error('Filter request error:', error);
@@ -447,8 +694,9 @@ def home():
                 
                 updateStatus(filterType, 'Running...');
                 let data = {
-                    combinations: currentCombinations,
-                    filterType: filterType
+                    sessionId: currentSessionId,
+                    filterType: filterType,
+                    limit: 0
                 };
 
                 if (filterType === 'exclude') {
@@ -480,12 +728,11 @@ def home():
                         updateStatus(filterType, 'Error: ' + data.error);
                         return;
                     }
-                    currentCombinations = data.combinations;
-                    updateFilterResult(filterType, data.total, data.combinations);
-                    updateStatus(filterType, 'Done');
-                    if (filterType !== 'random') {
-                        moveToNextFilter(filterType);
-                    }
+                    handleFilterResult(filterType, data, () => {
+                        if (filterType !== 'random') {
+                            moveToNextFilter(filterType);
+                        }
+                    });
                 })
                 .catch(error => {
                     console.error('Filter request error:', error);
@@ -504,27 +751,124 @@ def home():
                 statusSpan.textContent = status;
             }
 
-            function updateFilterResult(filterType, total, combinations) {
+            function handleFilterResult(filterType, data, next) {
+                // The server may run a large filter as a background job, or
+                // answer with counts only when the result would be too big
+                if (data.jobId) {
+                    followJob(filterType, data, next);
+                    return;
+                }
+                if (!data.sessionId) {
+                    updateStatus(filterType, `Matching: ${data.total}. ${data.admission ? data.admission.reason : ''}`);
+                    return;
+                }
+                currentSessionId = data.sessionId;
+                showResults(filterType, data.sessionId, data.total);
+                next();
+            }
+
+            function followJob(filterType, data, next) {
+                updateStatus(filterType, 'Running in the background...');
+                const events = new EventSource(`/jobs/${data.jobId}/events`);
+                events.addEventListener('progress', event => {
+                    const progress = JSON.parse(event.data).progress;
+                    if (progress.rowsTotal) {
+                        updateStatus(filterType, `Scanned ${progress.rowsScanned} of ${progress.rowsTotal}...`);
+                    }
+                });
+                events.addEventListener('done', event => {
+                    events.close();
+                    const result = JSON.parse(event.data).result;
+                    handleFilterResult(filterType, result, next);
+                });
+                ['failed', 'cancelled'].forEach(state => events.addEventListener(state, event => {
+                    events.close();
+                    updateStatus(filterType, 'Error: ' + (JSON.parse(event.data).error || state));
+                }));
+            }
+
+            function showResults(filterType, sessionId, total) {
                 const resultDiv = document.getElementById(`${filterType}-result`);
-                let html = `<span class="status">Done</span>`;
-                html += `<p>Matching: ${total}</p>`;
-                html += '<div style="max-height: 300px; overflow-y: auto;">';
-                combinations.forEach(combo => {
-                    const sum = combo.reduce((a, b) => a + b, 0);
-                    const evens = combo.filter(n => n % 2 === 0).length;
-                    const odds = combo.length - evens;
-                    const low = combo.filter(n => n >= 1 && n <= 5).length;
-                    const high = combo.filter(n => n >= 6 && n <= 11).length;
-                    
-                    html += `<div class="combo">
+                resultDiv.innerHTML = `<span class="status">Done</span>
+                    <p>Matching: ${total}</p>
+                    <div class="find">
+                        Only rows with: <input type="text" class="find-input" placeholder="e.g. 7, 12">
+                        <span class="find-status"></span>
+                    </div>
+                    <div class="combo-list"><div class="combo-spacer"></div><div class="combo-rows"></div></div>`;
+                const list = {
+                    name: filterType,
+                    total: total,
+                    count: total,
+                    seq: 0,
+                    frame: null,
+                    view: resultDiv.querySelector('.combo-list'),
+                    spacer: resultDiv.querySelector('.combo-spacer'),
+                    rows: resultDiv.querySelector('.combo-rows'),
+                    findStatus: resultDiv.querySelector('.find-status')
+                };
+                resultLists[filterType] = list;
+                resultsWorker.postMessage({
+                    op: 'open', list: filterType, sessionId: sessionId, total: total,
+                    choose: chooseCount, totalNumbers: totalNumbers, origin: location.origin
+                });
+                list.view.onscroll = () => {
+                    if (!list.frame) {
+                        list.frame = requestAnimationFrame(() => requestRows(list));
+                    }
+                };
+                resultDiv.querySelector('.find-input').onchange = event => {
+                    const numbers = event.target.value.split(/[^0-9]+/).filter(n => n).map(n => parseInt(n));
+                    list.findStatus.textContent = numbers.length ? 'Filtering...' : '';
+                    resultsWorker.postMessage({op: 'find', list: filterType, numbers: numbers});
+                };
+                layoutList(list);
+            }
+
+            function layoutList(list) {
+                const height = list.count * ROW_HEIGHT;
+                list.spacer.style.height = `${Math.min(height, MAX_SCROLL_HEIGHT)}px`;
+                list.view.style.height = `${Math.min(height, LIST_HEIGHT)}px`;
+                list.view.scrollTop = 0;
+                list.rows.innerHTML = '';
+                requestRows(list);
+            }
+
+            function virtualTop(list) {
+                // Scroll position in the full list height, which differs
+                // from scrollTop only for lists taller than the cap
+                const scrollable = list.spacer.offsetHeight - list.view.clientHeight;
+                const virtualScrollable = list.count * ROW_HEIGHT - list.view.clientHeight;
+                return scrollable > 0 ? list.view.scrollTop * virtualScrollable / scrollable : 0;
+            }
+
+            function requestRows(list) {
+                list.frame = null;
+                const first = Math.floor(virtualTop(list) / ROW_HEIGHT);
+                const start = Math.max(first - OVERSCAN_ROWS, 0);
+                const end = Math.min(first + Math.ceil(LIST_HEIGHT / ROW_HEIGHT) + OVERSCAN_ROWS, list.count);
+                list.seq = ++rangeSeq;
+                resultsWorker.postMessage({op: 'range', list: list.name, seq: list.seq, start: start, end: end});
+            }
+
+            function renderRows(list, msg) {
+                if (msg.seq !== list.seq) {
+                    return;
+                }
+                const offset = list.view.scrollTop - virtualTop(list);
+                let html = '';
+                for (let i = 0; i < msg.count; i++) {
+                    const combo = Array.from(msg.rows.subarray(i * chooseCount, (i + 1) * chooseCount));
+                    const evens = msg.even[i];
+                    const low = msg.low[i];
+                    html += `<div class="combo" style="top: ${offset + (msg.start + i) * ROW_HEIGHT}px">
                         ${combo.join(', ')}
                         <div class="stats">
-                            Sum: ${sum} | Even: ${evens}, Odd: ${odds} | Low: ${low}, High: ${high}
+                            Sum: ${msg.sum[i]} | Even: ${evens}, Odd: ${chooseCount - evens} | Low: ${low}, High: ${chooseCount - low}
                         </div>
                     </div>`;
-                });
-                html += '</div>';
-                resultDiv.innerHTML = html;
+                }
+                list.rows.innerHTML = html;
             }
 
             function enableNextFilter(currentIndex) {
@@ -549,10 +893,127 @@ def home():
     </html>
     """
 
-@app.route('/calc', methods=['POST'])
+def read_request():
+    """
+    Request parameters as a dict. A binary combination body is decoded
+    into 'combinations', and the parameters then come from the query
+    string ('filters' as JSON, number lists comma separated).
+    """
+    with g.timer.stage('parse'):
+        if request.method == 'GET':
+            return read_query()
+        if request.mimetype not in BINARY_MIMETYPES:
+            return request.get_json()
+        return read_binary_request()
+
+def read_query():
+    data = request.args.to_dict()
+    for key in ('mustInclude', 'mustExclude'):
+        if key in request.args:
+            data[key] = [x for value in request.args.getlist(key) for x in value.split(',') if x]
+    if 'filters' in data:
+        data['filters'] = json.loads(data['filters'])
+    if data.get('stats') in ('true', '1'):
+        data['stats'] = True
+    return data
+
+def read_binary_request():
+    data = read_query()
+    matrix, _ = decode(request.get_data(), request.mimetype)
+    data['combinations'] = Block(matrix)
+    return data
+
+def response_wire_format():
+    """
+    Binary format preferred by the Accept header, or None for JSON.
+    """
+    best = request.accept_mimetypes.best_match(('application/json',) + BINARY_MIMETYPES)
+    return best if best in BINARY_MIMETYPES else None
+
+def send_page(fields, combos, offset, limit, total_numbers):
+    """
+    Response with one page of a session's combinations, as JSON or in the
+    negotiated binary format.
+    """
+    with g.timer.stage('serialize'):
+        fields.update(page_fields(fields['sessionId'], combos, offset, limit))
+        wire_format = response_wire_format()
+        if wire_format:
+            return binary_response(wire_format, page_matrix(combos, offset, limit), total_numbers, fields)
+        fields['combinations'] = page_matrix(combos, offset, limit)
+        if requested_stats():
+            page = combos[offset:offset + limit] if isinstance(combos, Block) else Block(fields['combinations'])
+            fields['stats'] = combo_stats(page, total_numbers or int(page.matrix.max(initial=0)))
+        return jsonify(fields)
+
+def requested_stats():
+    """
+    True when the request asks for precomputed per-combination stats.
+    """
+    data = request.get_json(silent=True) or request.args
+    return data.get('stats') in (True, 1, 'true', '1')
+
+def send_all(fields, filtered):
+    """
+    Response with every filtered combination, for requests that posted
+    their combinations instead of using a session.
+    """
+    with g.timer.stage('serialize'):
+        wire_format = response_wire_format()
+        if wire_format:
+            return binary_response(wire_format, filtered.matrix, None, fields)
+        fields['combinations'] = filtered.matrix
+        return jsonify(fields)
+
+def requested_stream_format(data):
+    """
+    Streaming format asked for with the 'stream' field or an
+    application/x-ndjson Accept header, or None for a normal response.
+    """
+    stream_format = data.get('stream')
+    if stream_format is None and request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        stream_format = 'ndjson'
+    if stream_format is not None and stream_format not in STREAM_FORMATS:
+        raise ValueError(f"Unknown stream format: {stream_format}")
+    return stream_format
+
+def calc_etag(total, choose, offset, limit):
+    """
+    ETag of an unfiltered /calc page. The response only depends on these
+    parameters and the negotiated representation.
+    """
+    key = [CALC_ETAG_VERSION, total, choose, offset, limit, requested_stats(), response_wire_format()]
+    return hashlib.sha1(json.dumps(key).encode()).hexdigest()
+
+def cached_body(etag):
+    """
+    304 when the client already has the body tagged `etag` in some
+    encoding, else the response from the cache of encoded bodies, else
+    None.
+    """
+    for tag in [etag] + [f'{etag}-{encoding}' for encoding in ENCODINGS]:
+        if tag in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(tag)
+            response.headers['Cache-Control'] = 'no-cache'
+            response.vary.update(('Accept', 'Accept-Encoding'))
+            return response
+    entry = compressed_bodies.get(etag, negotiate(request.accept_encodings))
+    if entry is None:
+        return None
+    body, headers = entry
+    g.from_body_cache = True
+    return Response(body, headers=headers)
+
+@app.route('/calc', methods=['GET', 'POST'])
 def calculate():
+    """
+    The combinations of a pool, one page at a time, optionally through
+    filters. Unfiltered pages asked for with GET carry an ETag, so repeat
+    clients can revalidate and get a 304.
+    """
     try:
-        data = request.get_json()
+        data = read_request()
         total = int(data['total'])
         choose = int(data['choose'])
         
@@ -563,14 +1024,51 @@ def calculate():
                 'combinations': []
             })
         
-        nums = list(range(1, total + 1))
-        all_combos = list(combinations(nums, choose))
-        combos_list = [list(c) for c in all_combos]
+        offset, limit = page_params(data)
+        stages = parse_pipeline(data.get('filters', []), total)
+        if any(stage.filter_type == 'random' for stage in stages):
+            raise ValueError("Random draws are not supported when calculating")
+        stream_format = requested_stream_format(data)
+        etag = None
+        if request.method == 'GET' and not stages and not stream_format:
+            etag = calc_etag(total, choose, offset, limit)
+            response = cached_body(etag)
+            if response is not None:
+                return response
+        lineage = extend_stages(sessions.pool(total, choose), stages)
+        if stages or stream_format:
+            pool = CombinationPool(total, choose)
+            admission = admit_filters(pool, total, choose, [], stages, streaming=bool(stream_format))
+            if admission.action != RUN:
+                fields = {'total': admission.survivors if lineage is not None else None}
+                if lineage is not None:
+                    fields['stages'] = stage_report(stages, count_stages(total, choose, stages))
+                return rerouted(admission, fields, lambda: start_job(sessions.pool(total, choose), stages))
+        with g.timer.stage('filter'):
+            if stages:
+                # Only generate the combinations that pass the filters
+                combos = index_block(generate(total, choose, stages), total)
+                session = sessions.create(combos, total, choose, stages=lineage)
+            else:
+                session = sessions.pool(total, choose)
+                combos = session.combos
+        g.timer.count_rows(0, len(combos))
         
-        return jsonify({
-            'total': len(combos_list),
-            'combinations': combos_list
-        })
+        if stream_format:
+            return stream_response(stream_format, {'sessionId': session.id}, iter_blocks(combos))
+        
+        fields = {
+            'sessionId': session.id,
+            'total': len(combos)
+        }
+        if stages and lineage is not None:
+            fields['stages'] = stage_report(stages, count_stages(total, choose, stages))
+        response = send_page(fields, combos, offset, limit, total)
+        if etag is not None:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            response.vary.update(('Accept', 'Accept-Encoding'))
+        return response
     except Exception as e:
         return jsonify({
             'error': str(e),
@@ -578,79 +1076,248 @@ def calculate():
             'combinations': []
         })
 
+def admit_filters(combos, total, choose, lineage, stages, streaming=False, background=False):
+    """
+    Admission decision for filtering `combos` through `stages`. Survivors
+    are counted through the lineage; without one they are unknown, but
+    then the input is already held and bounds the result. Stages that
+    cannot be counted (filter expressions) are left out, which makes the
+    count an upper bound, and counts too expensive to take are skipped.
+    """
+    rows = len(combos)
+    survivors = None
+    if lineage is not None:
+        constraints = Constraints.from_stages(total, choose, lineage)
+        for stage in stages:
+            if stage.filter_type in COUNTABLE:
+                constraints.add(stage)
+        if affordable(constraints):
+            survivors = count(constraints)
+    # The generator only walks the survivors of selective filters on a pool
+    generated = (isinstance(combos, CombinationPool) and not streaming and not background
+                 and survivors is not None and survivors < SCAN_FRACTION * rows)
+    return admit(rows, survivors if generated else rows, survivors, choose, streaming, background)
+
+def start_job(source, stages, draw=None, optimize=True):
+    return jobs.submit(run_pipeline_job, source, stages, draw, optimize)
+
+def rerouted(admission, fields, job=None):
+    """
+    Response for a request that admission did not let run as asked: an
+    error when rejected, the job when moved to one (started by calling
+    `job`), otherwise the counts in `fields` without combinations.
+    """
+    fields = dict(fields, admission=admission.report(), combinations=[])
+    if admission.action == REJECT:
+        fields.update(error=admission.reason, total=0)
+    elif admission.action == JOB:
+        fields.update(job().snapshot())
+    return jsonify(fields)
+
+def run_filter(combos, filter_type, data):
+    """
+    Runs a single filter step and returns (stages, filtered), with the
+    filtered combinations as a block.
+    """
+    stages = parse_filters(filter_type, data)
+    stage = stages[0]
+    
+    if filter_type == 'include':
+        must_include = stage.args[0]
+        app.logger.debug("Processing include filter with numbers: %s", must_include)
+        app.logger.debug("Initial combinations count: %d", len(combos))
+        
+        filtered = filter_combinations(combos, 'include', must_include)
+        
+        app.logger.debug("Filtered combinations count: %d", len(filtered))
+        if len(filtered):
+            app.logger.debug("First filtered combination: %s", filtered[0])
+            app.logger.debug("Does it contain all numbers? %s", all(num in filtered[0] for num in must_include))
+        
+        return stages, filtered
+        
+    elif filter_type == 'random':
+        filtered = Block(to_matrix(random_combinations(combos, *stage.args)))
+        return stages, filtered
+        
+    elif filter_type == 'expression':
+        filtered, _ = run_pipeline_parallel(combos, plan(stages, combos))
+        return stages, filtered
+        
+    return stages, filter_combinations(combos, filter_type, *stage.args)
+
+def extend_stages(source, stages):
+    """
+    Stage lineage of a session derived from source, or None once it can
+    no longer be counted analytically, or not cheaply.
+    """
+    if source.stages is None or not countable(stages):
+        return None
+    lineage = source.stages + list(stages)
+    if not affordable(Constraints.from_stages(source.total_numbers, source.choose, lineage)):
+        return None
+    return lineage
+
+def known_empty(source, stages):
+    """
+    True when counting proves that no combination of the source survives.
+    """
+    lineage = extend_stages(source, stages)
+    if lineage is None:
+        return False
+    return count(Constraints.from_stages(source.total_numbers, source.choose, lineage)) == 0
+
+# Pools are cached as one matrix only while this many times its size fits
+# in the result cache: building it holds the generated blocks and their
+# concatenation at once, and filter results still need room beside it
+POOL_CACHE_FACTOR = 4
+
+def pool_block(source):
+    """
+    The source's pool as a cached matrix when it is small enough to keep,
+    else memory-mapped from the pool store when there is one, otherwise
+    the pool itself so it is generated block by block.
+    """
+    pool = source.combos
+    if not isinstance(pool, CombinationPool):
+        return pool
+    if not result_cache.fits(POOL_CACHE_FACTOR * len(pool) * (pool.choose + INDEX_ROW_BYTES)):
+        if pool_store is None:
+            return pool
+        return pool_store.open(pool.total_numbers, pool.choose)
+    key = result_key(pool.total_numbers, pool.choose, [])
+    block = result_cache.get(key)
+    if block is None:
+        block = index_block(Block.concat(iter_blocks(pool)), pool.total_numbers)
+        result_cache.put(key, block)
+    return block
+
+def filter_session(source, stages, optimize=True):
+    """
+    Filters a session's combinations through predicate stages and returns
+    (stages in the order they ran, filtered, survivor counts). Sessions
+    with a known lineage reuse cached results for the same or a prefix of
+    the same stages, and skip the scan when counting proves it empty.
+    Rerunning the same filters with new parameters only recomputes the
+    stages that changed and those after them.
+    """
+    lineage = source.stages if extend_stages(source, stages) is not None else None
+    if lineage is not None:
+        total, choose = source.total_numbers, source.choose
+        base = Constraints.from_stages(total, choose, lineage)
+        if known_empty(source, stages):
+            return stages, empty_block(source), count_stages(total, choose, stages, base)
+        key = result_key(total, choose, lineage + stages)
+        cached = result_cache.get(key)
+        if cached is not None:
+            return stages, cached, count_stages(total, choose, stages, base)
+
+    start = pool_block(source) if not lineage else source.combos
+    previous = source.pipeline_run
+    run = previous.rerun(stages, start, optimize) if previous is not None else None
+    if run is None:
+        requested = stages
+        if optimize:
+            stages = plan(stages, source.combos)
+        if lineage is not None:
+            done, prefix = result_cache.longest_prefix(total, choose, lineage, stages)
+            if done:
+                filtered, counts = run_pipeline_parallel(prefix, stages[done:])
+                counts = count_stages(total, choose, stages[:done], base) + counts
+                result_cache.put(key, filtered)
+                return stages, filtered, counts
+        run = PipelineRun.evaluate(start, stages, [requested.index(stage) for stage in stages])
+    sessions.keep_run(source, run)
+
+    filtered = run.result()
+    if lineage is not None:
+        result_cache.put(key, filtered)
+    return run.stages, filtered, run.counts()
+
+def sample_session(source, stages, draw):
+    """
+    Draws uniformly from the source's combinations that pass `stages`
+    without filtering them, by counting through the session lineage.
+    Positions are drawn like random_combinations does, so a seed gives the
+    same sets either way.
+    """
+    lineage = extend_stages(source, stages)
+    constraints = Constraints.from_stages(source.total_numbers, source.choose, lineage)
+    rows = sampler_for(constraints).sample(*draw.args)
+    return Block(to_matrix(rows).reshape(-1, source.choose))
+
+def empty_block(source):
+    return Block(np.empty((0, source.choose or 0), dtype=np.uint8))
+
+def filter_name(filter_type, data, stages):
+    """
+    Display name of a /filter step; expressions may run as several stages.
+    """
+    if filter_type == 'expression':
+        return f"Expression Filter ({data['expression']})"
+    return stages[0].name
+
 @app.route('/filter', methods=['POST'])
 def apply_filter():
     try:
-        data = request.get_json()
-        combos = data['combinations']
+        data = read_request()
         filter_type = data['filterType']
+        session_id = data.get('sessionId')
         
-        if filter_type == 'include':
-            must_include = data.get('mustInclude', [])
-            # Convert string numbers to integers if needed
-            must_include = [int(x) if isinstance(x, str) else x for x in must_include]
-            print(f"Processing include filter with numbers: {must_include}")
-            print(f"Initial combinations count: {len(combos)}")
-            
-            filtered = apply_include_filter(combos, must_include)
-            
-            print(f"Filtered combinations count: {len(filtered)}")
-            if filtered:
-                print(f"First filtered combination: {filtered[0]}")
-                print(f"Does it contain all numbers? {all(num in filtered[0] for num in must_include)}")
-            
-            return jsonify({
-                'filterName': f"Must Include Filter ({', '.join(map(str, must_include))})",
-                'total': len(filtered),
-                'combinations': filtered
-            })
-            
-        elif filter_type == 'exclude':
-            must_exclude = data['mustExclude']
-            filtered = [combo for combo in combos if not any(num in combo for num in must_exclude)]
-            return jsonify({
-                'filterName': f"Must Exclude Filter ({', '.join(map(str, must_exclude))})",
-                'total': len(filtered),
-                'combinations': filtered
-            })
-            
-        elif filter_type == 'sum':
-            min_sum = int(data['minSum'])
-            max_sum = int(data['maxSum'])
-            filtered = [combo for combo in combos if apply_sum_filter(combo, min_sum, max_sum)]
-            return jsonify({
-                'filterName': f"Sum Filter ({min_sum}-{max_sum})",
-                'total': len(filtered),
-                'combinations': filtered
-            })
-            
-        elif filter_type == 'consecutive':
-            max_consecutive = int(data['maxConsecutive'])
-            filtered = [combo for combo in combos if apply_consecutive_filter(combo, max_consecutive)]
-            return jsonify({
-                'filterName': f"Consecutive Filter (max {max_consecutive})",
-                'total': len(filtered),
-                'combinations': filtered
-            })
-            
-        elif filter_type == 'even_odd':
-            min_even = int(data['minEven'])
-            max_even = int(data['maxEven'])
-            filtered = [combo for combo in combos if apply_even_odd_filter(combo, min_even, max_even)]
-            return jsonify({
-                'filterName': f"Even/Odd Filter ({min_even}-{max_even} evens)",
-                'total': len(filtered),
-                'combinations': filtered
-            })
-            
-        elif filter_type == 'random':
-            num_sets = int(data['numSets'])
-            filtered = random_combinations(combos, num_sets)
-            return jsonify({
-                'filterName': f"Random Sets (selected {num_sets})",
-                'total': len(filtered),
-                'combinations': filtered
-            })
+        stream_format = requested_stream_format(data)
+        if stream_format:
+            # Streaming mode: rows are sent as they are filtered and no
+            # result session is kept
+            source = sessions.get(session_id) if session_id else None
+            combos = source.combos if source is not None else data['combinations']
+            stages = parse_filters(filter_type, data, source and source.total_numbers)
+            name = filter_name(filter_type, data, stages)
+            if source is not None and filter_type != 'random':
+                admission = admit_filters(combos, source.total_numbers, source.choose, source.stages,
+                                          stages, streaming=True)
+                if admission.action != RUN:
+                    return rerouted(admission, {'filterName': name})
+            if filter_type == 'random':
+                blocks = [Block(to_matrix(random_combinations(combos, *stages[0].args)))]
+            else:
+                blocks = iter_pipeline(combos, stages, [0] * len(stages))
+            return stream_response(stream_format, {'filterName': name}, blocks)
+        
+        if session_id:
+            # Session mode: the combinations stay on the server and only
+            # the count plus the requested page of results is sent back
+            offset, limit = page_params(data)
+            source = sessions.get(session_id)
+            stages = parse_filters(filter_type, data, source.total_numbers)
+            name = filter_name(filter_type, data, stages)
+            if filter_type != 'random':
+                admission = admit_filters(source.combos, source.total_numbers, source.choose, source.stages, stages)
+                if admission.action != RUN:
+                    return rerouted(admission, {
+                        'filterName': name,
+                        'total': admission.survivors if extend_stages(source, stages) is not None else None
+                    }, lambda: start_job(source, stages, optimize=False))
+            with g.timer.stage('filter'):
+                if filter_type == 'random':
+                    stages, filtered = run_filter(source.combos, filter_type, data)
+                else:
+                    _, filtered, _ = filter_session(source, stages, optimize=filter_type == 'expression')
+            g.timer.count_rows(len(source.combos), len(filtered))
+            session = sessions.create(filtered, source.total_numbers, source.choose,
+                                      extend_stages(source, stages))
+            return send_page({
+                'sessionId': session.id,
+                'filterName': name,
+                'total': len(filtered)
+            }, filtered, offset, limit, source.total_numbers)
+        
+        with g.timer.stage('filter'):
+            stages, filtered = run_filter(data['combinations'], filter_type, data)
+        g.timer.count_rows(len(data['combinations']), len(filtered))
+        return send_all({
+            'filterName': filter_name(filter_type, data, stages),
+            'total': len(filtered)
+        }, filtered)
             
     except Exception as e:
         return jsonify({
@@ -659,5 +1326,380 @@ def apply_filter():
             'combinations': []
         })
 
+def stage_report(stages, counts):
+    return [
+        {'filterType': stage.filter_type, 'filterName': stage.name, 'total': count}
+        for stage, count in zip(stages, counts)
+    ]
+
+@app.route('/pipeline', methods=['POST'])
+def apply_pipeline():
+    """
+    Runs an ordered list of filters in one pass and reports the number of
+    survivors after every stage. Stages run cheapest and most selective
+    first unless 'optimize' is false; 'stages' lists them in the order
+    they ran.
+    """
+    try:
+        data = read_request()
+        session_id = data.get('sessionId')
+        if session_id:
+            source = sessions.get(session_id)
+            combos = source.combos
+        else:
+            source = None
+            combos = data['combinations']
+
+        offset, limit = page_params(data)
+        stages = parse_pipeline(data.get('filters', []), source and source.total_numbers)
+        draw = stages.pop() if stages and stages[-1].filter_type == 'random' else None
+
+        stream_format = requested_stream_format(data)
+        sampled = draw is not None and source is not None and extend_stages(source, stages) is not None
+        if source is not None and not sampled:
+            admission = admit_filters(combos, source.total_numbers, source.choose, source.stages, stages,
+                                      streaming=bool(stream_format and not draw))
+            if admission.action != RUN:
+                # Counts through filter expressions are only upper bounds
+                counted = extend_stages(source, stages) is not None
+                fields = {'total': admission.survivors if counted else None}
+                if counted:
+                    base = Constraints.from_stages(source.total_numbers, source.choose, source.stages)
+                    fields['stages'] = stage_report(stages, count_stages(source.total_numbers, source.choose,
+                                                                         stages, base))
+                return rerouted(admission, fields, lambda: start_job(source, stages, draw, data.get('optimize', True)))
+        if stream_format and not draw:
+            if data.get('optimize', True):
+                stages = plan(stages, combos)
+            counts = [0] * len(stages)
+            return stream_response(
+                stream_format, {}, iter_pipeline(combos, stages, counts),
+                lambda: {'stages': stage_report(stages, counts)}
+            )
+
+        with g.timer.stage('filter'):
+            if sampled:
+                # The draw only needs the count of survivors, not the survivors
+                counts = count_stages(source.total_numbers, source.choose, stages,
+                                      Constraints.from_stages(source.total_numbers, source.choose, source.stages))
+                filtered = sample_session(source, stages, draw)
+            elif source is not None:
+                stages, filtered, counts = filter_session(source, stages, data.get('optimize', True))
+            else:
+                if data.get('optimize', True):
+                    stages = plan(stages, combos)
+                filtered, counts = run_pipeline_parallel(combos, stages)
+            report = stage_report(stages, counts)
+            if draw:
+                if not sampled:
+                    filtered = Block(to_matrix(random_combinations(filtered, *draw.args)))
+                report.append({'filterType': 'random', 'filterName': draw.name, 'total': len(filtered)})
+        g.timer.count_rows(len(combos), len(filtered))
+
+        if source is None:
+            return send_all({
+                'stages': report,
+                'total': len(filtered)
+            }, filtered)
+
+        session = sessions.create(filtered, source.total_numbers, source.choose,
+                                  extend_stages(source, stages + ([draw] if draw else [])))
+        return send_page({
+            'sessionId': session.id,
+            'stages': report,
+            'total': len(filtered)
+        }, filtered, offset, limit, source.total_numbers)
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'total': 0,
+            'combinations': []
+        })
+
+@app.route('/results', methods=['GET', 'POST'])
+def get_results():
+    """
+    One page of a session's combinations, by cursor or by
+    sessionId/offset/limit.
+    """
+    try:
+        data = request.get_json(silent=True) or request.args
+        if data.get('cursor'):
+            session_id, offset, limit = decode_cursor(data['cursor'])
+        else:
+            session_id = data['sessionId']
+            offset, limit = page_params(data)
+        session = sessions.get(session_id)
+        return send_page({
+            'sessionId': session.id,
+            'total': len(session.combos)
+        }, session.combos, offset, limit, session.total_numbers)
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'total': 0,
+            'combinations': []
+        })
+
+def run_pipeline_job(job, source, stages, draw, optimize):
+    """
+    Job body for /jobs: filters a session's combinations a block at a time,
+    publishing the rows scanned and the survivors so far after each block,
+    and keeps the result in a new session.
+    """
+    total, choose = source.total_numbers, source.choose
+    if optimize:
+        stages = plan(stages, source.combos)
+    combos = pool_block(source) if source.stages == [] else source.combos
+    progress = {'rowsTotal': len(combos), 'rowsScanned': 0, 'survivors': 0}
+    if extend_stages(source, stages) is not None:
+        # Known up front by counting; lets clients show a proper progress bar
+        base = Constraints.from_stages(total, choose, source.stages)
+        progress['expected'] = count_stages(total, choose, stages, base)[-1] if stages else count(base)
+    job.update(**progress)
+
+    counts = [0] * len(stages)
+    parts = []
+    if progress.get('expected') != 0:
+        scanned = 0
+        for block in iter_blocks(combos, PROGRESS_ROWS):
+            parts.extend(iter_pipeline(block, stages, counts))
+            scanned += len(block)
+            job.update(rowsScanned=scanned, survivors=counts[-1] if stages else scanned)
+    filtered = Block.concat(parts) if parts else empty_block(source)
+    report = stage_report(stages, counts)
+    if draw:
+        filtered = Block(to_matrix(random_combinations(filtered, *draw.args)))
+        report.append({'filterType': 'random', 'filterName': draw.name, 'total': len(filtered)})
+    session = sessions.create(filtered, total, choose, extend_stages(source, stages + ([draw] if draw else [])))
+    return {'sessionId': session.id, 'stages': report, 'total': len(filtered)}
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Starts a pipeline over a session (or over total/choose) in the
+    background and returns its job ID right away. Takes the same filters
+    as /pipeline.
+    """
+    try:
+        data = read_request()
+        if data.get('sessionId'):
+            source = sessions.get(data['sessionId'])
+        elif 'total' in data:
+            total, choose = int(data['total']), int(data['choose'])
+            if total < choose:
+                raise ValueError('Total numbers must be greater than numbers to choose')
+            source = sessions.pool(total, choose)
+        else:
+            raise ValueError("Jobs run over a session or total/choose, not posted combinations")
+        stages = parse_pipeline(data.get('filters', []), source.total_numbers)
+        draw = stages.pop() if stages and stages[-1].filter_type == 'random' else None
+        admission = admit_filters(source.combos, source.total_numbers, source.choose, source.stages, stages,
+                                  background=True)
+        if admission.action != RUN:
+            return jsonify({'error': admission.reason, 'admission': admission.report()})
+        job = start_job(source, stages, draw, data.get('optimize', True))
+        return jsonify(job.snapshot())
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    try:
+        return jsonify(jobs.get(job_id).snapshot())
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """
+    Asks a job to stop. A running job stops at its next block, so the
+    returned state may still be 'running'.
+    """
+    try:
+        job = jobs.get(job_id)
+        job.cancel()
+        return jsonify(job.snapshot())
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Server-sent events with the job state after every change: 'progress'
+    events while it runs and one final event named after its end state.
+    """
+    try:
+        job = jobs.get(job_id)
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+    def events():
+        version = None
+        while True:
+            current = job.wait(version, timeout=SSE_KEEPALIVE)
+            if current == version and not job.done:
+                yield ': keep-alive\n\n'
+                continue
+            version = current
+            snapshot = job.snapshot()
+            name = snapshot['state'] if job.done else 'progress'
+            yield f'event: {name}\ndata: {json.dumps(snapshot)}\n\n'
+            if job.done:
+                return
+
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/jobs/<job_id>/results', methods=['GET'])
+def job_results(job_id):
+    """
+    One page of a finished job's combinations; same parameters as /results.
+    """
+    try:
+        job = jobs.get(job_id)
+        if job.state != DONE:
+            raise ValueError(f"Job is {job.state}" + (f": {job.error}" if job.error else ""))
+        offset, limit = page_params(request.args)
+        session = sessions.get(job.result['sessionId'])
+        return send_page({
+            'jobId': job.id,
+            'sessionId': session.id,
+            'stages': job.result['stages'],
+            'total': len(session.combos)
+        }, session.combos, offset, limit, session.total_numbers)
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'total': 0,
+            'combinations': []
+        })
+
+@app.before_request
+def start_timer():
+    g.timer = RequestTimer(request.content_length or 0)
+
+@app.after_request
+def record_timing(response):
+    """
+    Adds the Server-Timing header when asked for and records the request
+    in the metrics once the server has finished writing the response.
+    """
+    timer = g.timer
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    if SERVER_TIMING or request.args.get('timing'):
+        response.headers['Server-Timing'] = timer.server_timing()
+    if response.is_streamed:
+        response.response = counting_iter(response.response, timer)
+    else:
+        timer.bytes_out = response.content_length or 0
+    written = timer.elapsed()
+
+    def finish():
+        total = timer.elapsed()
+        timer.add('write', total - written)
+        timer.finish()
+        metrics.record(endpoint, response.status_code, timer, total)
+
+    response.call_on_close(finish)
+    return response
+
+# Registered after record_timing so it runs first, and the metrics count
+# the bytes actually sent
+@app.after_request
+def compress_response(response):
+    """
+    Compresses the body when the client accepts an encoding we offer, and
+    keeps the result when the response has an ETag so the next request
+    for it is served from the cache.
+    """
+    encoding = negotiate(request.accept_encodings)
+    etag, weak = response.get_etag()
+    cacheable = (etag and not weak and response.status_code == 200 and not response.is_streamed
+                 and not g.get('from_body_cache'))
+    if compressible(response):
+        response.vary.add('Accept-Encoding')
+        if encoding:
+            response.set_data(compress(response.get_data(), encoding))
+            response.headers['Content-Encoding'] = encoding
+            if cacheable:
+                # Each encoding of a body is a representation with its own tag
+                response.set_etag(f'{etag}-{encoding}')
+    if cacheable:
+        headers = [(name, value) for name, value in response.headers if name != 'Content-Length']
+        compressed_bodies.put(etag, encoding, response.get_data(), headers)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(dict(result_cache.stats(), compressedBodies=compressed_bodies.stats()))
+
+@app.route('/history', methods=['GET'])
+def draw_history():
+    """
+    Summary of the past draws the 'history' and 'hot_cold' filters use:
+    how often each number came up over the latest 'window' draws, and
+    the 'hotCount' hot and cold numbers the same window gives.
+    """
+    try:
+        history = current_history()
+        window = int(request.args['window']) if request.args.get('window') else None
+        total = int(request.args['total']) if request.args.get('total') else None
+        hot, cold = history.hot_cold(int(request.args.get('hotCount', 10)), window, total)
+        frequencies = history.frequencies(window)
+        return jsonify({
+            'draws': len(history),
+            'drawSize': history.draw_size,
+            'window': window or len(history),
+            'latest': history.draws[-1].tolist(),
+            'frequencies': {number: int(frequencies[number]) for number in range(1, len(frequencies))
+                            if frequencies[number] or total and number <= total},
+            'hot': hot,
+            'cold': cold
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/count', methods=['POST'])
+def count_filters():
+    """
+    Survivor counts for an ordered list of filters, computed without
+    enumerating any combinations. Works from a session created by /calc
+    or /filter (without random draws), or from total/choose directly.
+    """
+    try:
+        data = request.get_json()
+        if data.get('sessionId'):
+            source = sessions.get(data['sessionId'])
+            if source.stages is None:
+                raise ValueError("This session cannot be counted; it contains a random draw or posted combinations")
+            total, choose, base_stages = source.total_numbers, source.choose, source.stages
+        else:
+            total, choose, base_stages = int(data['total']), int(data['choose']), []
+
+        stages = parse_pipeline(data.get('filters', []), total)
+        if not countable(stages):
+            raise ValueError("Only the standard filters can be counted, and expressions made of them")
+        base = Constraints.from_stages(total, choose, base_stages)
+        counts = count_stages(total, choose, stages, base)
+        return jsonify({
+            'stages': stage_report(stages, counts),
+            'total': counts[-1] if counts else count(base)
+        })
+    except CountTooLarge as e:
+        return jsonify({
+            'error': str(e),
+            'total': 0
+        }), 422
+    except Exception as e:
+        return jsonify({
+            'error': str(e),
+            'total': 0
+        })
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
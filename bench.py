@@ -0,0 +1,280 @@
+"""
+Benchmarks for the filter functions, the /calc -> /filter flow and JSON
+encoding. Every case is timed over several runs and written as one JSON
+object per line with its throughput, p50/p99 latency and peak memory. The
+first line describes the run (time, commit, versions), so result files
+from different runs can be compared.
+
+Usage:
+    python bench.py                            # all layers, bench_output.txt
+    python bench.py --layers flow --repeat 10
+    python bench.py --sizes 11:6,30:6 --output -
+    python bench.py --compare old.txt new.txt  # p50 ratios per case
+"""
+import argparse
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import app as server
+from cache import ResultCache
+from combinatorics import CombinationPool
+from jsonprovider import encode_rows
+from metrics import peak_rss_bytes
+from pipeline import parse_filter
+from vectorized import KERNELS, Block, pool_blocks
+
+DEFAULT_SIZES = '11:6,20:6,30:6,40:6,49:6'
+DEFAULT_OUTPUT = 'bench_output.txt'
+LAYERS = ('functions', 'flow', 'json')
+
+# The per-row apply_* functions and JSON payloads work on Python lists,
+# which stop being practical well before the largest pools
+MAX_LIST_ROWS = 1_000_000
+
+
+def filter_params(total, choose):
+    """
+    Request parameters for each filter type that keep a fair share of a
+    total/choose pool.
+    """
+    middle = choose * (total + 1) // 2
+    return {
+        'include': {'mustInclude': [3]},
+        'exclude': {'mustExclude': [5]},
+        'sum': {'minSum': middle - total, 'maxSum': middle + total},
+        'consecutive': {'maxConsecutive': 2},
+        'even_odd': {'minEven': choose // 3, 'maxEven': choose - choose // 3},
+    }
+
+
+def apply_function(filter_type, combos, stage):
+    """
+    Runs one of the original per-row filter functions over a list.
+    """
+    if filter_type == 'include':
+        return server.apply_include_filter(combos, *stage.args)
+    check = {
+        'exclude': server.apply_exclude_filter,
+        'sum': server.apply_sum_filter,
+        'consecutive': server.apply_consecutive_filter,
+        'even_odd': server.apply_even_odd_filter,
+    }[filter_type]
+    return [combo for combo in combos if check(combo, *stage.args)]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def measure(layer, case, rows, run, repeat, setup=None):
+    """
+    Times `run` after one warm-up call and returns the result record.
+    `setup`, if given, runs untimed before every call and its result is
+    passed to `run`. Peak allocations come from one extra traced call so
+    tracing does not skew the timings.
+    """
+    def once(timed):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            result = run(arg) if setup else run()
+        elapsed = time.perf_counter() - start
+        if timed is not None:
+            timed.append(elapsed)
+        return result
+
+    once(None)
+    timings = []
+    for _ in range(repeat):
+        once(timings)
+    tracemalloc.start()
+    once(None)
+    _, peak_alloc = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50 = statistics.median(timings)
+    peak_rss = peak_rss_bytes()
+    return {
+        'layer': layer,
+        'case': case,
+        'rows': rows,
+        'runs': repeat,
+        'p50_ms': round(p50 * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'rows_per_s': round(rows / p50) if p50 > 0 else None,
+        'peak_alloc_bytes': peak_alloc,
+        'peak_rss_kb': peak_rss // 1024 if peak_rss is not None else None,
+    }
+
+
+def bench_functions(sizes, repeat):
+    """
+    The original apply_* functions over Python lists, and the vectorized
+    kernels over the same pools as uint8 matrices.
+    """
+    for total, choose in sizes:
+        pool = CombinationPool(total, choose)
+        rows = len(pool)
+        block = Block(np.concatenate(list(pool_blocks(total, choose))))
+        combos = block.tolist() if rows <= MAX_LIST_ROWS else None
+        for filter_type, params in filter_params(total, choose).items():
+            stage = parse_filter(filter_type, params)
+            name = f"{total}C{choose}/{filter_type}"
+            if combos is not None:
+                yield measure('functions', f"apply/{name}", rows,
+                              lambda: apply_function(filter_type, combos, stage), repeat)
+            # Fresh blocks so cached per-row features are not reused
+            yield measure('functions', f"kernel/{name}", rows,
+                          lambda fresh: KERNELS[filter_type](fresh, *stage.args), repeat,
+                          setup=lambda: Block(block.matrix))
+        del combos, block
+
+
+def bench_flow(sizes, repeat, keep_cache=False):
+    """
+    /calc and then /filter on the new session, through the test client.
+    Small pools are also filtered the original way, by posting the list.
+    """
+    if not keep_cache:
+        server.result_cache = ResultCache(max_bytes=0)
+    client = server.app.test_client()
+
+    def new_session(total, choose):
+        # /calc hands out the shared pool session, which keeps its last run
+        return server.sessions.create(CombinationPool(total, choose), total, choose, stages=[]).id
+
+    for total, choose in sizes:
+        rows = len(CombinationPool(total, choose))
+        name = f"{total}C{choose}"
+        yield measure('flow', f"calc/{name}", rows,
+                      lambda: client.post('/calc', json={'total': total, 'choose': choose}), repeat)
+        combos = CombinationPool(total, choose)[0:rows] if rows <= MAX_LIST_ROWS else None
+        for filter_type, params in filter_params(total, choose).items():
+            body = dict(params, filterType=filter_type)
+            # Every run filters a fresh session so earlier runs are not reused
+            yield measure('flow', f"filter/{name}/{filter_type}", rows,
+                          lambda sid: client.post('/filter', json=dict(body, sessionId=sid)), repeat,
+                          setup=lambda: new_session(total, choose))
+            if combos is not None:
+                yield measure('flow', f"legacy-filter/{name}/{filter_type}", rows,
+                              lambda: client.post('/filter', json=dict(body, combinations=combos)), repeat)
+
+
+def bench_json(sizes, repeat):
+    """
+    Encoding and decoding combination lists on their own, and the matrix
+    fast path of the app's JSON provider against the compact stdlib
+    encoding that jsonify does for the same rows.
+    """
+    for total, choose in sizes:
+        rows = len(CombinationPool(total, choose))
+        if rows > MAX_LIST_ROWS:
+            continue
+        combos = CombinationPool(total, choose)[0:rows]
+        matrix = np.concatenate(list(pool_blocks(total, choose)))
+        text = json.dumps({'combinations': combos})
+        name = f"{total}C{choose}"
+        yield measure('json', f"encode/{name}", rows, lambda: json.dumps({'combinations': combos}), repeat)
+        yield measure('json', f"decode/{name}", rows, lambda: json.loads(text), repeat)
+        compact = json.dumps(combos, separators=(',', ':')).encode()
+        yield measure('json', f"encode-compact/{name}", rows,
+                      lambda: json.dumps(combos, separators=(',', ':')).encode(), repeat)
+        record = measure('json', f"encode-rows/{name}", rows, lambda: encode_rows(matrix), repeat)
+        record['identical'] = encode_rows(matrix) == compact
+        yield record
+
+
+def run_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'run': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+    }
+
+
+def load_results(path):
+    with open(path) as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    return {(r['layer'], r['case']): r for r in lines if 'case' in r}
+
+
+def compare(old_path, new_path):
+    """
+    Prints the p50 of every case found in both files and the new/old
+    ratio; below 1 is faster.
+    """
+    old = load_results(old_path)
+    new = load_results(new_path)
+    print(f"{'case':<48} {'old p50 ms':>12} {'new p50 ms':>12} {'ratio':>7}")
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key]['p50_ms'], new[key]['p50_ms']
+        ratio = after / before if before else float('nan')
+        print(f"{key[0] + ':' + key[1]:<48} {before:>12.3f} {after:>12.3f} {ratio:>7.2f}")
+
+
+def parse_sizes(text):
+    return [tuple(int(x) for x in size.split(':')) for size in text.split(',') if size]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="pools as total:choose, comma separated")
+    parser.add_argument('--layers', default=','.join(LAYERS), help="any of " + ', '.join(LAYERS))
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per case")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="result file, or - for stdout")
+    parser.add_argument('--keep-cache', action='store_true', help="leave the result cache on for /filter")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two result files")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    sizes = parse_sizes(args.sizes)
+    layers = [layer for layer in args.layers.split(',') if layer]
+    for layer in layers:
+        if layer not in LAYERS:
+            parser.error(f"unknown layer: {layer}")
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        out.write(json.dumps(run_info()) + '\n')
+        for layer in layers:
+            if layer == 'functions':
+                records = bench_functions(sizes, args.repeat)
+            elif layer == 'flow':
+                records = bench_flow(sizes, args.repeat, args.keep_cache)
+            else:
+                records = bench_json(sizes, args.repeat)
+            for record in records:
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+                print(f"{record['layer']:<10} {record['case']:<40} p50 {record['p50_ms']:>10.3f} ms",
+                      file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+64-bit bitmask representation of combinations. Number x is stored as bit
+x - 1, so pools of up to 64 numbers fit one uint64 per combination and
+include/exclude checks become a single AND per row.
+"""
+import numpy as np
+
+MAX_NUMBER = 64
+
+# Bits of the even numbers 2, 4, ..., 64
+EVEN_BITS = np.uint64(0xAAAAAAAAAAAAAAAA)
+
+_ONE = np.uint64(1)
+
+
+def fits(matrix):
+    """
+    True when every number in the matrix can be stored as a bit.
+    """
+    if matrix.size == 0:
+        return True
+    return bool(matrix.min() >= 1 and matrix.max() <= MAX_NUMBER)
+
+
+def number_mask(numbers):
+    """
+    Bitmask of the given numbers, ignoring any that cannot be stored.
+    """
+    mask = 0
+    for number in numbers:
+        if 1 <= number <= MAX_NUMBER:
+            mask |= 1 << (number - 1)
+    return np.uint64(mask)
+
+
+def to_masks(matrix):
+    """
+    One uint64 per row with the bits of that row's numbers set.
+    """
+    masks = np.zeros(len(matrix), dtype=np.uint64)
+    for col in range(matrix.shape[1]):
+        masks |= _ONE << (matrix[:, col].astype(np.uint64) - _ONE)
+    return masks
+
+
+def include_mask(masks, must_include):
+    if any(not 1 <= number <= MAX_NUMBER for number in must_include):
+        return np.zeros(len(masks), dtype=bool)
+    included = number_mask(must_include)
+    return masks & included == included
+
+
+def exclude_mask(masks, must_exclude):
+    return masks & number_mask(must_exclude) == 0
+
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(masks):
+        return np.bitwise_count(masks)
+else:
+    def popcount(masks):
+        masks = masks - ((masks >> np.uint64(1)) & np.uint64(0x5555555555555555))
+        masks = (masks & np.uint64(0x3333333333333333)) + ((masks >> np.uint64(2)) & np.uint64(0x3333333333333333))
+        masks = (masks + (masks >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+        return ((masks * np.uint64(0x0101010101010101)) >> np.uint64(56)).astype(np.uint8)
+
+
+def even_counts(masks):
+    return popcount(masks & EVEN_BITS)
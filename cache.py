@@ -0,0 +1,194 @@
+"""
+Size-bounded LRU cache of filtered combination sets, keyed by a canonical
+hash of (total, choose, filter stages).
+
+Filter stages are predicates whose results are always kept in pool order,
+so the order they ran in does not change the rows. Keys therefore use the
+sorted set of stage specs, and any earlier pipeline over a subset of the
+same stages can be reused as a starting point.
+
+Set LOTTERY_CACHE_DIR to share results between gunicorn workers on the
+same host through .npy files. The directory is held to the same byte
+budget as each process, dropping the least recently used files first.
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from vectorized import Block
+
+DEFAULT_MAX_BYTES = int(os.environ.get('LOTTERY_CACHE_MB', 128)) * 1024 * 1024
+
+
+def stage_key(stage):
+    """
+    Canonical, JSON-friendly form of a filter stage.
+    """
+    if stage.filter_type in ('include', 'exclude'):
+        return [stage.filter_type, sorted(set(stage.args[0]))]
+    if stage.filter_type == 'history':
+        history, *bounds = stage.args
+        return [stage.filter_type, history.digest, *bounds]
+    return [stage.filter_type, *stage.args]
+
+
+def result_key(total_numbers, choose, stages):
+    specs = sorted({json.dumps(stage_key(stage)) for stage in stages})
+    raw = json.dumps([total_numbers, choose, specs])
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def block_bytes(block):
+    features = sum(values.nbytes for values in block.features.values() if values is not None)
+    indexes = sum(index.nbytes for index in block.indexes.values())
+    return block.matrix.nbytes + features + indexes
+
+
+class ResultCache:
+    """
+    In-process LRU of Blocks bounded by their total size in bytes, with an
+    optional on-disk layer shared by every worker using the same directory.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, shared_dir=None):
+        self.max_bytes = max_bytes
+        self.shared_dir = shared_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if shared_dir:
+            os.makedirs(shared_dir, exist_ok=True)
+
+    def get(self, key, record=True):
+        """
+        Cached block for key, or None. Lookups with record=False do not
+        count towards the hit/miss metrics.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += record
+                return entry[0]
+        block = self._load_shared(key)
+        with self._lock:
+            if block is None:
+                self.misses += record
+                return None
+            self.shared_hits += record
+        self._insert(key, block)
+        return block
+
+    def put(self, key, block):
+        self._insert(key, block)
+        self._store_shared(key, block)
+
+    def fits(self, nbytes):
+        return nbytes <= self.max_bytes
+
+    def _insert(self, key, block):
+        size = block_bytes(block)
+        if not self.fits(size):
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            # Sizes are recorded on insert since blocks may gain features later
+            self._entries[key] = (block, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def _shared_path(self, key):
+        return os.path.join(self.shared_dir, key + '.npy')
+
+    def _load_shared(self, key):
+        if not self.shared_dir:
+            return None
+        path = self._shared_path(key)
+        try:
+            block = Block(np.load(path))
+            # The modification time doubles as the last use, for trimming
+            os.utime(path)
+            return block
+        except (OSError, ValueError):
+            return None
+
+    def _store_shared(self, key, block):
+        if not self.shared_dir or not self.fits(block.matrix.nbytes):
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.shared_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, block.matrix)
+            os.replace(tmp, self._shared_path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        self._trim_shared()
+
+    def _trim_shared(self):
+        """
+        Removes the least recently used files until the directory fits
+        max_bytes. Other workers may remove the same files concurrently.
+        """
+        files = []
+        with os.scandir(self.shared_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.npy'):
+                    continue
+                try:
+                    info = entry.stat()
+                except OSError:
+                    continue
+                files.append((info.st_mtime, info.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def longest_prefix(self, total_numbers, choose, lineage, stages):
+        """
+        Finds the longest prefix of `stages` whose result, on top of
+        `lineage`, is cached. Returns (prefix length, block), with block
+        None when nothing beyond the lineage itself is cached.
+        """
+        for done in range(len(stages), 0, -1):
+            block = self.get(result_key(total_numbers, choose, lineage + stages[:done]), record=False)
+            if block is not None:
+                with self._lock:
+                    self.hits += 1
+                return done, block
+        with self._lock:
+            self.misses += 1
+        return 0, None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'sharedHits': self.shared_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
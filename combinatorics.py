@@ -0,0 +1,121 @@
+"""
+Combinatorial number system helpers.
+
+A pool of all `choose`-sized combinations of 1..total is treated as the
+implicit index range [0, C(total, choose)). Ranks are computed in colex
+order and mirrored to give the same lexicographic order that
+itertools.combinations produces, so any combination can be generated on
+demand from its index without materializing the pool.
+"""
+from itertools import combinations, islice
+from math import comb
+
+
+def colex_rank(combo):
+    """
+    Colex rank of a combination of numbers starting at 1.
+    """
+    return sum(comb(num - 1, i + 1) for i, num in enumerate(sorted(combo)))
+
+
+def colex_unrank(rank, choose, total):
+    """
+    Inverse of colex_rank: the combination (ascending, numbers starting
+    at 1) with the given colex rank.
+    """
+    if not 0 <= rank < comb(total, choose):
+        raise IndexError(f"Rank {rank} out of range for C({total}, {choose})")
+    combo = [0] * choose
+    upper = total
+    for i in range(choose, 0, -1):
+        # Largest c with C(c, i) <= rank; elements only get smaller
+        c = upper - 1
+        while comb(c, i) > rank:
+            c -= 1
+        rank -= comb(c, i)
+        combo[i - 1] = c + 1
+        upper = c
+    return combo
+
+
+def lex_rank(combo, total):
+    """
+    Position of a combination in itertools.combinations order.
+    """
+    mirrored = [total + 1 - num for num in combo]
+    return comb(total, len(combo)) - 1 - colex_rank(mirrored)
+
+
+def lex_unrank(rank, choose, total):
+    """
+    The combination at position `rank` of itertools.combinations order.
+    """
+    count = comb(total, choose)
+    if not 0 <= rank < count:
+        raise IndexError(f"Rank {rank} out of range for C({total}, {choose})")
+    mirrored = colex_unrank(count - 1 - rank, choose, total)
+    return [total + 1 - num for num in reversed(mirrored)]
+
+
+def next_combination(combo, total):
+    """
+    Advances an ascending combination to its lexicographic successor in
+    place. Returns False once the last combination has been passed.
+    """
+    choose = len(combo)
+    i = choose - 1
+    while i >= 0 and combo[i] == total - choose + i + 1:
+        i -= 1
+    if i < 0:
+        return False
+    combo[i] += 1
+    for j in range(i + 1, choose):
+        combo[j] = combo[j - 1] + 1
+    return True
+
+
+class CombinationPool:
+    """
+    All `choose`-sized combinations of 1..total as an implicit, indexable
+    sequence. Combinations are produced on demand from their rank, so the
+    pool itself only holds its two parameters.
+    """
+
+    def __init__(self, total_numbers, choose):
+        if choose < 0 or total_numbers < 0:
+            raise ValueError("Pool sizes must be non-negative")
+        self.total_numbers = total_numbers
+        self.choose = choose
+        self.size = comb(total_numbers, choose)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for combo in combinations(range(1, self.total_numbers + 1), self.choose):
+            yield list(combo)
+
+    def iter_from(self, start):
+        """
+        Iterates the pool starting at rank `start`.
+        """
+        if start >= self.size:
+            return
+        combo = lex_unrank(start, self.choose, self.total_numbers)
+        while True:
+            yield list(combo)
+            if not next_combination(combo, self.total_numbers):
+                return
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.size)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return list(islice(self.iter_from(start), max(0, stop - start)))
+        if index < 0:
+            index += self.size
+        return lex_unrank(index, self.choose, self.total_numbers)
+
+    def rank(self, combo):
+        return lex_rank(combo, self.total_numbers)
@@ -0,0 +1,105 @@
+"""
+Response compression negotiated through Accept-Encoding. gzip is always
+offered; zstd too when the zstandard package is installed, and is
+preferred when the client accepts both equally.
+
+Responses with an ETag have a representation that only depends on the
+request, so their encoded bodies are kept in a bounded cache keyed by
+ETag and encoding; a repeat request is answered from it without
+generating or compressing anything.
+
+LOTTERY_COMPRESS_CACHE_MB sets the cache size (default 32 MB).
+"""
+from collections import OrderedDict
+import gzip
+import os
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from wire import BINARY_MIMETYPES
+
+# Smaller bodies are not worth the CPU time or the extra header
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain', 'text/html') + BINARY_MIMETYPES
+
+ENCODINGS = ('zstd', 'gzip') if zstandard is not None else ('gzip',)
+
+CACHE_BYTES = int(os.environ.get('LOTTERY_COMPRESS_CACHE_MB', 32)) * 1024 * 1024
+
+
+def negotiate(accept_encodings):
+    """
+    Content coding to use for a request's Accept-Encoding, or None to send
+    the body as it is.
+    """
+    return accept_encodings.best_match(ENCODINGS)
+
+
+def compressible(response):
+    return (response.status_code == 200 and not response.is_streamed
+            and 'Content-Encoding' not in response.headers
+            and response.mimetype in COMPRESSIBLE_MIMETYPES
+            and (response.content_length or 0) >= MIN_COMPRESS_BYTES)
+
+
+def compress(body, encoding):
+    if encoding == 'gzip':
+        # No timestamp, so the same body always compresses to the same bytes
+        return gzip.compress(body, GZIP_LEVEL, mtime=0)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    raise ValueError(f"Unknown content coding: {encoding}")
+
+
+class BodyCache:
+    """
+    Bounded LRU of encoded response bodies and their headers, keyed by
+    (ETag, encoding).
+    """
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, etag, encoding):
+        with self._lock:
+            entry = self._entries.get((etag, encoding))
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end((etag, encoding))
+            return entry
+
+    def put(self, etag, encoding, body, headers):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop((etag, encoding), None)
+            if old is not None:
+                self.bytes -= len(old[0])
+            self._entries[etag, encoding] = (body, headers)
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,3 @@
+"""
+Puts the top-level modules on the import path for the tests in tests/.
+"""
@@ -0,0 +1,180 @@
+"""
+Counts the combinations that survive a set of filters without enumerating
+the pool. Include/exclude alone are a closed-form binomial; sum, even
+count and longest run are counted with a dynamic program over the numbers
+1..total. The program's table grows with the pool and the bounds, so it is
+only run up to LOTTERY_MAX_COUNT_WORK table cell updates (about a second).
+"""
+from math import comb
+import os
+
+import numpy as np
+
+# Filter types the counter understands
+COUNTABLE = ('include', 'exclude', 'sum', 'even_odd', 'consecutive')
+
+MAX_COUNT_WORK = int(os.environ.get('LOTTERY_MAX_COUNT_WORK', 5 * 10 ** 7))
+
+
+class CountTooLarge(ValueError):
+    pass
+
+
+class Constraints:
+    """
+    The combined effect of a list of filter stages on a full pool. Repeated
+    filters of the same type intersect.
+    """
+
+    def __init__(self, total_numbers, choose):
+        self.total_numbers = total_numbers
+        self.choose = choose
+        self.include = set()
+        self.exclude = set()
+        self.min_sum = None
+        self.max_sum = None
+        self.min_even = None
+        self.max_even = None
+        self.max_run = None
+
+    @classmethod
+    def from_stages(cls, total_numbers, choose, stages):
+        constraints = cls(total_numbers, choose)
+        for stage in stages:
+            constraints.add(stage)
+        return constraints
+
+    def copy(self):
+        other = Constraints(self.total_numbers, self.choose)
+        other.__dict__.update(self.__dict__)
+        other.include = set(self.include)
+        other.exclude = set(self.exclude)
+        return other
+
+    def key(self):
+        """
+        Hashable form of the constraints.
+        """
+        return (self.total_numbers, self.choose, tuple(sorted(self.include)), tuple(sorted(self.exclude)),
+                self.min_sum, self.max_sum, self.min_even, self.max_even, self.max_run)
+
+    def add(self, stage):
+        args = stage.args
+        if stage.filter_type == 'include':
+            self.include.update(args[0])
+        elif stage.filter_type == 'exclude':
+            self.exclude.update(args[0])
+        elif stage.filter_type == 'sum':
+            self.min_sum = _tighter(self.min_sum, args[0], max)
+            self.max_sum = _tighter(self.max_sum, args[1], min)
+        elif stage.filter_type == 'even_odd':
+            self.min_even = _tighter(self.min_even, args[0], max)
+            self.max_even = _tighter(self.max_even, args[1], min)
+        elif stage.filter_type == 'consecutive':
+            self.max_run = _tighter(self.max_run, args[0], min)
+        else:
+            raise ValueError(f"Cannot count through a {stage.filter_type} stage")
+
+
+def countable(stages):
+    return all(stage.filter_type in COUNTABLE for stage in stages)
+
+
+def _tighter(current, value, pick):
+    return value if current is None else pick(current, value)
+
+
+def count_work(constraints):
+    """
+    Table cell updates count() needs for the constraints; 0 when they
+    have a closed form.
+    """
+    if constraints.min_sum is None and constraints.min_even is None and constraints.max_run is None:
+        return 0
+    return constraints.total_numbers * int(np.prod(_dimensions(constraints)))
+
+
+def affordable(constraints):
+    return count_work(constraints) <= MAX_COUNT_WORK
+
+
+def _dimensions(constraints):
+    # State: numbers chosen so far, their sum, even count and the length of
+    # the run ending at the previous number. Untracked dimensions have size 1.
+    n = constraints.total_numbers
+    k = constraints.choose
+    highest_sum = k * (2 * n - k + 1) // 2
+    sums = min(max(constraints.max_sum, -1), highest_sum) + 1 if constraints.max_sum is not None else 1
+    evens = min(max(constraints.max_even, -1), k) + 1 if constraints.max_even is not None else 1
+    runs = min(max(constraints.max_run, 0), k) + 1 if constraints.max_run is not None else 1
+    return k + 1, sums, evens, runs
+
+
+def count(constraints):
+    """
+    Number of combinations in the pool that satisfy every constraint.
+    Raises CountTooLarge when that would take more than MAX_COUNT_WORK.
+    """
+    n = constraints.total_numbers
+    k = constraints.choose
+    include = constraints.include
+    exclude = {x for x in constraints.exclude if 1 <= x <= n}
+    if include & exclude or any(not 1 <= x <= n for x in include) or len(include) > k:
+        return 0
+    if constraints.max_run is not None and constraints.max_run < 1:
+        # A combination's longest run is never below 1
+        return 0
+    if constraints.min_sum is None and constraints.min_even is None and constraints.max_run is None:
+        return comb(n - len(include) - len(exclude), k - len(include))
+    if not affordable(constraints):
+        raise CountTooLarge(f"Counting these filters over {n} choose {k} is too expensive")
+    return _count_dp(constraints, include, exclude)
+
+
+def _count_dp(constraints, include, exclude):
+    n = constraints.total_numbers
+    k = constraints.choose
+    track_sum = constraints.max_sum is not None
+    track_even = constraints.max_even is not None
+    track_run = constraints.max_run is not None
+    if track_sum and constraints.max_sum < 0 or track_even and constraints.max_even < 0:
+        return 0
+
+    _, sums, evens, runs = _dimensions(constraints)
+    dtype = np.int64 if comb(n, k) < 2 ** 62 else object
+    dp = np.zeros((k + 1, sums, evens, runs), dtype=dtype)
+    dp[0, 0, 0, 0] = 1
+
+    for x in range(1, n + 1):
+        if x in include:
+            new = np.zeros_like(dp)
+        elif track_run:
+            new = np.zeros_like(dp)
+            new[..., 0] = dp.sum(axis=3)
+        else:
+            new = dp.copy()
+        if x in exclude:
+            dp = new
+            continue
+        dx = x if track_sum else 0
+        de = 1 if track_even and x % 2 == 0 else 0
+        if dx < sums and de < evens:
+            src = dp[:k, :sums - dx, :evens - de, :runs - 1 if track_run else 1]
+            new[1:, dx:, de:, 1 if track_run else 0:] += src
+        dp = new
+
+    low_sum = max(constraints.min_sum, 0) if track_sum else 0
+    low_even = max(constraints.min_even, 0) if track_even else 0
+    return int(dp[k, low_sum:, low_even:, :].sum())
+
+
+def count_stages(total_numbers, choose, stages, base=None):
+    """
+    Survivor count after each stage in order, as the filter UI shows them.
+    """
+    constraints = base.copy() if base is not None else Constraints(total_numbers, choose)
+    counts = []
+    for stage in stages:
+        constraints.add(stage)
+        counts.append(count(constraints))
+    return counts
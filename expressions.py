@@ -0,0 +1,330 @@
+"""
+Filter expressions: a small language for describing a filter in one
+string, such as
+
+    sum in 21..66 and evens in 2..4 and maxrun <= 3 and has(7) and not has(3)
+
+An expression is parsed once into a tree of tuples. Comparisons are on
+per-row features (see FEATURES): `in low..high`, `<`, `<=`, `>`, `>=`,
+`==` and `!=`. `has(a, b, ...)` needs every listed number and
+`any(a, b, ...)` at least one of them. Terms combine with `and`, `or`,
+`not` and parentheses.
+
+lower() turns the top-level terms that the standard filters express
+(sum, even count, longest run, include, exclude) into those stages, so
+they are counted, cached and generated like any other filter. Whatever
+is left becomes a single 'expression' stage, evaluated block by block
+with the vectorized kernels; adding a feature to FEATURES makes it
+available in expressions without touching the endpoints.
+"""
+import re
+
+import numpy as np
+
+from features import feature_column
+from vectorized import KERNELS, consecutive_mask, even_odd_mask, exclude_mask, include_mask, sum_mask
+
+# Feature values fit in 16 bits; open range ends are clamped to this
+MAX_VALUE = 0xFFFF
+
+_TOKEN = re.compile(r'\s*(?:\d+|\.\.|<=|>=|==|!=|<|>|[A-Za-z_]+|[(),])')
+
+
+def _sums(block):
+    return feature_column(block, 'sums')
+
+
+def _evens(block):
+    return feature_column(block, 'evens')
+
+
+def _odds(block):
+    return block.matrix.shape[1] - feature_column(block, 'evens')
+
+
+def _runs(block):
+    return feature_column(block, 'runs')
+
+
+def _smallest(block):
+    if not block.matrix.size:
+        # No rows, or rows with no numbers: nothing to reduce
+        return np.zeros(len(block), dtype=block.matrix.dtype)
+    return block.matrix.min(axis=1)
+
+
+def _largest(block):
+    if not block.matrix.size:
+        return np.zeros(len(block), dtype=block.matrix.dtype)
+    return block.matrix.max(axis=1)
+
+
+# Row feature columns by expression name
+FEATURES = {
+    'sum': _sums,
+    'evens': _evens,
+    'odds': _odds,
+    'maxrun': _runs,
+    'min': _smallest,
+    'max': _largest,
+}
+
+# Standard filter types that are a plain range on a feature
+_RANGE_STAGES = {
+    'sum': 'sum',
+    'evens': 'even_odd',
+}
+
+
+class _Parser:
+    """
+    Recursive descent over the token list; one method per grammar rule.
+    """
+
+    def __init__(self, text):
+        self.tokens = []
+        position = 0
+        text = text.rstrip()
+        while position < len(text):
+            match = _TOKEN.match(text, position)
+            if match is None or not match.group(0).strip():
+                raise ValueError(f"Invalid filter expression at position {position}: {text[position:]!r}")
+            self.tokens.append((match.group(0).strip(), match.end()))
+            position = match.end()
+        self.index = 0
+
+    def peek(self):
+        if self.index < len(self.tokens):
+            return self.tokens[self.index][0].lower()
+        return None
+
+    def take(self, *expected):
+        token = self.peek()
+        if token is None or (expected and token not in expected):
+            wanted = ' or '.join(repr(word) for word in expected) if expected else 'more'
+            where = self.tokens[self.index - 1][1] if self.index else 0
+            raise ValueError(f"Invalid filter expression at position {where}: expected {wanted}")
+        self.index += 1
+        return token
+
+    def number(self):
+        token = self.peek()
+        if token is None or not token.isdigit():
+            where = self.tokens[self.index][1] - len(token) if token else self.tokens[-1][1]
+            raise ValueError(f"Invalid filter expression at position {where}: expected a number")
+        self.index += 1
+        return int(token)
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("Empty filter expression")
+        tree = self.disjunction()
+        if self.peek() is not None:
+            where = self.tokens[self.index - 1][1]
+            raise ValueError(f"Invalid filter expression at position {where}: unexpected {self.peek()!r}")
+        return tree
+
+    def disjunction(self):
+        terms = [self.conjunction()]
+        while self.peek() == 'or':
+            self.take()
+            terms.append(self.conjunction())
+        return _join('or', terms)
+
+    def conjunction(self):
+        terms = [self.negation()]
+        while self.peek() == 'and':
+            self.take()
+            terms.append(self.negation())
+        return _join('and', terms)
+
+    def negation(self):
+        if self.peek() == 'not':
+            self.take()
+            term = self.negation()
+            return term[1] if term[0] == 'not' else ('not', term)
+        return self.term()
+
+    def term(self):
+        token = self.take()
+        if token == '(':
+            tree = self.disjunction()
+            self.take(')')
+            return tree
+        if token in ('has', 'any'):
+            self.take('(')
+            numbers = [self.number()]
+            while self.peek() == ',':
+                self.take()
+                numbers.append(self.number())
+            self.take(')')
+            return (token, *sorted(set(numbers)))
+        if token not in FEATURES:
+            raise ValueError(f"Unknown filter expression feature: {token!r}; "
+                             f"expected one of {', '.join(FEATURES)}, has or any")
+        operator = self.take('in', '<', '<=', '>', '>=', '==', '!=')
+        value = self.number()
+        if operator == 'in':
+            self.take('..')
+            return _range(token, value, self.number())
+        if operator == '!=':
+            return ('not', _range(token, value, value))
+        low, high = {
+            '<': (None, value - 1),
+            '<=': (None, value),
+            '>': (value + 1, None),
+            '>=': (value, None),
+            '==': (value, value),
+        }[operator]
+        return _range(token, low, high)
+
+
+def _range(feature, low, high):
+    if high is not None and high < 0:
+        # Nothing is below zero; an empty range that still reads back
+        low, high = 1, 0
+    low = None if low is None or low <= 0 else min(low, MAX_VALUE)
+    high = None if high is None or high >= MAX_VALUE else high
+    return ('range', feature, low, high)
+
+
+def _join(operator, terms):
+    if len(terms) == 1:
+        return terms[0]
+    flat = []
+    for term in terms:
+        flat.extend(term[1:] if term[0] == operator else [term])
+    return (operator, *flat)
+
+
+def parse_expression(text):
+    """
+    Parses a filter expression into its tree. Raises ValueError with the
+    position of the first error.
+    """
+    return _Parser(str(text)).parse()
+
+
+def format_expression(tree, parent=None):
+    """
+    Canonical text of an expression tree.
+    """
+    kind = tree[0]
+    if kind == 'range':
+        _, feature, low, high = tree
+        if low is None and high is None:
+            return f"{feature} >= 0"
+        if low == high:
+            return f"{feature} == {low}"
+        if low is None:
+            return f"{feature} <= {high}"
+        if high is None:
+            return f"{feature} >= {low}"
+        return f"{feature} in {low}..{high}"
+    if kind in ('has', 'any'):
+        return f"{kind}({', '.join(map(str, tree[1:]))})"
+    if kind == 'not':
+        return f"not {format_expression(tree[1], kind)}"
+    text = f" {kind} ".join(format_expression(term, kind) for term in tree[1:])
+    return f"({text})" if parent is not None else text
+
+
+def _standard(term):
+    """
+    (filter_type, args) of the standard filter that is the same as `term`,
+    or None.
+    """
+    kind = term[0]
+    if kind == 'range':
+        _, feature, low, high = term
+        low = 0 if low is None else low
+        if feature in _RANGE_STAGES:
+            return _RANGE_STAGES[feature], (low, MAX_VALUE if high is None else high)
+        if feature == 'maxrun' and low <= 1 and high is not None:
+            return 'consecutive', (high,)
+        return None
+    if kind == 'has':
+        return 'include', (list(term[1:]),)
+    if kind == 'not' and (term[1][0] == 'any' or (term[1][0] == 'has' and len(term[1]) == 2)):
+        return 'exclude', (list(term[1][1:]),)
+    return None
+
+
+def lower(tree):
+    """
+    Splits an expression into (filter_type, args, name) stage specs:
+    standard filters for the top-level terms that have one, with includes
+    and excludes merged, and one 'expression' stage for the rest.
+    """
+    terms = tree[1:] if tree[0] == 'and' else (tree,)
+    specs = []
+    merged = {}
+    rest = []
+    for term in terms:
+        standard = _standard(term)
+        if standard is None:
+            rest.append(term)
+            continue
+        filter_type, args = standard
+        if filter_type in merged:
+            merged[filter_type].extend(args[0])
+            continue
+        if filter_type in ('include', 'exclude'):
+            merged[filter_type] = args[0]
+        specs.append([filter_type, args, format_expression(term)])
+    for spec in specs:
+        if spec[0] in merged:
+            numbers = sorted(set(merged[spec[0]]))
+            spec[1] = (numbers,)
+            kind = ('has', *numbers) if spec[0] == 'include' else ('not', ('any', *numbers))
+            spec[2] = format_expression(kind)
+    if rest:
+        remainder = rest[0] if len(rest) == 1 else ('and', *rest)
+        specs.append(['expression', (remainder,), format_expression(remainder)])
+    return [tuple(spec) for spec in specs]
+
+
+def _range_mask(block, feature, low, high):
+    low = 0 if low is None else low
+    high = MAX_VALUE if high is None else high
+    # Indexed features go through their kernels, which use the index
+    if feature == 'sum':
+        return sum_mask(block, low, high)
+    if feature == 'evens':
+        return even_odd_mask(block, low, high)
+    if feature == 'maxrun' and low <= 1:
+        return consecutive_mask(block, high)
+    values = FEATURES[feature](block)
+    return (values >= low) & (values <= high)
+
+
+def expression_mask(block, tree):
+    """
+    Rows of a block that satisfy an expression tree. The terms of 'and'
+    and 'or' only look at the rows they can still decide.
+    """
+    kind = tree[0]
+    if kind == 'range':
+        return _range_mask(block, *tree[1:])
+    if kind == 'has':
+        return include_mask(block, list(tree[1:]))
+    if kind == 'any':
+        return ~exclude_mask(block, list(tree[1:]))
+    if kind == 'not':
+        return ~expression_mask(block, tree[1])
+    mask = expression_mask(block, tree[1])
+    for term in tree[2:]:
+        # Rows still undecided: passing so far for 'and', failing for 'or'
+        rows = np.flatnonzero(mask if kind == 'and' else ~mask)
+        if not len(rows):
+            break
+        if len(rows) == len(mask):
+            decided = expression_mask(block, term)
+        else:
+            decided = np.zeros(len(mask), dtype=bool)
+            decided[rows] = expression_mask(block.take(rows), term)
+        mask = mask & decided if kind == 'and' else mask | decided
+    return mask
+
+
+KERNELS['expression'] = expression_mask
@@ -0,0 +1,118 @@
+"""
+Columnar feature index for combination blocks. Indexing a block computes
+its per-row features once (sum, even count, longest run, low count and
+the 64-bit mask) and keeps them in block.features, where the filter
+kernels pick them up instead of recomputing them. Sum, even count and
+longest run also get a bucketed index, so the range filters become range
+lookups.
+
+The low count is the number of numbers up to total_numbers // 2; high
+and odd counts are `choose` minus the low and even counts.
+"""
+import numpy as np
+
+from vectorized import even_counts, longest_runs, row_sums
+
+# Features that get a bucketed index, in addition to their column
+INDEXED = ('sums', 'evens', 'runs')
+
+# Bytes per row an index adds on top of the matrix: the mask, the feature
+# columns and the index orders
+INDEX_ROW_BYTES = 8 + 2 + 3 + 4 * len(INDEXED)
+
+# Range lookups that select more than this share of the rows compare the
+# column instead; scattering that many positions costs more
+SCATTER_FRACTION = 0.125
+
+
+class ColumnIndex:
+    """
+    Row positions grouped by the value of a small non-negative integer
+    column: rows with value v are order[offsets[v]:offsets[v + 1]].
+    """
+
+    def __init__(self, values, order=None, offsets=None):
+        self.values = values
+        if order is None:
+            order = np.argsort(values, kind='stable')
+            order = order.astype(np.int32) if len(values) < 2 ** 31 else order
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(values, minlength=1))])
+        self.order = order
+        self.offsets = offsets
+
+    @property
+    def nbytes(self):
+        return self.order.nbytes + self.offsets.nbytes
+
+    def mask(self, low, high):
+        top = len(self.offsets) - 1
+        start, stop = self.offsets[min(max(low, 0), top)], self.offsets[min(max(high + 1, 0), top)]
+        if stop - start > SCATTER_FRACTION * len(self.values):
+            return (self.values >= low) & (self.values <= high)
+        mask = np.zeros(len(self.values), dtype=bool)
+        if stop > start:
+            mask[self.order[start:stop]] = True
+        return mask
+
+
+def low_counts(matrix, total_numbers):
+    half = total_numbers // 2
+    lows = np.zeros(len(matrix), dtype=np.uint8)
+    for column in matrix.T:
+        lows += column <= half
+    return lows
+
+
+def feature_column(block, name, total_numbers=None):
+    """
+    One feature column of a block, from the index when it has one.
+    """
+    values = block.features.get(name)
+    if values is not None:
+        return values
+    if name == 'sums':
+        return row_sums(block.matrix)
+    if name == 'evens':
+        return even_counts(block.matrix)
+    if name == 'runs':
+        return longest_runs(block.matrix)
+    if name == 'lows':
+        return low_counts(block.matrix, total_numbers)
+    raise ValueError(f"Unknown feature: {name}")
+
+
+def add_features(block, total_numbers):
+    """
+    Computes every feature column of a uint8 block in place.
+    """
+    # Computes and caches the bitmasks when the numbers fit
+    block.masks
+    for name in ('sums', 'evens', 'runs', 'lows'):
+        block.features[name] = feature_column(block, name, total_numbers)
+    # uint8 rows of up to 257 numbers always sum below 2 ** 16
+    if block.matrix.shape[1] <= 257:
+        block.features['sums'] = block.features['sums'].astype(np.uint16)
+
+
+def index_block(block, total_numbers):
+    """
+    Computes every feature of a block and its range indexes in place, and
+    returns the block.
+    """
+    if not len(block) or block.matrix.dtype != np.uint8:
+        return block
+    add_features(block, total_numbers)
+    for name in INDEXED:
+        block.indexes[name] = ColumnIndex(block.features[name])
+    return block
+
+
+def combo_stats(block, total_numbers):
+    """
+    Sum, even and low count of every row, as lists keyed by stat name.
+    """
+    return {
+        'sum': feature_column(block, 'sums').tolist(),
+        'even': feature_column(block, 'evens').tolist(),
+        'low': feature_column(block, 'lows', total_numbers).tolist(),
+    }
@@ -0,0 +1,182 @@
+"""
+Constraint-aware combination generator. Instead of enumerating the whole
+pool and filtering afterwards, combinations are built one column at a time
+and every prefix that can no longer satisfy the filters is dropped:
+
+- excluded numbers are never candidates, and skipping past a must-include
+  number ends the branch;
+- the partial sum plus the smallest / largest possible remainder must
+  still reach the sum bounds;
+- the even count and the current run of consecutive numbers must stay
+  within their limits.
+
+Since each kept prefix still has a valid completion under the sum and
+include bounds, the work follows the size of the output rather than the
+size of the pool. Rows come out in the same order as the pool.
+Stages the walk cannot prune by (filter expressions) are applied to the
+rows it builds.
+"""
+from math import comb
+
+import numpy as np
+
+from counting import COUNTABLE, Constraints, CountTooLarge, count
+from pipeline import iter_pipeline
+from vectorized import BLOCK_ROWS, Block, pool_blocks
+
+_NO_LIMIT = np.iinfo(np.int64).max
+
+# Above this share of survivors the walk builds almost the whole pool, and
+# scanning the pool with the filter kernels is cheaper
+SCAN_FRACTION = 0.25
+
+
+class _Prefixes:
+    """
+    Partial combinations plus the running state needed to prune them.
+    `pos` is each row's last number as an index into the candidate list.
+    """
+
+    def __init__(self, matrix, pos, sums, evens, runs, included):
+        self.matrix = matrix
+        self.pos = pos
+        self.sums = sums
+        self.evens = evens
+        self.runs = runs
+        self.included = included
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def take(self, rows):
+        return _Prefixes(self.matrix[rows], self.pos[rows], self.sums[rows],
+                         self.evens[rows], self.runs[rows], self.included[rows])
+
+
+class _Walk:
+    """Candidate numbers and lookup tables shared by every step of a walk."""
+
+    def __init__(self, constraints):
+        n = constraints.total_numbers
+        self.choose = constraints.choose
+        self.numbers = np.array(
+            [x for x in range(1, n + 1) if x not in constraints.exclude], dtype=np.int64
+        )
+        self.is_even = self.numbers % 2 == 0
+        self.is_included = np.isin(self.numbers, list(constraints.include))
+        # Must-include numbers up to and including each candidate
+        self.included_upto = np.cumsum(self.is_included)
+        self.total_included = len(constraints.include)
+        # Prefix sums give the smallest and largest sums of r candidates
+        self.cumsum = np.concatenate([[0], np.cumsum(self.numbers)])
+        # Even candidates strictly after each position
+        self.evens_after = np.concatenate([np.cumsum(self.is_even[::-1])[::-1][1:], [0]])
+        self.min_sum = constraints.min_sum if constraints.min_sum is not None else -_NO_LIMIT
+        self.max_sum = constraints.max_sum if constraints.max_sum is not None else _NO_LIMIT
+        self.min_even = constraints.min_even if constraints.min_even is not None else 0
+        self.max_even = constraints.max_even if constraints.max_even is not None else _NO_LIMIT
+        self.max_run = constraints.max_run if constraints.max_run is not None else _NO_LIMIT
+
+    def root(self):
+        empty = np.zeros(1, dtype=np.int64)
+        return _Prefixes(np.empty((1, 0), dtype=np.uint8), empty - 1, empty, empty, empty, empty)
+
+    def candidate_counts(self, prefixes):
+        remaining = self.choose - prefixes.matrix.shape[1]
+        return np.maximum(len(self.numbers) - remaining - prefixes.pos, 0)
+
+    def step(self, prefixes):
+        """
+        Extends every prefix by one number and drops the dead branches.
+        """
+        counts = self.candidate_counts(prefixes)
+        rows = int(counts.sum())
+        parents = np.repeat(np.arange(len(prefixes)), counts)
+        offsets = np.arange(rows, dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+        pos = prefixes.pos[parents] + 1 + offsets
+        number = self.numbers[pos]
+        remaining = self.choose - prefixes.matrix.shape[1] - 1
+
+        sums = prefixes.sums[parents] + number
+        lowest = self.cumsum[pos + 1 + remaining] - self.cumsum[pos + 1]
+        highest = self.cumsum[-1] - self.cumsum[len(self.numbers) - remaining]
+        evens = prefixes.evens[parents] + self.is_even[pos]
+        previous = self.numbers[np.maximum(prefixes.pos[parents], 0)]
+        follows = (prefixes.pos[parents] >= 0) & (previous == number - 1)
+        runs = np.where(follows, prefixes.runs[parents] + 1, 1)
+        included = prefixes.included[parents] + self.is_included[pos]
+
+        keep = (
+            (sums + lowest <= self.max_sum)
+            & (sums + highest >= self.min_sum)
+            & (evens <= self.max_even)
+            & (evens + np.minimum(self.evens_after[pos], remaining) >= self.min_even)
+            & (runs <= self.max_run)
+            # No must-include number was skipped, and the rest still fit
+            & (included == self.included_upto[pos])
+            & (self.total_included - included <= remaining)
+        )
+        parents = parents[keep]
+        matrix = np.column_stack([prefixes.matrix[parents], number[keep].astype(np.uint8)])
+        return _Prefixes(matrix, pos[keep], sums[keep], evens[keep], runs[keep], included[keep])
+
+    def walk(self, prefixes, block_rows):
+        """
+        Yields the completed rows below `prefixes`, expanding at most about
+        `block_rows` candidates at a time to bound memory.
+        """
+        if prefixes.matrix.shape[1] == self.choose:
+            yield prefixes.matrix
+            return
+        counts = np.cumsum(self.candidate_counts(prefixes))
+        chunks = np.searchsorted(counts, np.arange(block_rows, counts[-1] if len(counts) else 0, block_rows))
+        for part in np.split(np.arange(len(prefixes)), chunks):
+            if len(part):
+                yield from self.walk(self.step(prefixes.take(part)), block_rows)
+
+
+def generate_blocks(total_numbers, choose, stages, block_rows=BLOCK_ROWS):
+    """
+    Yields the pool combinations that pass every stage, in pool order, as
+    blocks of about `block_rows` rows.
+    """
+    pruned = [stage for stage in stages if stage.filter_type in COUNTABLE]
+    rest = [stage for stage in stages if stage.filter_type not in COUNTABLE]
+    constraints = Constraints.from_stages(total_numbers, choose, pruned)
+    if total_numbers > 255:
+        raise ValueError("Total numbers above 255 are not supported")
+    try:
+        survivors = count(constraints)
+    except CountTooLarge:
+        # Without a count the walk's share is unknown; scanning is bounded
+        survivors = comb(total_numbers, choose)
+    if survivors == 0:
+        return
+    if survivors >= SCAN_FRACTION * comb(total_numbers, choose):
+        counts = [0] * len(stages)
+        for matrix in pool_blocks(total_numbers, choose, block_rows):
+            yield from iter_pipeline(Block(matrix), stages, counts)
+        return
+    walk = _Walk(constraints)
+    counts = [0] * len(rest)
+    pending = []
+    rows = 0
+    for matrix in walk.walk(walk.root(), block_rows):
+        pending.append(matrix)
+        rows += len(matrix)
+        if rows >= block_rows:
+            yield from iter_pipeline(Block(np.concatenate(pending)), rest, counts)
+            pending = []
+            rows = 0
+    if pending:
+        yield from iter_pipeline(Block(np.concatenate(pending)), rest, counts)
+
+
+def generate(total_numbers, choose, stages):
+    """
+    The pool combinations that pass every stage, as one block.
+    """
+    blocks = list(generate_blocks(total_numbers, choose, stages))
+    if not blocks:
+        return Block(np.empty((0, choose), dtype=np.uint8))
+    return Block.concat(blocks)
@@ -0,0 +1,288 @@
+"""
+Past draws: a loader for a local CSV of historical results and the
+filters that compare combinations against it.
+
+- 'history' keeps the combinations whose largest overlap with any past
+  draw is within a range, e.g. at most 4 numbers shared with every draw.
+  Instead of comparing each row with each draw, the k-number subsets of
+  all draws go into a sorted key table (behind a bit table that rejects
+  most misses with one lookup), and a row shares k numbers with some draw
+  exactly when one of its own k-subsets is in the table. The work per row
+  is C(choose, k) lookups however many draws there are. Subsets are keyed
+  by their bitmask when the numbers fit one, else packed a byte a number.
+- 'hot_cold' counts how many of a row's numbers are among the most
+  (hot) and least (cold) frequently drawn over the latest draws.
+
+Set LOTTERY_HISTORY_CSV to the file, one draw per row. The numbers of a
+draw are the integer cells of its row, or the columns named (by header or
+0-based position) in LOTTERY_HISTORY_COLUMNS when the file has other
+integer columns such as draw numbers or bonus balls. Rows are taken as
+oldest first, unless there is a 'date' column with ISO dates to sort by.
+The file is read again when it changes.
+"""
+import csv
+import hashlib
+from itertools import combinations
+from math import comb
+import os
+import threading
+
+import numpy as np
+
+import bitmask
+from vectorized import KERNELS
+
+HISTORY_CSV = os.environ.get('LOTTERY_HISTORY_CSV')
+HISTORY_COLUMNS = os.environ.get('LOTTERY_HISTORY_COLUMNS')
+
+# Packed subset keys hold one number per byte of a uint64
+MAX_KEY_NUMBERS = 8
+# Bits of the table that screens subset keys before the sorted lookup
+SCREEN_BITS = 22
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _integer(cell):
+    cell = cell.strip()
+    return int(cell) if cell.isdigit() else None
+
+
+def read_draws(path, columns=None):
+    """
+    Reads a draw history CSV into a list of sorted number tuples, oldest
+    first. `columns` names the number columns as a comma separated list
+    of headers or 0-based positions.
+    """
+    with open(path, newline='') as f:
+        rows = [row for row in csv.reader(f) if any(cell.strip() for cell in row)]
+    header = None
+    if rows and all(_integer(cell) is None for cell in rows[0]):
+        header = [cell.strip().lower() for cell in rows.pop(0)]
+    positions = None
+    if columns:
+        positions = []
+        for name in columns.split(','):
+            name = name.strip()
+            if name.isdigit():
+                positions.append(int(name))
+            elif header is not None and name.lower() in header:
+                positions.append(header.index(name.lower()))
+            else:
+                raise ValueError(f"Draw history has no column {name!r}")
+    dates = header.index('date') if header is not None and 'date' in header else None
+
+    draws = []
+    for line, row in enumerate(rows, 2 if header is not None else 1):
+        cells = [row[i] for i in positions if i < len(row)] if positions is not None else row
+        numbers = [number for number in map(_integer, cells) if number is not None]
+        if not numbers:
+            continue
+        if len(set(numbers)) != len(numbers) or not all(1 <= number <= 255 for number in numbers):
+            raise ValueError(f"Line {line} of the draw history is not a valid draw: {numbers}")
+        if draws and len(numbers) != len(draws[0][1]):
+            raise ValueError(f"Line {line} of the draw history has {len(numbers)} numbers, "
+                             f"expected {len(draws[0][1])}")
+        date = row[dates].strip() if dates is not None and dates < len(row) else ''
+        draws.append((date, tuple(sorted(numbers))))
+    if dates is not None:
+        # ISO dates sort as strings; the sort is stable for equal dates
+        draws.sort(key=lambda draw: draw[0])
+    return [numbers for _, numbers in draws]
+
+
+class DrawHistory:
+    """
+    Past draws as a uint8 matrix, oldest first, with the subset key tables
+    built on first use. Identified by a digest of the draws, which is also
+    how filter stages that use it are cached.
+    """
+
+    def __init__(self, draws):
+        self.draws = np.array(draws, dtype=np.uint8).reshape(len(draws), -1)
+        self.digest = hashlib.sha1(self.draws.tobytes() + bytes([self.draws.shape[1]])).hexdigest()
+        self._tables = {}
+
+    def __len__(self):
+        return len(self.draws)
+
+    @property
+    def draw_size(self):
+        return self.draws.shape[1]
+
+    def __getstate__(self):
+        # Worker processes rebuild the tables they need
+        return {'draws': self.draws, 'digest': self.digest, '_tables': {}}
+
+    def frequencies(self, window=None):
+        """
+        How often each number 0..255 was drawn over the latest `window`
+        draws (all of them when None).
+        """
+        draws = self.draws[-window:] if window else self.draws
+        return np.bincount(draws.ravel(), minlength=256)
+
+    def hot_cold(self, count, window=None, total_numbers=None):
+        """
+        The `count` most and least frequently drawn numbers over the latest
+        `window` draws, out of 1..total_numbers (by default up to the
+        highest number drawn). Ties go to the lower number.
+        """
+        frequencies = self.frequencies(window)
+        total_numbers = total_numbers or int(self.draws.max(initial=0))
+        numbers = np.arange(1, total_numbers + 1)
+        by_frequency = numbers[np.argsort(-frequencies[numbers], kind='stable')]
+        coldest = numbers[np.argsort(frequencies[numbers], kind='stable')]
+        return sorted(by_frequency[:count].tolist()), sorted(coldest[:count].tolist())
+
+    def _table(self, k, masked):
+        """
+        (screen, keys): the sorted keys of the k-subsets of every draw and a
+        bit table of their hashes.
+        """
+        table = self._tables.get((k, masked))
+        if table is None:
+            masks = bitmask.to_masks(self.draws) if masked else None
+            keys = np.unique(np.concatenate(list(_subset_keys(self.draws, masks, k))))
+            screen = np.zeros(1 << SCREEN_BITS, dtype=bool)
+            screen[_screen_slots(keys)] = True
+            table = self._tables[k, masked] = (screen, keys)
+        return table
+
+    def _masks(self, block):
+        # Bitmask keys only work when the draws fit in 64 bits as well
+        if self.draws.max(initial=0) > bitmask.MAX_NUMBER:
+            return None
+        return block.masks
+
+    def overlap_at_least(self, block, k):
+        """
+        True for the rows of a block that share at least k numbers with
+        some draw.
+        """
+        rows, choose = block.matrix.shape
+        if k <= 0:
+            return np.ones(rows, dtype=bool)
+        if k > min(choose, self.draw_size) or not len(self.draws) or not rows:
+            return np.zeros(rows, dtype=bool)
+        masks = self._masks(block)
+        if k > MAX_KEY_NUMBERS and masks is None or comb(choose, k) > len(self.draws):
+            return self._overlap_by_draw(block, masks, k)
+        matrix = block.matrix if masks is not None else _sorted_rows(block.matrix)
+        screen, keys = self._table(k, masks is not None)
+        hit = np.zeros(rows, dtype=bool)
+        for row_keys in _subset_keys(matrix, masks, k):
+            # Only the rows that pass the screen need the exact lookup
+            maybe = np.flatnonzero(screen[_screen_slots(row_keys)] & ~hit)
+            if len(maybe):
+                found = row_keys[maybe]
+                at = np.minimum(np.searchsorted(keys, found), len(keys) - 1)
+                hit[maybe[keys[at] == found]] = True
+        return hit
+
+    def _overlap_by_draw(self, block, masks, k):
+        # Fewer draws than row subsets: compare every row with every draw
+        hit = np.zeros(len(block), dtype=bool)
+        for draw in self.draws.tolist():
+            if masks is not None:
+                hit |= bitmask.popcount(masks & bitmask.number_mask(draw)) >= k
+            else:
+                hit |= count_in(block.matrix, draw) >= k
+        return hit
+
+    def overlap_mask(self, block, min_overlap, max_overlap):
+        """
+        Rows whose largest overlap with any draw is within the range.
+        """
+        mask = self.overlap_at_least(block, min_overlap)
+        rows = np.flatnonzero(mask)
+        if len(rows) == len(mask):
+            return ~self.overlap_at_least(block, max_overlap + 1)
+        if len(rows):
+            mask[rows] = ~self.overlap_at_least(block.take(rows), max_overlap + 1)
+        return mask
+
+
+def _sorted_rows(matrix):
+    if matrix.shape[1] > 1 and not (matrix[:, 1:] > matrix[:, :-1]).all():
+        matrix = np.sort(matrix, axis=1)
+    if matrix.dtype != np.uint8:
+        # Numbers past 255 are never drawn; 0 never matches a draw either
+        matrix = np.where(matrix > 255, 0, matrix).astype(np.uint8)
+    return matrix
+
+
+def _subset_keys(matrix, masks, k):
+    """
+    Yields a key per row for each k-subset of the columns: the subset's
+    bitmask when there are row masks, else its numbers packed a byte each
+    (rows must be sorted).
+    """
+    choose = matrix.shape[1]
+    if masks is None:
+        for columns in combinations(range(choose), k):
+            keys = np.zeros(len(matrix), dtype=np.uint64)
+            for shift, column in enumerate(columns):
+                keys |= matrix[:, column].astype(np.uint64) << np.uint64(8 * shift)
+            yield keys
+        return
+    bits = [bitmask.to_masks(matrix[:, column:column + 1]) for column in range(choose)]
+    if 2 * k <= choose:
+        for columns in combinations(range(choose), k):
+            yield np.bitwise_or.reduce([bits[column] for column in columns])
+        return
+    # Closer to the whole row: drop the other columns' bits from its mask
+    for dropped in combinations(range(choose), choose - k):
+        keys = masks
+        for column in dropped:
+            keys = keys ^ bits[column]
+        yield keys
+
+
+def _screen_slots(keys):
+    return (keys * _GOLDEN) >> np.uint64(64 - SCREEN_BITS)
+
+
+def count_in(matrix, numbers):
+    """
+    How many of each row's numbers are in `numbers`.
+    """
+    table = np.zeros(max(int(matrix.max(initial=0)), max(numbers, default=0)) + 1, dtype=np.uint8)
+    table[list(numbers)] = 1
+    return table[matrix].sum(axis=1, dtype=np.uint8)
+
+
+def history_mask(block, history, min_overlap, max_overlap):
+    return history.overlap_mask(block, min_overlap, max_overlap)
+
+
+def hot_cold_mask(block, hot, cold, min_hot, max_hot, min_cold, max_cold):
+    hot_counts = count_in(block.matrix, hot)
+    mask = (hot_counts >= min_hot) & (hot_counts <= max_hot)
+    cold_counts = count_in(block.matrix, cold)
+    return mask & (cold_counts >= min_cold) & (cold_counts <= max_cold)
+
+
+KERNELS['history'] = history_mask
+KERNELS['hot_cold'] = hot_cold_mask
+
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def current_history(path=HISTORY_CSV, columns=HISTORY_COLUMNS):
+    """
+    The draw history from the configured CSV, read again when the file
+    changes.
+    """
+    if not path:
+        raise ValueError("No draw history is configured; set LOTTERY_HISTORY_CSV")
+    modified = os.stat(path).st_mtime_ns
+    with _lock:
+        loaded = _loaded.get(path)
+        if loaded is None or loaded[0] != modified:
+            draws = read_draws(path, columns)
+            if not draws:
+                raise ValueError(f"The draw history in {path} has no draws")
+            loaded = _loaded[path] = (modified, DrawHistory(draws))
+        return loaded[1]
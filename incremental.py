@@ -0,0 +1,132 @@
+"""
+Incremental re-evaluation of a filter pipeline. A run keeps the rows that
+survived its first stage plus, for every stage, a survivor mask over those
+rows, so stage outputs form a chain that can be partly reused:
+
+- stages before the first changed one are kept as they are;
+- a single stage whose new parameters only tighten it narrows every
+  later mask in place, without re-running the stages after it;
+- any other change recomputes from the changed stage onwards, starting
+  from the previous stage's survivors rather than the full input.
+"""
+import numpy as np
+
+from cache import block_bytes, stage_key
+from combinatorics import CombinationPool
+from generator import generate
+from parallel import run_pipeline_parallel
+from vectorized import Block, iter_blocks
+
+
+def tightens(old, new):
+    """
+    True when every row that passes `new` also passes `old`.
+    """
+    if old.filter_type != new.filter_type:
+        return False
+    if new.filter_type in ('include', 'exclude'):
+        return set(new.args[0]) >= set(old.args[0])
+    if new.filter_type in ('sum', 'even_odd'):
+        return new.args[0] >= old.args[0] and new.args[1] <= old.args[1]
+    if new.filter_type == 'consecutive':
+        return new.args[0] <= old.args[0]
+    if new.filter_type == 'history':
+        return (new.args[0].digest == old.args[0].digest
+                and new.args[1] >= old.args[1] and new.args[2] <= old.args[2])
+    if new.filter_type == 'hot_cold':
+        return (new.args[:2] == old.args[:2] and new.args[2] >= old.args[2] and new.args[3] <= old.args[3]
+                and new.args[4] >= old.args[4] and new.args[5] <= old.args[5])
+    return False
+
+
+def _narrow(base, mask, stage):
+    """
+    Survivor mask over base after applying stage to the rows in mask.
+    """
+    rows = np.flatnonzero(mask)
+    narrowed = np.zeros_like(mask)
+    if len(rows):
+        narrowed[rows[stage.mask(base.take(rows))]] = True
+    return narrowed
+
+
+class PipelineRun:
+    """
+    The outputs of every stage of one pipeline run over a combination set.
+    `order` maps each run position back to the stage's position in the
+    request, so a request can be matched against the run after planning
+    reordered it.
+    """
+
+    def __init__(self, stages, order, base, masks):
+        self.stages = stages
+        self.order = order
+        # Rows surviving the first stage, or the whole input without stages
+        self.base = base
+        # masks[i] marks the rows of base that survive stages 0..i
+        self.masks = masks
+
+    @classmethod
+    def evaluate(cls, combos, stages, order=None):
+        if order is None:
+            order = list(range(len(stages)))
+        if not stages:
+            return cls([], [], Block.concat(iter_blocks(combos)), [])
+        if isinstance(combos, CombinationPool):
+            base = generate(combos.total_numbers, combos.choose, stages[:1])
+        else:
+            base, _ = run_pipeline_parallel(combos, stages[:1])
+        masks = [np.ones(len(base), dtype=bool)]
+        for stage in stages[1:]:
+            masks.append(_narrow(base, masks[-1], stage))
+        return cls(list(stages), order, base, masks)
+
+    def result(self):
+        if not self.masks:
+            return self.base
+        return self.base.take(self.masks[-1])
+
+    def counts(self):
+        return [int(np.count_nonzero(mask)) for mask in self.masks]
+
+    @property
+    def nbytes(self):
+        return block_bytes(self.base) + sum(mask.nbytes for mask in self.masks)
+
+    def rerun(self, stages, combos, optimize=True):
+        """
+        New run for the same filters with changed parameters, given in
+        request order and evaluated over the same combos. Returns None when
+        the request does not line up with this run (different filter types
+        or number of stages), or asks for request order (optimize false)
+        and this run was reordered.
+        """
+        if len(stages) != len(self.stages):
+            return None
+        if not optimize and self.order != list(range(len(stages))):
+            return None
+        stages = [stages[i] for i in self.order]
+        if any(old.filter_type != new.filter_type for old, new in zip(self.stages, stages)):
+            return None
+        changed = [
+            i for i, (old, new) in enumerate(zip(self.stages, stages))
+            if stage_key(old) != stage_key(new)
+        ]
+        if not changed:
+            return PipelineRun(stages, self.order, self.base, self.masks)
+
+        first = changed[0]
+        stage = stages[first]
+        if len(changed) == 1 and tightens(self.stages[first], stage):
+            if first == 0:
+                keep = stage.mask(self.base)
+                return PipelineRun(stages, self.order, self.base.take(keep), [mask[keep] for mask in self.masks])
+            masks = self.masks[:first] + [_narrow(self.base, mask, stage) for mask in self.masks[first:]]
+            return PipelineRun(stages, self.order, self.base, masks)
+
+        if first == 0:
+            return PipelineRun.evaluate(combos, stages, self.order)
+        masks = self.masks[:first]
+        for stage in stages[first:]:
+            masks.append(_narrow(self.base, masks[-1], stage))
+        return PipelineRun(stages, self.order, self.base, masks)
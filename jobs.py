@@ -0,0 +1,167 @@
+"""
+Background jobs for long filter pipelines. A job runs on a bounded thread
+pool instead of the request that submitted it; the job body publishes
+progress as it goes and checks for cancellation between blocks. Clients
+poll the job's state or wait for changes (the /jobs/<id>/events stream)
+and fetch the result once it is done.
+
+Jobs live in the process that accepted them, like sessions.
+LOTTERY_JOB_WORKERS sets how many run at once and LOTTERY_JOB_QUEUE how
+many more may wait for a worker.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+import uuid
+
+JOB_WORKERS = int(os.environ.get('LOTTERY_JOB_WORKERS', 2))
+JOB_QUEUE = int(os.environ.get('LOTTERY_JOB_QUEUE', 16))
+MAX_JOBS = 64
+
+# Rows a job filters between progress updates and cancellation checks
+PROGRESS_ROWS = 1 << 18
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """
+    State and progress of one job. Every change bumps `version` and wakes
+    up the threads waiting for one.
+    """
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.state = QUEUED
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.version = 0
+        self.future = None
+        self._cancel = threading.Event()
+        self._changed = threading.Condition()
+
+    @property
+    def done(self):
+        return self.state in FINISHED
+
+    def _set(self, **fields):
+        with self._changed:
+            self.__dict__.update(fields)
+            self.version += 1
+            self._changed.notify_all()
+
+    def update(self, **progress):
+        """
+        Publishes progress fields, raising JobCancelled once the job has
+        been cancelled so the job body stops there.
+        """
+        self.check_cancelled()
+        with self._changed:
+            self.progress.update(progress)
+            self.version += 1
+            self._changed.notify_all()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def cancel(self):
+        self._cancel.set()
+        if self.future is not None and self.future.cancel():
+            # Never started
+            self._set(state=CANCELLED, finished=time.time())
+
+    def wait(self, version, timeout=None):
+        """
+        Waits until the job changes past `version` or is finished, and
+        returns the current version.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version or self.done, timeout)
+            return self.version
+
+    def snapshot(self):
+        with self._changed:
+            fields = {
+                'jobId': self.id,
+                'state': self.state,
+                'progress': dict(self.progress),
+                'elapsed': round((self.finished or time.time()) - (self.started or self.created), 3),
+            }
+            if self.result is not None:
+                fields['result'] = self.result
+            if self.error is not None:
+                fields['error'] = self.error
+            return fields
+
+
+class JobStore:
+    """
+    Runs jobs on a bounded thread pool and keeps the most recent ones.
+    Submitting fails while max_workers jobs run and max_queued wait.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, max_queued=JOB_QUEUE, max_jobs=MAX_JOBS):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, body, *args):
+        """
+        Starts `body(job, *args)` in the background and returns the job.
+        The body's return value becomes the job result.
+        """
+        job = Job(uuid.uuid4().hex)
+        with self._lock:
+            pending = sum(1 for other in self._jobs.values() if not other.done)
+            if pending >= self.max_workers + self.max_queued:
+                raise RuntimeError("Too many jobs are queued; try again later")
+            self._jobs[job.id] = job
+            self._evict()
+            job.future = self._executor.submit(self._run, job, body, args)
+        return job
+
+    def _evict(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(len(self._jobs) - self.max_jobs, 0)]:
+            del self._jobs[job_id]
+
+    def _run(self, job, body, args):
+        job._set(state=RUNNING, started=time.time())
+        try:
+            job.check_cancelled()
+            result = body(job, *args)
+        except JobCancelled:
+            job._set(state=CANCELLED, finished=time.time())
+        except Exception as e:
+            job._set(state=FAILED, error=str(e), finished=time.time())
+        else:
+            job._set(state=DONE, result=result, finished=time.time())
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise LookupError(f"Unknown or expired job: {job_id}")
+        return job
+
+    def __len__(self):
+        return len(self._jobs)
@@ -0,0 +1,104 @@
+"""
+JSON provider with a fast path for combination matrices. Endpoints put
+numpy matrices in their response fields instead of lists of lists; the
+provider writes those rows straight from the matrix into the output
+bytes, without creating a Python list or int per number. The bytes are
+identical to what the default provider sends for the same rows as lists.
+
+The fast path covers compact output (the default outside debug mode) for
+non-negative integer matrices in the top level of a response object.
+Anything else is converted to lists and encoded the usual way.
+"""
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
+
+# Code points of the characters a row is written with
+_OPEN, _CLOSE, _COMMA, _ZERO = (ord(c) for c in '[],0')
+
+
+def encodable(value):
+    """
+    True for matrices the fast path can write.
+    """
+    return (isinstance(value, np.ndarray) and value.ndim == 2 and value.shape[1] > 0
+            and value.dtype.kind in 'iu' and (value.dtype.kind == 'u' or not len(value) or value.min() >= 0))
+
+
+def encode_rows(matrix):
+    """
+    JSON text of a non-negative integer matrix as a list of rows; the same
+    bytes as json.dumps(matrix.tolist(), separators=(',', ':')).
+    """
+    rows, width = matrix.shape
+    if not rows:
+        return b'[]'
+    top = int(matrix.max())
+    places = len(str(top))
+    digits = np.ones(matrix.shape, dtype=np.uint8)
+    for place in range(1, places):
+        digits += matrix >= 10 ** place
+
+    # Each number is followed by ',' or, at the end of a row, by ']' and
+    # the ',' before the next row. Rows start with '['. The output starts
+    # after `places` bytes of scratch space, see below.
+    # A number takes at most places + 2 bytes with its punctuation, so
+    # int32 positions do while the output stays below 2 GiB
+    position = np.int32 if matrix.size * (places + 2) < 2 ** 31 else np.int64
+    lengths = digits.astype(position) + 1
+    lengths[:, 0] += 1
+    lengths[:-1, -1] += 1
+    separators = np.cumsum(lengths.ravel(), dtype=position).reshape(matrix.shape)
+    separators += places
+    separators[:-1, -1] -= 1
+    out = np.empty(int(separators[-1, -1]) + 2, dtype=np.uint8)
+
+    # Every place is written for every number, highest first. The places a
+    # number does not have land on earlier bytes, which are either lower
+    # places written after them or punctuation written last.
+    for place in reversed(range(places)):
+        out[separators - 1 - place] = matrix // 10 ** place % 10 + _ZERO
+    out[separators[:, :-1]] = _COMMA
+    out[separators[:, -1]] = _CLOSE
+    out[separators[:-1, -1] + 1] = _COMMA
+    out[separators[:, 0] - digits[:, 0] - 1] = _OPEN
+    out[places] = _OPEN
+    out[-1] = _CLOSE
+    return out[places:].tobytes()
+
+
+class CombinationJSONProvider(DefaultJSONProvider):
+    """
+    Default provider plus the matrix fast path for response objects.
+    """
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        return DefaultJSONProvider.default(o)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        compact = not ((self.compact is None and self._app.debug) or self.compact is False)
+        if not compact or not isinstance(obj, dict) or not any(encodable(value) for value in obj.values()):
+            return super().response(*args, **kwargs)
+
+        # Encode everything else with placeholders in the matrices' places,
+        # then splice the rows in
+        matrices = {}
+        fields = {}
+        for key, value in obj.items():
+            if encodable(value):
+                placeholder = f'\0matrix-{len(matrices)}\0'
+                matrices[self.dumps(placeholder)] = value
+                value = placeholder
+            fields[key] = value
+        text = f"{self.dumps(fields, separators=(',', ':'))}\n"
+        parts = []
+        for placeholder in sorted(matrices, key=text.index):
+            matrix = matrices[placeholder]
+            head, text = text.split(placeholder, 1)
+            parts.append(head.encode())
+            parts.append(encode_rows(matrix))
+        parts.append(text.encode())
+        return self._app.response_class(b''.join(parts), mimetype=self.mimetype)
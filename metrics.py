@@ -0,0 +1,199 @@
+"""
+Per-request instrumentation. Each request gets a RequestTimer that the
+endpoints use to time their stages (parse, filter, serialize) and to note
+how many rows went in and out; the time spent writing the response is
+added once the server closes it. Finished requests are aggregated into a
+Metrics registry that renders the Prometheus text format for /metrics.
+
+Set LOTTERY_TRACE_MEMORY=1 to also record the peak of Python and numpy
+allocations per request through tracemalloc. It slows requests down and
+the peak is shared by requests that overlap in time.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Upper bounds in seconds of the latency histogram buckets
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+TRACE_MEMORY = os.environ.get('LOTTERY_TRACE_MEMORY') == '1'
+
+
+class Histogram:
+    """Cumulative latency histogram in the Prometheus layout."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        for bound, count in zip(self.buckets, self.counts):
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class RequestTimer:
+    """
+    Stage timings and row/byte counts for one request.
+    """
+
+    def __init__(self, bytes_in=0):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.rows_in = 0
+        self.rows_out = 0
+        self.bytes_in = bytes_in
+        self.bytes_out = 0
+        self.peak_memory = None
+        if TRACE_MEMORY:
+            tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count_rows(self, rows_in, rows_out):
+        self.rows_in += rows_in
+        self.rows_out += rows_out
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def finish(self):
+        if TRACE_MEMORY:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+
+    def server_timing(self):
+        """
+        Server-Timing header value with every stage so far plus the total.
+        """
+        parts = [f'{name};dur={seconds * 1000:.3f}' for name, seconds in self.stages.items()]
+        parts.append(f'total;dur={self.elapsed() * 1000:.3f}')
+        return ', '.join(parts)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KiB
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Metrics:
+    """
+    Thread-safe aggregate of finished requests, per endpoint.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = defaultdict(int)
+        self._durations = defaultdict(Histogram)
+        self._stages = defaultdict(Histogram)
+        self._rows_in = defaultdict(int)
+        self._rows_out = defaultdict(int)
+        self._bytes_in = defaultdict(int)
+        self._bytes_out = defaultdict(int)
+        self._peak_memory = {}
+
+    def record(self, endpoint, status, timer, total):
+        with self._lock:
+            self._requests[endpoint, status] += 1
+            self._durations[endpoint].observe(total)
+            for name, seconds in timer.stages.items():
+                self._stages[endpoint, name].observe(seconds)
+            self._rows_in[endpoint] += timer.rows_in
+            self._rows_out[endpoint] += timer.rows_out
+            self._bytes_in[endpoint] += timer.bytes_in
+            self._bytes_out[endpoint] += timer.bytes_out
+            if timer.peak_memory is not None:
+                self._peak_memory[endpoint] = max(self._peak_memory.get(endpoint, 0), timer.peak_memory)
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self._lock:
+            family('lottery_requests_total', 'counter', 'Finished requests.')
+            for (endpoint, status), value in sorted(self._requests.items()):
+                lines.append(f'lottery_requests_total{{endpoint="{_label(endpoint)}",status="{status}"}} {value}')
+
+            family('lottery_request_duration_seconds', 'histogram', 'Wall time per request, including the response write.')
+            for endpoint, histogram in sorted(self._durations.items()):
+                lines.extend(histogram.lines('lottery_request_duration_seconds', f'endpoint="{_label(endpoint)}"'))
+
+            family('lottery_stage_duration_seconds', 'histogram', 'Wall time per request stage.')
+            for (endpoint, stage), histogram in sorted(self._stages.items()):
+                labels = f'endpoint="{_label(endpoint)}",stage="{_label(stage)}"'
+                lines.extend(histogram.lines('lottery_stage_duration_seconds', labels))
+
+            for name, values, help_text in (
+                ('lottery_rows_in_total', self._rows_in, 'Combinations read by filters.'),
+                ('lottery_rows_out_total', self._rows_out, 'Combinations produced by filters.'),
+                ('lottery_bytes_in_total', self._bytes_in, 'Request body bytes.'),
+                ('lottery_bytes_out_total', self._bytes_out, 'Response body bytes.'),
+            ):
+                family(name, 'counter', help_text)
+                for endpoint, value in sorted(values.items()):
+                    lines.append(f'{name}{{endpoint="{_label(endpoint)}"}} {value}')
+
+            if self._peak_memory:
+                family('lottery_request_peak_memory_bytes', 'gauge', 'Largest traced allocation peak of a request.')
+                for endpoint, value in sorted(self._peak_memory.items()):
+                    lines.append(f'lottery_request_peak_memory_bytes{{endpoint="{_label(endpoint)}"}} {value}')
+
+        rss = peak_rss_bytes()
+        if rss is not None:
+            family('lottery_process_peak_rss_bytes', 'gauge', 'High-water mark of the process resident set size.')
+            lines.append(f'lottery_process_peak_rss_bytes {rss}')
+        return '\n'.join(lines) + '\n'
+
+
+def counting_iter(chunks, timer):
+    """
+    Passes a streamed body through while adding its size to bytes_out.
+    """
+    for chunk in chunks:
+        timer.bytes_out += len(chunk.encode() if isinstance(chunk, str) else chunk)
+        yield chunk
+
+
+if TRACE_MEMORY:
+    tracemalloc.start()
@@ -0,0 +1,66 @@
+"""
+Offset/limit and cursor based paging over session results. Only the
+requested page is ever turned into Python lists and serialized.
+"""
+import base64
+import json
+
+from combinatorics import CombinationPool
+from vectorized import to_matrix
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+
+
+def encode_cursor(session_id, offset, limit):
+    raw = json.dumps([session_id, offset, limit], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns (session_id, offset, limit) from an opaque cursor.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        session_id, offset, limit = json.loads(raw)
+        offset, limit = int(offset), int(limit)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if offset < 0 or limit < 0:
+        raise ValueError("Invalid cursor")
+    return session_id, offset, min(limit, MAX_PAGE_SIZE)
+
+
+def page_params(data):
+    """
+    Reads (offset, limit) from a request, clamping the limit.
+    """
+    offset = int(data.get('offset', 0))
+    limit = int(data.get('limit', DEFAULT_PAGE_SIZE))
+    if offset < 0 or limit < 0:
+        raise ValueError("offset and limit must not be negative")
+    return offset, min(limit, MAX_PAGE_SIZE)
+
+
+def page_matrix(combos, offset, limit):
+    """
+    The combinations at [offset, offset + limit) as a matrix.
+    """
+    if isinstance(combos, CombinationPool):
+        rows = combos[offset:offset + limit]
+        return to_matrix(rows).reshape(len(rows), combos.choose)
+    return combos[offset:offset + limit].matrix
+
+
+def page_fields(session_id, combos, offset, limit):
+    """
+    Paging fields for one page of a session's results. nextCursor is None
+    on the last page, and for empty pages, whose cursor would not advance.
+    """
+    end = offset + limit
+    return {
+        'offset': offset,
+        'limit': limit,
+        'nextCursor': encode_cursor(session_id, end, limit) if limit and end < len(combos) else None,
+    }
@@ -0,0 +1,176 @@
+"""
+Optional multi-core filtering. Large inputs are split into contiguous
+shards that a process pool filters in parallel, and the shard results are
+joined back in order, so the output matches pipeline.run_pipeline.
+
+- Implicit pools are sharded by lexicographic rank range; each worker
+  generates its own rows, so only the range bounds cross the process
+  boundary.
+- Explicit matrices (sessions, posted lists) are copied once into shared
+  memory. Workers read their row range from it and write survivor flags
+  into a shared output mask.
+- Matrices memory-mapped from the pool store (see poolstore.py) are not
+  copied; workers map the same file.
+
+Set LOTTERY_WORKERS to the number of worker processes to enable it.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from combinatorics import CombinationPool
+from pipeline import iter_pipeline, run_pipeline
+from vectorized import BLOCK_ROWS, Block, pool_blocks, to_matrix
+
+PARALLEL_WORKERS = int(os.environ.get('LOTTERY_WORKERS', 0))
+
+# Inputs below this many rows are filtered in-process; the round trip to
+# the workers costs more than it saves
+MIN_PARALLEL_ROWS = 1 << 21
+
+# More shards than workers evens out shards that filter at different speeds
+SHARDS_PER_WORKER = 4
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(workers):
+    """
+    The shared process pool, started with `workers` processes on first use.
+    Workers come from a fork server so they do not inherit the web
+    server's threads.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            context = multiprocessing.get_context('forkserver')
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        return _executor
+
+
+def shard_bounds(count, shards):
+    """
+    Splits range(count) into at most `shards` contiguous (start, stop) pairs.
+    """
+    edges = np.linspace(0, count, min(shards, count) + 1).astype(np.int64)
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+
+def _filter_pool_shard(total, choose, start, stop, stages):
+    counts = [0] * len(stages)
+    blocks = [
+        survivors.matrix
+        for matrix in pool_blocks(total, choose, start=start, stop=stop)
+        for survivors in iter_pipeline(Block(matrix), stages, counts)
+    ]
+    if not blocks:
+        return np.empty((0, choose), dtype=np.uint8), counts
+    return np.concatenate(blocks), counts
+
+
+def _filter_matrix_shard(source, shape, dtype, target, start, stop, stages):
+    counts = [0] * len(stages)
+    if isinstance(source, tuple):
+        # (file name, byte offset) of a memory-mapped matrix
+        matrix_memory = None
+        matrix = np.memmap(source[0], dtype=dtype, mode='r', offset=source[1], shape=shape)
+    else:
+        matrix_memory = shared_memory.SharedMemory(name=source)
+        matrix = np.ndarray(shape, dtype=dtype, buffer=matrix_memory.buf)
+    mask_memory = shared_memory.SharedMemory(name=target)
+    try:
+        passed = np.ndarray(shape[0], dtype=bool, buffer=mask_memory.buf)
+        for offset in range(start, stop, BLOCK_ROWS):
+            end = min(offset + BLOCK_ROWS, stop)
+            block = Block(matrix[offset:end])
+            rows = np.arange(offset, end)
+            for i, stage in enumerate(stages):
+                keep = stage.mask(block)
+                block = block.take(keep)
+                rows = rows[keep]
+                counts[i] += len(rows)
+            passed[rows] = True
+        del matrix, passed
+    finally:
+        if matrix_memory is not None:
+            matrix_memory.close()
+        mask_memory.close()
+    return counts
+
+
+def _sum_counts(shard_counts, stages):
+    counts = [0] * len(stages)
+    for shard in shard_counts:
+        counts = [a + b for a, b in zip(counts, shard)]
+    return counts
+
+
+def _run_pool(pool, stages, workers):
+    executor = get_executor(workers)
+    futures = [
+        executor.submit(_filter_pool_shard, pool.total_numbers, pool.choose, start, stop, stages)
+        for start, stop in shard_bounds(len(pool), workers * SHARDS_PER_WORKER)
+    ]
+    results = [future.result() for future in futures]
+    filtered = Block(np.concatenate([matrix for matrix, _ in results]))
+    return filtered, _sum_counts([counts for _, counts in results], stages)
+
+
+def _mapped_file(matrix):
+    """
+    (file name, byte offset) of a whole, contiguous memory-mapped matrix.
+    """
+    if isinstance(matrix, np.memmap) and matrix.filename and matrix.flags.c_contiguous:
+        return matrix.filename, matrix.offset
+    return None
+
+
+def _run_matrix(matrix, stages, workers):
+    mapped = _mapped_file(matrix)
+    source = None
+    if mapped is None:
+        matrix = np.ascontiguousarray(matrix)
+        source = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+    target = shared_memory.SharedMemory(create=True, size=max(len(matrix), 1))
+    try:
+        if source is not None:
+            shared = np.ndarray(matrix.shape, dtype=matrix.dtype, buffer=source.buf)
+            shared[:] = matrix
+            del shared
+        passed = np.ndarray(len(matrix), dtype=bool, buffer=target.buf)
+        passed[:] = False
+        executor = get_executor(workers)
+        futures = [
+            executor.submit(_filter_matrix_shard, mapped or source.name, matrix.shape, matrix.dtype.str,
+                            target.name, start, stop, stages)
+            for start, stop in shard_bounds(len(matrix), workers * SHARDS_PER_WORKER)
+        ]
+        counts = _sum_counts([future.result() for future in futures], stages)
+        filtered = Block(np.asarray(matrix[passed]))
+        del passed
+    finally:
+        if source is not None:
+            source.close()
+            source.unlink()
+        target.close()
+        target.unlink()
+    return filtered, counts
+
+
+def run_pipeline_parallel(combos, stages, workers=None):
+    """
+    Same as pipeline.run_pipeline, spread over the worker processes when
+    parallel mode is on and the input is large enough to benefit.
+    """
+    workers = PARALLEL_WORKERS if workers is None else workers
+    if workers < 2 or not stages or len(combos) < MIN_PARALLEL_ROWS:
+        return run_pipeline(combos, stages)
+    if isinstance(combos, CombinationPool):
+        return _run_pool(combos, stages, workers)
+    matrix = combos.matrix if isinstance(combos, Block) else to_matrix(combos)
+    return _run_matrix(matrix, stages, workers)
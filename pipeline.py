@@ -0,0 +1,184 @@
+"""
+Filter pipelines: ordered filter specs, using the same parameter names as
+/filter, evaluated in a single pass over the combination blocks.
+"""
+import random
+
+import numpy as np
+
+from combinatorics import CombinationPool
+from expressions import lower, parse_expression
+from history import current_history
+from vectorized import KERNELS, Block, iter_blocks, to_matrix
+
+# Relative per-row cost of each kernel; bitmask checks are the cheapest
+FILTER_COSTS = {
+    'include': 1,
+    'exclude': 1,
+    'even_odd': 2,
+    'sum': 3,
+    'consecutive': 4,
+    'expression': 6,
+    'hot_cold': 3,
+    'history': 8,
+}
+
+# Rows drawn from the input to estimate how selective each stage is
+SAMPLE_ROWS = 512
+# Fixed, so the same input is always planned the same way
+SAMPLE_SEED = 0
+
+
+class Stage:
+    """One parsed filter step."""
+
+    def __init__(self, filter_type, args, name):
+        self.filter_type = filter_type
+        self.args = args
+        self.name = name
+
+    def mask(self, block):
+        return KERNELS[self.filter_type](block, *self.args)
+
+
+def _numbers(values):
+    # Convert string numbers to integers if needed
+    return [int(x) for x in values]
+
+
+def _bounds(low, high):
+    if high >= 255:
+        return f"{low}+"
+    return f"{low}-{high}"
+
+
+def parse_filter(filter_type, data, total_numbers=None):
+    """
+    Reads the parameters of one filter from a request dict and returns the
+    stage. `total_numbers` is the size of the pool being filtered, when
+    known; hot/cold numbers are picked from 1..total_numbers.
+    """
+    if filter_type == 'include':
+        must_include = _numbers(data.get('mustInclude', []))
+        return Stage('include', (must_include,), f"Must Include Filter ({', '.join(map(str, must_include))})")
+    if filter_type == 'exclude':
+        must_exclude = _numbers(data['mustExclude'])
+        return Stage('exclude', (must_exclude,), f"Must Exclude Filter ({', '.join(map(str, must_exclude))})")
+    if filter_type == 'sum':
+        min_sum = int(data['minSum'])
+        max_sum = int(data['maxSum'])
+        return Stage('sum', (min_sum, max_sum), f"Sum Filter ({min_sum}-{max_sum})")
+    if filter_type == 'consecutive':
+        max_consecutive = int(data['maxConsecutive'])
+        return Stage('consecutive', (max_consecutive,), f"Consecutive Filter (max {max_consecutive})")
+    if filter_type == 'even_odd':
+        min_even = int(data['minEven'])
+        max_even = int(data['maxEven'])
+        return Stage('even_odd', (min_even, max_even), f"Even/Odd Filter ({min_even}-{max_even} evens)")
+    if filter_type == 'history':
+        history = current_history()
+        min_overlap = int(data.get('minOverlap', 0))
+        max_overlap = int(data['maxOverlap'])
+        return Stage('history', (history, min_overlap, max_overlap),
+                     f"Past Draws Filter ({min_overlap}-{max_overlap} shared with {len(history)} draws)")
+    if filter_type == 'hot_cold':
+        history = current_history()
+        window = int(data['window']) if data.get('window') else None
+        total_numbers = total_numbers or (data.get('total') and int(data['total']))
+        hot, cold = history.hot_cold(int(data.get('hotCount', 10)), window, total_numbers)
+        min_hot, max_hot = int(data.get('minHot', 0)), int(data.get('maxHot', 255))
+        min_cold, max_cold = int(data.get('minCold', 0)), int(data.get('maxCold', 255))
+        return Stage('hot_cold', (hot, cold, min_hot, max_hot, min_cold, max_cold),
+                     f"Hot/Cold Filter ({_bounds(min_hot, max_hot)} hot, {_bounds(min_cold, max_cold)} cold "
+                     f"of {len(hot)}, last {window or len(history)} draws)")
+    if filter_type == 'random':
+        num_sets = int(data['numSets'])
+        seed = data.get('seed')
+        seed = int(seed) if seed is not None else None
+        # Draws are without replacement unless asked for
+        replace = data.get('replace', False) in (True, 1, 'true', '1')
+        return Stage('random', (num_sets, seed, replace), f"Random Sets (selected {num_sets})")
+    raise ValueError(f"Unknown filter type: {filter_type}")
+
+
+def parse_filters(filter_type, data, total_numbers=None):
+    """
+    Like parse_filter, but returns a list of stages: an 'expression' filter
+    (see expressions.py) becomes one stage per standard filter it contains
+    plus one for the rest.
+    """
+    if filter_type == 'expression':
+        tree = parse_expression(data['expression'])
+        return [Stage(*spec) for spec in lower(tree)]
+    return [parse_filter(filter_type, data, total_numbers)]
+
+
+def parse_pipeline(specs, total_numbers=None):
+    """
+    Parses an ordered list of filter specs. A random stage may only come
+    last, since it is a draw rather than a filter.
+    """
+    stages = [stage for spec in specs for stage in parse_filters(spec['filterType'], spec, total_numbers)]
+    for stage in stages[:-1]:
+        if stage.filter_type == 'random':
+            raise ValueError("The random stage must be the last stage of a pipeline")
+    return stages
+
+
+def sample_block(combos, size=SAMPLE_ROWS):
+    """
+    A uniform random sample of rows from a combination set, the same rows
+    every time for the same set.
+    """
+    count = len(combos)
+    positions = sorted(random.Random(SAMPLE_SEED).sample(range(count), min(size, count)))
+    if isinstance(combos, CombinationPool):
+        return Block(to_matrix([combos[i] for i in positions]))
+    if not isinstance(combos, Block):
+        combos = Block(to_matrix(combos))
+    return combos.take(np.array(positions, dtype=np.int64))
+
+
+def plan(stages, combos):
+    """
+    Orders filter stages so the cheapest and most selective run first.
+    Stages are ranked by cost / (1 - pass rate), with pass rates measured
+    on a sample of the input.
+    """
+    if len(stages) < 2 or len(combos) == 0:
+        return list(stages)
+    sample = sample_block(combos)
+
+    def rank(stage):
+        pass_rate = stage.mask(sample).mean()
+        if pass_rate >= 1:
+            return float('inf')
+        return FILTER_COSTS[stage.filter_type] / (1 - pass_rate)
+
+    return sorted(stages, key=rank)
+
+
+def iter_pipeline(combos, stages, counts):
+    """
+    Runs filter stages in the given order in one pass over the blocks and
+    yields the surviving rows block by block. Each block only reaches a
+    stage if some of its rows survived the previous ones. The survivor
+    count after each stage is added into `counts` as the blocks go by.
+    """
+    for block in iter_blocks(combos):
+        for i, stage in enumerate(stages):
+            block = block.take(stage.mask(block))
+            counts[i] += len(block)
+            if not len(block):
+                break
+        else:
+            yield block
+
+
+def run_pipeline(combos, stages):
+    """
+    Runs filter stages over a combination set. Returns the surviving rows
+    and the survivor count after each stage.
+    """
+    counts = [0] * len(stages)
+    return Block.concat(iter_pipeline(combos, stages, counts)), counts
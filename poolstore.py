@@ -0,0 +1,148 @@
+"""
+Optional on-disk store of materialized pools. Each (total, choose) pool is
+written once, together with its feature index (see features.py), as .npy
+files in its own directory, and from then on opened memory-mapped. Every
+worker on the host shares the same pages through the page cache, and a
+pool seen before is opened instead of regenerated.
+
+Set LOTTERY_POOL_DIR to enable it for pools too large for the result
+cache.
+"""
+from math import comb
+import os
+import shutil
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+import bitmask
+from features import INDEX_ROW_BYTES, INDEXED, ColumnIndex, add_features
+from vectorized import Block, pool_blocks
+
+POOL_DIR = os.environ.get('LOTTERY_POOL_DIR')
+
+# Refuse pools whose files would take more than this many bytes
+MAX_STORE_BYTES = int(os.environ.get('LOTTERY_POOL_MAX_GB', 8)) * 1024 ** 3
+
+COLUMN_DTYPES = {
+    'masks': np.uint64,
+    'sums': np.uint16,
+    'evens': np.uint8,
+    'runs': np.uint8,
+    'lows': np.uint8,
+}
+
+
+class PoolStore:
+    """
+    Directory of memory-mapped pools. Opened pools are kept per process,
+    so each worker maps a pool file once.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._open = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, total_numbers, choose):
+        return os.path.join(self.root, f'pool-{total_numbers}-{choose}')
+
+    def open(self, total_numbers, choose):
+        """
+        The pool as an indexed block over memory-mapped files, building the
+        files first if this is the first time the pool is used, or if they
+        are damaged.
+        """
+        key = (total_numbers, choose)
+        with self._lock:
+            if key not in self._open:
+                path = self.path(total_numbers, choose)
+                block = self._check(path, total_numbers, choose)
+                if block is None:
+                    self._build_locked(total_numbers, choose, path)
+                    block = self._load(path, total_numbers)
+                self._open[key] = block
+            return self._open[key]
+
+    def _build_locked(self, total_numbers, choose, path):
+        # One worker builds while the others wait for it on the lock file
+        with open(path + '.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            if self._check(path, total_numbers, choose) is None:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                self.build(total_numbers, choose, path)
+
+    def build(self, total_numbers, choose, path):
+        rows = comb(total_numbers, choose)
+        if rows * (choose + INDEX_ROW_BYTES) > MAX_STORE_BYTES:
+            raise ValueError("Pool too large for the pool store")
+        tmp = tempfile.mkdtemp(dir=self.root, prefix='.build-')
+        try:
+            self._write(total_numbers, choose, rows, tmp)
+            os.rename(tmp, path)
+        finally:
+            if os.path.isdir(tmp):
+                shutil.rmtree(tmp)
+
+    def _write(self, total_numbers, choose, rows, directory):
+        def column(name, dtype, shape):
+            return open_memmap(os.path.join(directory, name + '.npy'), mode='w+', dtype=dtype, shape=shape)
+
+        matrix = column('matrix', np.uint8, (rows, choose))
+        names = [name for name in COLUMN_DTYPES if name != 'masks' or total_numbers <= bitmask.MAX_NUMBER]
+        columns = {name: column(name, COLUMN_DTYPES[name], (rows,)) for name in names}
+        start = 0
+        for part in pool_blocks(total_numbers, choose):
+            block = Block(part)
+            add_features(block, total_numbers)
+            stop = start + len(block)
+            matrix[start:stop] = part
+            for name, values in columns.items():
+                values[start:stop] = block.features[name]
+            start = stop
+        for values in [matrix, *columns.values()]:
+            values.flush()
+        for name in INDEXED:
+            index = ColumnIndex(columns[name])
+            np.save(os.path.join(directory, name + '.order.npy'), index.order)
+            np.save(os.path.join(directory, name + '.offsets.npy'), index.offsets)
+        del matrix, columns
+
+    def _load(self, path, total_numbers):
+        def load(name):
+            return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+        features = {name: load(name) for name in COLUMN_DTYPES if os.path.exists(os.path.join(path, name + '.npy'))}
+        features.setdefault('masks', None)
+        block = Block(load('matrix'), features)
+        for name in INDEXED:
+            block.indexes[name] = ColumnIndex(features[name], load(name + '.order'), load(name + '.offsets'))
+        return block
+
+    def _check(self, path, total_numbers, choose):
+        """
+        The pool's block when its files are all there and whole, else None.
+        """
+        try:
+            block = self._load(path, total_numbers)
+        except (OSError, ValueError, KeyError):
+            return None
+        rows = comb(total_numbers, choose)
+        if block.matrix.shape != (rows, choose):
+            return None
+        columns = [values for values in block.features.values() if values is not None]
+        if any(len(values) != rows for values in columns):
+            return None
+        if any(len(index.order) != rows or index.offsets[-1] != rows for index in block.indexes.values()):
+            return None
+        return block
@@ -0,0 +1,136 @@
+"""
+Uniform random draws from the combinations that pass a set of filters,
+without enumerating them. A suffix table counts, for every number x and
+partial state (numbers left to choose, sum, evens, current run), the
+valid ways to finish the combination from x onwards. A uniform random
+rank below the total count is then unranked in pool order by walking the
+table, so each draw costs O(total numbers).
+"""
+from functools import lru_cache
+import random
+
+import numpy as np
+
+from counting import Constraints, count
+
+
+def draw_ranks(count, num_sets, seed=None, replace=False):
+    """
+    Random ranks below count. Without replacement the ranks are distinct
+    and at most count of them are drawn; with replacement exactly
+    num_sets are drawn and may repeat. The same seed gives the same ranks.
+    """
+    rng = random.Random(seed)
+    if count <= 0 or num_sets <= 0:
+        return []
+    if replace:
+        return [rng.randrange(count) for _ in range(num_sets)]
+    return rng.sample(range(count), min(num_sets, count))
+
+
+class Sampler:
+    """
+    Counts and unranks the combinations of a pool that satisfy a set of
+    constraints.
+    """
+
+    def __init__(self, constraints):
+        n = self.total_numbers = constraints.total_numbers
+        k = self.choose = constraints.choose
+        self.include = set(constraints.include)
+        self.exclude = set(constraints.exclude)
+        self.count = count(constraints)
+        if self.count == 0:
+            self.table = None
+            return
+
+        self.track_sum = constraints.max_sum is not None
+        self.track_even = constraints.max_even is not None
+        self.track_run = constraints.max_run is not None
+        highest_sum = k * (2 * n - k + 1) // 2
+        sums = min(constraints.max_sum, highest_sum) + 1 if self.track_sum else 1
+        evens = min(constraints.max_even, k) + 1 if self.track_even else 1
+        runs = min(constraints.max_run, k) + 1 if self.track_run else 1
+        low_sum = max(constraints.min_sum, 0) if self.track_sum else 0
+        low_even = max(constraints.min_even, 0) if self.track_even else 0
+        dtype = np.int64 if self.count < 2 ** 62 else object
+
+        # table[x][c, s, e, r]: ways to pick c more numbers from x..n given
+        # the sum s and even count e so far and a run of r ending at x - 1
+        table = np.zeros((n + 2, k + 1, sums, evens, runs), dtype=dtype)
+        table[n + 1, 0, low_sum:, low_even:, :] = 1
+        for x in range(n, 0, -1):
+            following = table[x + 1]
+            current = table[x]
+            if x not in self.include:
+                # Skipping x ends the current run
+                current[...] = following[..., :1]
+            if x in self.exclude:
+                continue
+            dx = x if self.track_sum else 0
+            de = 1 if self.track_even and x % 2 == 0 else 0
+            if dx < sums and de < evens:
+                if self.track_run:
+                    current[1:, :sums - dx, :evens - de, :runs - 1] += following[:-1, dx:, de:, 1:]
+                else:
+                    current[1:, :sums - dx, :evens - de, :] += following[:-1, dx:, de:, :]
+        self.table = table
+
+    def unrank(self, rank):
+        """
+        The combination at position `rank` among the valid combinations in
+        pool order.
+        """
+        if not 0 <= rank < self.count:
+            raise IndexError("Rank out of range")
+        table = self.table
+        sums, evens, runs = table.shape[2:]
+        combo = []
+        x = 1
+        left = self.choose
+        s = e = run = 0
+        while left:
+            for y in range(x, self.total_numbers + 1):
+                if y > x and y - 1 in self.include:
+                    raise ValueError("Sampling table is inconsistent")
+                if y in self.exclude:
+                    continue
+                new_s = s + y if self.track_sum else 0
+                new_e = e + (y % 2 == 0) if self.track_even else 0
+                new_run = (run + 1 if y == x else 1) if self.track_run else 0
+                if new_s >= sums or new_e >= evens or new_run >= runs:
+                    continue
+                ways = table[y + 1, left - 1, new_s, new_e, new_run]
+                if rank < ways:
+                    break
+                rank -= ways
+            combo.append(y)
+            x = y + 1
+            left -= 1
+            s, e, run = new_s, new_e, new_run
+        return combo
+
+    def sample(self, num_sets, seed=None, replace=False):
+        """
+        Uniformly drawn combinations, see draw_ranks for the two modes.
+        """
+        return [self.unrank(rank) for rank in draw_ranks(self.count, num_sets, seed, replace)]
+
+
+@lru_cache(maxsize=8)
+def _cached_sampler(key):
+    total_numbers, choose, include, exclude, min_sum, max_sum, min_even, max_even, max_run = key
+    constraints = Constraints(total_numbers, choose)
+    constraints.include = set(include)
+    constraints.exclude = set(exclude)
+    constraints.min_sum, constraints.max_sum = min_sum, max_sum
+    constraints.min_even, constraints.max_even = min_even, max_even
+    constraints.max_run = max_run
+    return Sampler(constraints)
+
+
+def sampler_for(constraints):
+    """
+    Sampler for a set of constraints, reused across requests.
+    """
+    return _cached_sampler(constraints.key())
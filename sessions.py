@@ -0,0 +1,119 @@
+from collections import OrderedDict
+import os
+import threading
+import uuid
+
+from cache import block_bytes
+from combinatorics import CombinationPool
+
+MAX_SESSIONS = 64
+# Bytes the sessions may hold between them: their combinations and their
+# last pipeline runs
+MAX_SESSION_BYTES = int(os.environ.get('LOTTERY_SESSION_MB', 1024)) * 1024 * 1024
+
+# Unfiltered pools get the ID pool-<total>-<choose> in every process, so
+# their responses only depend on the request and any process can serve them
+POOL_PREFIX = 'pool-'
+
+
+class Session:
+    """A combination set held on the server between /calc and /filter calls."""
+
+    def __init__(self, session_id, combos, total_numbers=None, choose=None, stages=None):
+        self.id = session_id
+        self.combos = combos
+        self.total_numbers = total_numbers
+        self.choose = choose
+        # Filter stages applied to the full pool to get here, or None when
+        # the set cannot be described that way (e.g. after a random draw)
+        self.stages = stages
+        # Last pipeline run over this session, reused when only parameters change
+        self.pipeline_run = None
+
+    @property
+    def nbytes(self):
+        """
+        Memory held by the session: its combinations, unless they are a pool
+        generated on demand, and its last pipeline run.
+        """
+        size = 0 if isinstance(self.combos, CombinationPool) else block_bytes(self.combos)
+        if self.pipeline_run is not None:
+            size += self.pipeline_run.nbytes
+        return size
+
+
+class SessionStore:
+    """
+    Bounded in-process store of filter sessions. The least recently used
+    sessions are evicted first once there are more than max_sessions or
+    they hold more than max_bytes between them; the latest one is kept.
+    """
+
+    def __init__(self, max_sessions=MAX_SESSIONS, max_bytes=MAX_SESSION_BYTES):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, combos, total_numbers=None, choose=None, stages=None):
+        session = Session(uuid.uuid4().hex, combos, total_numbers, choose, stages)
+        with self._lock:
+            self._add(session)
+        return session
+
+    def _add(self, session):
+        self._sessions[session.id] = session
+        self._trim()
+
+    def _trim(self):
+        # Sizes are taken each time, since pipeline runs come and go
+        size = sum(session.nbytes for session in self._sessions.values())
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or size > self.max_bytes):
+            _, evicted = self._sessions.popitem(last=False)
+            size -= evicted.nbytes
+
+    def keep_run(self, session, run):
+        """
+        Keeps a pipeline run on a session, charged to the byte budget. Runs
+        that would not fit even alone are dropped.
+        """
+        with self._lock:
+            session.pipeline_run = run
+            if session.nbytes > self.max_bytes:
+                session.pipeline_run = None
+            if session.id in self._sessions:
+                self._sessions.move_to_end(session.id)
+                self._trim()
+
+    def pool(self, total_numbers, choose):
+        """
+        The session of the whole total_numbers/choose pool.
+        """
+        session_id = f'{POOL_PREFIX}{total_numbers}-{choose}'
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(session_id, CombinationPool(total_numbers, choose), total_numbers, choose, stages=[])
+                self._add(session)
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                return session
+        if session_id.startswith(POOL_PREFIX):
+            # Recreated on demand; the ID says which pool it is
+            try:
+                total_numbers, choose = (int(x) for x in session_id[len(POOL_PREFIX):].split('-'))
+            except ValueError:
+                pass
+            else:
+                if 0 < choose <= total_numbers:
+                    return self.pool(total_numbers, choose)
+        raise LookupError(f"Unknown or expired session: {session_id}")
+
+    def __len__(self):
+        return len(self._sessions)
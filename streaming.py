@@ -0,0 +1,72 @@
+"""
+Streaming responses for large combination sets. Rows are encoded and sent
+block by block as they are generated or filtered, so the server never
+holds the whole encoded payload.
+
+Two formats are supported:
+- 'ndjson': one JSON value per line. The first line is an object with the
+  response metadata, then one array per combination, then a final object
+  with the total (and an 'error' key if the stream failed part way).
+- 'json': the usual response object, with 'combinations' written out as
+  it is produced and the totals placed after it.
+"""
+import json
+
+from flask import Response
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+STREAM_FORMATS = ('ndjson', 'json')
+
+# Rows encoded per chunk written to the socket
+STREAM_CHUNK_ROWS = 4096
+
+_SEPARATORS = (',', ':')
+
+
+def _dumps(value):
+    return json.dumps(value, separators=_SEPARATORS)
+
+
+def iter_row_chunks(blocks):
+    for block in blocks:
+        for start in range(0, len(block), STREAM_CHUNK_ROWS):
+            yield block.matrix[start:start + STREAM_CHUNK_ROWS].tolist()
+
+
+def _ndjson(header, blocks, trailer):
+    yield _dumps(header) + '\n'
+    total = 0
+    try:
+        for rows in iter_row_chunks(blocks):
+            total += len(rows)
+            yield ''.join(_dumps(row) + '\n' for row in rows)
+        yield _dumps(dict(trailer(), total=total)) + '\n'
+    except Exception as e:
+        yield _dumps({'error': str(e), 'total': total}) + '\n'
+
+
+def _json_document(header, blocks, trailer):
+    opening = _dumps(header)[1:-1]
+    yield '{' + (opening + ',' if opening else '') + '"combinations":['
+    total = 0
+    try:
+        for rows in iter_row_chunks(blocks):
+            yield (',' if total else '') + ','.join(_dumps(row) for row in rows)
+            total += len(rows)
+        closing = dict(trailer(), total=total)
+    except Exception as e:
+        closing = {'error': str(e), 'total': total}
+    yield '],' + _dumps(closing)[1:-1] + '}'
+
+
+def stream_response(stream_format, header, blocks, trailer=dict):
+    """
+    Response that streams the rows of `blocks`. `trailer` is called once
+    every row has been sent and returns extra fields for the end of the
+    stream, such as per-stage counts.
+    """
+    if stream_format == 'ndjson':
+        return Response(_ndjson(header, blocks, trailer), mimetype=NDJSON_MIMETYPE)
+    if stream_format == 'json':
+        return Response(_json_document(header, blocks, trailer), mimetype='application/json')
+    raise ValueError(f"Unknown stream format: {stream_format}")
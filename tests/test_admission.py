@@ -0,0 +1,29 @@
+"""
+Admission decisions for filter requests.
+"""
+import time
+
+from admission import REJECT, RUN
+from app import admit_filters
+from combinatorics import CombinationPool
+from pipeline import parse_pipeline
+
+
+def test_small_pool_runs_with_exact_survivors():
+    stages = parse_pipeline([{'filterType': 'include', 'mustInclude': [1, 2]}])
+    admission = admit_filters(CombinationPool(20, 4), 20, 4, [], stages)
+    assert admission.action == RUN
+    assert admission.survivors == 153
+
+
+def test_expensive_count_is_skipped():
+    stages = parse_pipeline([
+        {'filterType': 'sum', 'minSum': 800, 'maxSum': 1000},
+        {'filterType': 'even_odd', 'minEven': 10, 'maxEven': 20},
+        {'filterType': 'consecutive', 'maxConsecutive': 5},
+    ])
+    start = time.perf_counter()
+    admission = admit_filters(CombinationPool(60, 30), 60, 30, [], stages)
+    assert time.perf_counter() - start < 1
+    assert admission.survivors is None
+    assert admission.action == REJECT
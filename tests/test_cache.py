@@ -0,0 +1,31 @@
+"""
+Result cache bounds, in process and on disk.
+"""
+import os
+import time
+
+import numpy as np
+
+from cache import ResultCache
+from vectorized import Block
+
+
+def block(rows):
+    return Block(np.zeros((rows, 6), dtype=np.uint8))
+
+
+def test_shared_directory_stays_within_budget(tmp_path):
+    cache = ResultCache(max_bytes=2000, shared_dir=str(tmp_path))
+    for i in range(10):
+        cache.put(f'key{i}', block(100))
+        # Distinct modification times, oldest first
+        os.utime(tmp_path / f'key{i}.npy', (time.time() - 100 + i, time.time() - 100 + i))
+    files = sorted(os.listdir(tmp_path))
+    assert sum(os.path.getsize(tmp_path / name) for name in files) <= 2000
+    assert 'key9.npy' in files and 'key0.npy' not in files
+
+
+def test_shared_results_are_loaded(tmp_path):
+    ResultCache(max_bytes=10000, shared_dir=str(tmp_path)).put('key', block(10))
+    other = ResultCache(max_bytes=10000, shared_dir=str(tmp_path))
+    assert other.get('key').tolist() == block(10).tolist()
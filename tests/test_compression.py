@@ -0,0 +1,96 @@
+"""
+Response compression and the /calc ETags.
+"""
+import gzip
+import importlib
+import json
+import sys
+
+import pytest
+from werkzeug.http import parse_accept_header
+
+import app as server
+import compression
+
+CALC = '/calc?total=20&choose=3'
+
+
+@pytest.fixture
+def client():
+    return server.app.test_client()
+
+
+def test_gzip_is_negotiated(client):
+    plain = client.get(CALC)
+    assert 'Content-Encoding' not in plain.headers
+    response = client.get(CALC, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert json.loads(gzip.decompress(response.data)) == plain.get_json()
+
+
+def test_small_bodies_are_not_compressed(client):
+    response = client.get('/calc?total=5&choose=2', headers={'Accept-Encoding': 'gzip'})
+    assert len(response.data) < compression.MIN_COMPRESS_BYTES
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_json()['total'] == 10
+
+
+def test_zstd_is_preferred_when_installed(client):
+    zstandard = pytest.importorskip('zstandard')
+    response = client.get(CALC, headers={'Accept-Encoding': 'gzip, zstd'})
+    assert response.headers['Content-Encoding'] == 'zstd'
+    body = zstandard.ZstdDecompressor().decompress(response.data)
+    assert json.loads(body) == client.get(CALC).get_json()
+
+
+def test_gzip_only_without_zstandard(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'zstandard', None)
+    try:
+        fallback = importlib.reload(compression)
+        assert fallback.ENCODINGS == ('gzip',)
+        assert fallback.negotiate(parse_accept_header('zstd')) is None
+        assert fallback.negotiate(parse_accept_header('zstd, gzip;q=0.5')) == 'gzip'
+    finally:
+        monkeypatch.undo()
+        importlib.reload(compression)
+
+
+@pytest.mark.parametrize('encoding', [None, 'gzip'])
+def test_repeat_calc_pages_get_304(client, encoding):
+    headers = {'Accept-Encoding': encoding} if encoding else {}
+    first = client.get(CALC, headers=headers)
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+    if encoding:
+        assert etag.endswith(f'-{encoding}"')
+    repeat = client.get(CALC, headers=dict(headers, **{'If-None-Match': etag}))
+    assert repeat.status_code == 304
+    assert repeat.headers['ETag'] == etag
+    assert repeat.data == b''
+
+
+def test_repeat_calc_pages_come_from_the_body_cache(client):
+    first = client.get(CALC, headers={'Accept-Encoding': 'gzip'})
+    hits = server.compressed_bodies.hits
+    repeat = client.get(CALC, headers={'Accept-Encoding': 'gzip'})
+    assert server.compressed_bodies.hits == hits + 1
+    assert repeat.data == first.data
+    assert repeat.headers['ETag'] == first.headers['ETag']
+
+
+def test_etags_follow_the_request(client):
+    etag = client.get(CALC).headers['ETag']
+    assert client.get(CALC + '&offset=5').headers['ETag'] != etag
+    assert client.get(CALC + '&limit=7').headers['ETag'] != etag
+    assert client.get(CALC, headers={'Accept': 'application/x-lottery-rows'}).headers['ETag'] != etag
+    # Stale tags get the full page
+    response = client.get(CALC, headers={'If-None-Match': '"stale"'})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == etag
+
+
+def test_only_unfiltered_get_pages_have_etags(client):
+    assert 'ETag' not in client.post('/calc', json={'total': 20, 'choose': 3}).headers
+    filters = [{'filterType': 'sum', 'minSum': 10, 'maxSum': 30}]
+    assert 'ETag' not in client.post('/calc', json={'total': 20, 'choose': 3, 'filters': filters}).headers
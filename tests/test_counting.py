@@ -0,0 +1,32 @@
+"""
+Analytic survivor counts against filtering the pool.
+"""
+import pytest
+
+from combinatorics import CombinationPool
+from counting import Constraints, CountTooLarge, count, count_stages
+from pipeline import parse_pipeline, run_pipeline
+
+SPECS = [
+    {'filterType': 'exclude', 'mustExclude': [3]},
+    {'filterType': 'sum', 'minSum': 50, 'maxSum': 80},
+    {'filterType': 'even_odd', 'minEven': 1, 'maxEven': 3},
+    {'filterType': 'consecutive', 'maxConsecutive': 2},
+    {'filterType': 'include', 'mustInclude': [10]},
+]
+
+
+def test_counts_match_filtering():
+    stages = parse_pipeline(SPECS)
+    _, counts = run_pipeline(CombinationPool(30, 5), stages)
+    assert count_stages(30, 5, stages) == counts
+
+
+def test_large_counts_are_refused():
+    constraints = Constraints.from_stages(60, 30, parse_pipeline([
+        {'filterType': 'sum', 'minSum': 800, 'maxSum': 1000},
+        {'filterType': 'even_odd', 'minEven': 10, 'maxEven': 20},
+        {'filterType': 'consecutive', 'maxConsecutive': 5},
+    ]))
+    with pytest.raises(CountTooLarge):
+        count(constraints)
@@ -0,0 +1,69 @@
+"""
+Filtering through the endpoints, checked against the per-row filters.
+"""
+from itertools import combinations
+
+import pytest
+
+import pipeline
+from app import apply_even_odd_filter, apply_exclude_filter, apply_sum_filter, app
+from history import DrawHistory
+from paging import MAX_PAGE_SIZE
+
+FILTERS = [
+    ({'filterType': 'include', 'mustInclude': [5]}, lambda c: 5 in c),
+    ({'filterType': 'exclude', 'mustExclude': [2, 66]}, lambda c: apply_exclude_filter(c, [2, 66])),
+    ({'filterType': 'sum', 'minSum': 40, 'maxSum': 90}, lambda c: apply_sum_filter(c, 40, 90)),
+    ({'filterType': 'consecutive', 'maxConsecutive': 1}, lambda c: all(b != a + 1 for a, b in zip(c, c[1:]))),
+    ({'filterType': 'even_odd', 'minEven': 1, 'maxEven': 1}, lambda c: apply_even_odd_filter(c, 1, 1)),
+]
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def pool(total, choose):
+    return [list(c) for c in combinations(range(1, total + 1), choose)]
+
+
+def post(client, url, **body):
+    data = client.post(url, json=body).get_json()
+    assert 'error' not in data, data['error']
+    return data
+
+
+@pytest.mark.parametrize('total,choose', [(30, 3), (65, 3), (70, 2), (100, 2)])
+@pytest.mark.parametrize('spec,keep', FILTERS)
+def test_filter_session(client, total, choose, spec, keep):
+    session = post(client, '/calc', total=total, choose=choose, limit=0)['sessionId']
+    expected = [c for c in pool(total, choose) if keep(c)]
+    data = post(client, '/filter', sessionId=session, limit=MAX_PAGE_SIZE, **spec)
+    assert data['total'] == len(expected)
+    assert data['combinations'] == expected[:MAX_PAGE_SIZE]
+
+
+@pytest.mark.parametrize('total,choose', [(30, 3), (65, 3), (70, 2)])
+def test_pipeline_and_calc_filters(client, total, choose):
+    specs = [spec for spec, _ in FILTERS[1:]]
+    expected = [c for c in pool(total, choose) if all(keep(c) for _, keep in FILTERS[1:])]
+    session = post(client, '/calc', total=total, choose=choose, limit=0)['sessionId']
+    data = post(client, '/pipeline', sessionId=session, filters=specs, optimize=False, limit=MAX_PAGE_SIZE)
+    assert data['combinations'] == expected[:MAX_PAGE_SIZE]
+    assert [stage['filterType'] for stage in data['stages']] == [spec['filterType'] for spec in specs]
+    data = post(client, '/calc', total=total, choose=choose, filters=specs, limit=MAX_PAGE_SIZE)
+    assert data['total'] == len(expected)
+    assert data['combinations'] == expected[:MAX_PAGE_SIZE]
+
+
+@pytest.mark.parametrize('url', ['/filter', '/pipeline'])
+def test_hot_cold_uses_session_pool(client, monkeypatch, url):
+    # Only 1..10 were ever drawn, so 11..20 are the coldest numbers of a 20 pool
+    history = DrawHistory([(1, 2, 3), (4, 5, 6), (7, 8, 9), (1, 5, 10)])
+    monkeypatch.setattr(pipeline, 'current_history', lambda: history)
+    session = post(client, '/calc', total=20, choose=2, limit=0)['sessionId']
+    spec = {'filterType': 'hot_cold', 'hotCount': 3, 'minCold': 2}
+    body = {'filters': [spec]} if url == '/pipeline' else spec
+    data = post(client, url, sessionId=session, **body)
+    assert data['combinations'] == [[11, 12], [11, 13], [12, 13]]
@@ -0,0 +1,129 @@
+"""
+Background jobs through the /jobs endpoints.
+"""
+import json
+import threading
+import time
+
+import pytest
+
+import app as server
+from jobs import CANCELLED, DONE, FINISHED, RUNNING, JobStore
+
+FILTERS = [
+    {'filterType': 'sum', 'minSum': 40, 'maxSum': 60},
+    {'filterType': 'even_odd', 'minEven': 2, 'maxEven': 2},
+]
+
+
+@pytest.fixture
+def client():
+    return server.app.test_client()
+
+
+def wait_for(client, job_id, states=FINISHED):
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        job = client.get(f'/jobs/{job_id}').get_json()
+        if job['state'] in states:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not reach {states}")
+
+
+def expected_rows():
+    return [
+        [a, b, c, d]
+        for a in range(1, 31) for b in range(a + 1, 31) for c in range(b + 1, 31) for d in range(c + 1, 31)
+        if 40 <= a + b + c + d <= 60 and sum(1 for x in (a, b, c, d) if x % 2 == 0) == 2
+    ]
+
+
+@pytest.fixture
+def blocked_job():
+    """
+    A job that runs until the test releases it, so it can be cancelled
+    while running.
+    """
+    release = threading.Event()
+    started = threading.Event()
+
+    def body(job):
+        started.set()
+        release.wait(10)
+        job.update(step=1)
+        return {'done': True}
+
+    job = server.jobs.submit(body)
+    assert started.wait(10)
+    yield job, release
+    release.set()
+
+
+def test_job_result_is_served_as_a_session(client):
+    submitted = client.post('/jobs', json={'total': 30, 'choose': 4, 'filters': FILTERS}).get_json()
+    assert submitted['state'] in ('queued', RUNNING, DONE)
+    job = wait_for(client, submitted['jobId'])
+    expected = expected_rows()
+    assert job['state'] == DONE
+    assert job['result']['total'] == len(expected)
+    assert job['progress']['rowsScanned'] == job['progress']['rowsTotal'] == 27405
+    assert job['progress']['survivors'] == len(expected)
+
+    page = client.get(f"/jobs/{job['jobId']}/results?offset=10&limit=25").get_json()
+    assert page['total'] == len(expected)
+    assert page['combinations'] == expected[10:35]
+
+    # The result is an ordinary session that can be filtered further
+    session = job['result']['sessionId']
+    narrowed = client.post('/filter', json={'sessionId': session, 'filterType': 'include', 'mustInclude': [7],
+                                            'limit': 10000}).get_json()
+    assert narrowed['combinations'] == [c for c in expected if 7 in c]
+
+
+def test_cancel_running_job(client, blocked_job):
+    job, release = blocked_job
+    assert client.get(f'/jobs/{job.id}').get_json()['state'] == RUNNING
+    cancelled = client.post(f'/jobs/{job.id}/cancel').get_json()
+    # Running jobs stop at their next update
+    assert cancelled['state'] == RUNNING
+    release.set()
+    assert wait_for(client, job.id)['state'] == CANCELLED
+    assert 'error' in client.get(f'/jobs/{job.id}/results').get_json()
+
+
+def test_cancel_queued_job():
+    store = JobStore(max_workers=1, max_queued=1)
+    release = threading.Event()
+    running = store.submit(lambda job: release.wait(10))
+    queued = store.submit(lambda job: None)
+    with pytest.raises(RuntimeError):
+        store.submit(lambda job: None)
+    queued.cancel()
+    assert queued.state == CANCELLED
+    release.set()
+    running.future.result(10)
+    assert running.state == DONE
+
+
+def test_event_stream_ends_with_the_final_state(client, blocked_job):
+    job, release = blocked_job
+    response = client.get(f'/jobs/{job.id}/events')
+    assert response.mimetype == 'text/event-stream'
+    chunks = iter(response.response)
+    first = next(chunks)
+    first = first.decode() if isinstance(first, bytes) else first
+    assert first.startswith('event: progress\n')
+    release.set()
+    events = [first] + [chunk.decode() if isinstance(chunk, bytes) else chunk for chunk in chunks]
+    name, data = events[-1].strip().split('\n')
+    assert name == 'event: done'
+    final = json.loads(data[len('data: '):])
+    assert final['state'] == DONE and final['result'] == {'done': True}
+    assert all(event.startswith(('event: progress\n', ': keep-alive')) for event in events[:-1])
+
+
+def test_unknown_jobs(client):
+    assert 'error' in client.get('/jobs/missing').get_json()
+    assert 'error' in client.post('/jobs/missing/cancel').get_json()
+    assert 'error' in client.get('/jobs/missing/results').get_json()
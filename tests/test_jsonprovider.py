@@ -0,0 +1,69 @@
+"""
+The matrix fast path of the JSON provider against json.dumps.
+"""
+import json
+
+import numpy as np
+import pytest
+
+import app as server
+from jsonprovider import encodable, encode_rows
+
+MATRICES = [
+    np.empty((0, 6), dtype=np.uint8),
+    np.array([[7]], dtype=np.uint8),
+    np.array([[1, 2, 3], [4, 5, 6]], dtype=np.uint8),
+    np.array([[0, 9, 10], [99, 100, 255]], dtype=np.uint8),
+    np.array([[1, 100, 1000, 65535], [5, 99, 999, 10000]], dtype=np.uint16),
+    np.array([[0, 2 ** 40], [12, 3]], dtype=np.int64),
+    np.arange(1, 301, dtype=np.int32).reshape(100, 3),
+    np.random.default_rng(0).integers(0, 256, size=(500, 7)).astype(np.uint8),
+]
+
+
+def dumps(value):
+    return json.dumps(value, separators=(',', ':')).encode()
+
+
+@pytest.mark.parametrize('matrix', MATRICES)
+def test_rows_match_json_dumps(matrix):
+    assert encodable(matrix)
+    assert encode_rows(matrix) == dumps(matrix.tolist())
+
+
+@pytest.mark.parametrize('matrix', MATRICES)
+def test_responses_match_the_default_provider(matrix):
+    fields = {'total': len(matrix), 'sessionId': 'abc', 'combinations': matrix, 'stages': [{'total': 1}]}
+    listed = dict(fields, combinations=matrix.tolist())
+    with server.app.app_context():
+        fast = server.app.json.response(fields).get_data()
+        slow = server.app.json.response(listed).get_data()
+    assert fast == slow
+    assert fast == json.dumps(listed, separators=(',', ':'), sort_keys=True).encode() + b'\n'
+
+
+def test_several_matrices_in_one_response():
+    first, second = MATRICES[3], MATRICES[4]
+    with server.app.app_context():
+        body = server.app.json.response({'a': first, 'b': 'x', 'c': second}).get_data()
+    assert json.loads(body) == {'a': first.tolist(), 'b': 'x', 'c': second.tolist()}
+
+
+@pytest.mark.parametrize('matrix', [
+    np.empty((3, 0), dtype=np.uint8),
+    np.array([[1, -2]], dtype=np.int64),
+    np.array([[1.0, 2.0]]),
+    np.array([1, 2, 3], dtype=np.uint8),
+])
+def test_other_arrays_take_the_default_path(matrix):
+    assert not encodable(matrix)
+    with server.app.app_context():
+        body = server.app.json.response({'combinations': matrix}).get_data()
+    assert json.loads(body) == {'combinations': matrix.tolist()}
+
+
+def test_calc_pages_with_large_numbers():
+    data = server.app.test_client().post('/calc', json={'total': 120, 'choose': 2, 'offset': 7000}).get_data()
+    rows = [[a, b] for a in range(1, 121) for b in range(a + 1, 121)][7000:]
+    assert json.loads(data)['combinations'] == rows
+    assert dumps(rows) in data
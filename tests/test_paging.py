@@ -0,0 +1,25 @@
+"""
+Paging fields and cursors.
+"""
+from combinatorics import CombinationPool
+from paging import decode_cursor, page_fields
+
+
+def test_cursor_advances():
+    pool = CombinationPool(25, 1)
+    fields = page_fields('s', pool, 10, 10)
+    assert decode_cursor(fields['nextCursor']) == ('s', 20, 10)
+    assert page_fields('s', pool, 20, 10)['nextCursor'] is None
+
+
+def test_empty_page_has_no_cursor():
+    assert page_fields('s', CombinationPool(25, 1), 0, 0)['nextCursor'] is None
+
+
+def test_choose_zero_pool_pages():
+    from app import app
+
+    data = app.test_client().post('/calc', json={'total': 5, 'choose': 0}).get_json()
+    assert 'error' not in data
+    assert data['total'] == 1
+    assert data['combinations'] == [[]]
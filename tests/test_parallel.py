@@ -0,0 +1,73 @@
+"""
+Multi-core filtering against the single-process pipeline.
+"""
+import pytest
+
+import parallel
+from combinatorics import CombinationPool
+from incremental import PipelineRun
+from pipeline import parse_pipeline
+from vectorized import Block, to_matrix
+
+PIPELINES = [
+    [{'filterType': 'sum', 'minSum': 40, 'maxSum': 80}],
+    [
+        {'filterType': 'exclude', 'mustExclude': [3, 17]},
+        {'filterType': 'even_odd', 'minEven': 1, 'maxEven': 3},
+        {'filterType': 'consecutive', 'maxConsecutive': 2},
+    ],
+    [{'filterType': 'sum', 'minSum': 2000, 'maxSum': 3000}],
+    [
+        {'filterType': 'include', 'mustInclude': [5]},
+        {'filterType': 'expression', 'expression': 'min >= 2 and (max <= 25 or evens == 0)'},
+    ],
+]
+
+
+@pytest.fixture(autouse=True)
+def shard_small_inputs(monkeypatch):
+    monkeypatch.setattr(parallel, 'MIN_PARALLEL_ROWS', 0)
+
+
+def single_process(combos, specs):
+    run = PipelineRun.evaluate(combos, parse_pipeline(specs))
+    return run.result().tolist(), run.counts()
+
+
+@pytest.mark.parametrize('count,shards', [(10, 3), (3, 8), (1, 1), (100, 16), (0, 4)])
+def test_shard_bounds_cover_the_range(count, shards):
+    bounds = parallel.shard_bounds(count, shards)
+    assert len(bounds) <= shards
+    assert all(start < stop for start, stop in bounds)
+    assert [stop for _, stop in bounds[:-1]] == [start for start, _ in bounds[1:]]
+    assert sum(stop - start for start, stop in bounds) == count
+    if bounds:
+        assert bounds[0][0] == 0 and bounds[-1][1] == count
+
+
+@pytest.mark.parametrize('specs', PIPELINES)
+@pytest.mark.parametrize('total,choose', [(30, 3), (20, 5)])
+def test_pool_shards_match(total, choose, specs):
+    pool = CombinationPool(total, choose)
+    filtered, counts = parallel.run_pipeline_parallel(pool, parse_pipeline(specs), workers=2)
+    assert (filtered.tolist(), counts) == single_process(pool, specs)
+    assert parallel._executor is not None
+
+
+@pytest.mark.parametrize('specs', PIPELINES)
+def test_shared_memory_shards_match(specs):
+    combos = list(CombinationPool(30, 3))
+    # Every other row, so the input is not a whole pool
+    block = Block(to_matrix(combos[::2]))
+    filtered, counts = parallel.run_pipeline_parallel(block, parse_pipeline(specs), workers=2)
+    assert (filtered.tolist(), counts) == single_process(block, specs)
+    filtered, _ = parallel.run_pipeline_parallel([list(c) for c in combos[::2]], parse_pipeline(specs), workers=2)
+    assert filtered.tolist() == single_process(block, specs)[0]
+
+
+def test_small_inputs_stay_in_process(monkeypatch):
+    monkeypatch.setattr(parallel, 'MIN_PARALLEL_ROWS', 1 << 21)
+    monkeypatch.setattr(parallel, 'get_executor', None)
+    specs = PIPELINES[0]
+    filtered, counts = parallel.run_pipeline_parallel(CombinationPool(30, 3), parse_pipeline(specs), workers=2)
+    assert (filtered.tolist(), counts) == single_process(CombinationPool(30, 3), specs)
@@ -0,0 +1,61 @@
+"""
+Filter pipelines: planning and incremental reruns.
+"""
+from combinatorics import CombinationPool
+from pipeline import parse_pipeline, plan
+
+SPECS = [
+    {'filterType': 'consecutive', 'maxConsecutive': 2},
+    {'filterType': 'sum', 'minSum': 60, 'maxSum': 90},
+    {'filterType': 'even_odd', 'minEven': 2, 'maxEven': 3},
+    {'filterType': 'include', 'mustInclude': [7]},
+]
+
+
+def test_plan_is_deterministic():
+    pool = CombinationPool(40, 6)
+    orders = {tuple(stage.name for stage in plan(parse_pipeline(SPECS), pool)) for _ in range(5)}
+    assert len(orders) == 1
+
+
+def test_rerun_without_optimize_keeps_request_order():
+    from app import app
+
+    client = app.test_client()
+    session = client.post('/calc', json={'total': 10, 'choose': 2, 'limit': 0}).get_json()['sessionId']
+    requested = ['consecutive', 'sum', 'even_odd']
+    # New sum bounds each time so the result cache does not answer first
+    for optimize, max_sum in ((True, 17), (False, 16), (True, 15), (False, 14)):
+        specs = [
+            {'filterType': 'consecutive', 'maxConsecutive': 1},
+            {'filterType': 'sum', 'minSum': 5, 'maxSum': max_sum},
+            {'filterType': 'even_odd', 'minEven': 1, 'maxEven': 1},
+        ]
+        data = client.post('/pipeline', json={'sessionId': session, 'filters': specs, 'optimize': optimize,
+                                              'limit': 0}).get_json()
+        ran = [stage['filterType'] for stage in data['stages']]
+        assert sorted(ran) == sorted(requested)
+        if not optimize:
+            assert ran == requested
+        assert data['total'] == sum(1 for a in range(1, 11) for b in range(a + 2, 11)
+                                    if 5 <= a + b <= max_sum and (a + b) % 2)
+
+
+def test_rerun_to_no_survivors_skips_later_stages():
+    from vectorized import Block, to_matrix
+    from incremental import PipelineRun
+
+    combos = Block(to_matrix(list(CombinationPool(12, 3))))
+    specs = [
+        {'filterType': 'sum', 'minSum': 10, 'maxSum': 25},
+        {'filterType': 'expression', 'expression': 'min >= 2 and max <= 11'},
+    ]
+    run = PipelineRun.evaluate(combos, parse_pipeline(specs), [0, 1])
+    specs[0]['maxSum'] = 5
+    rerun = run.rerun(parse_pipeline(specs), combos, optimize=False)
+    assert rerun.counts() == [0, 0]
+    # The expression now changes over a base with no rows left
+    specs[1]['expression'] = 'min >= 3 or max <= 10'
+    rerun = rerun.rerun(parse_pipeline(specs), combos, optimize=False)
+    assert rerun.counts() == [0, 0]
+    assert len(rerun.result()) == 0
@@ -0,0 +1,91 @@
+"""
+The memory-mapped pool store against generated pools.
+"""
+import os
+
+import numpy as np
+import pytest
+
+import app as server
+import parallel
+from cache import ResultCache
+from combinatorics import CombinationPool
+from features import add_features
+from pipeline import parse_pipeline, run_pipeline
+from poolstore import PoolStore
+from vectorized import Block, to_matrix
+
+
+def pool_matrix(total, choose):
+    return to_matrix(list(CombinationPool(total, choose)))
+
+
+@pytest.mark.parametrize('total,choose', [(20, 4), (70, 2)])
+def test_build_matches_pool(tmp_path, total, choose):
+    block = PoolStore(str(tmp_path)).open(total, choose)
+    assert isinstance(block.matrix, np.memmap)
+    assert np.array_equal(block.matrix, pool_matrix(total, choose))
+    expected = Block(pool_matrix(total, choose))
+    add_features(expected, total)
+    for name, values in expected.features.items():
+        if values is None:
+            assert block.features[name] is None
+        else:
+            assert np.array_equal(block.features[name], values)
+    stages = parse_pipeline([{'filterType': 'sum', 'minSum': 30, 'maxSum': 40}])
+    assert run_pipeline(block, stages)[0].tolist() == run_pipeline(expected, stages)[0].tolist()
+
+
+def test_existing_files_are_reopened(tmp_path, monkeypatch):
+    PoolStore(str(tmp_path)).open(20, 4)
+    store = PoolStore(str(tmp_path))
+    monkeypatch.setattr(store, 'build', None)
+    assert np.array_equal(store.open(20, 4).matrix, pool_matrix(20, 4))
+    assert store.open(20, 4) is store.open(20, 4)
+
+
+@pytest.mark.parametrize('damage', ['truncate', 'remove', 'garble'])
+def test_damaged_files_are_rebuilt(tmp_path, damage):
+    store = PoolStore(str(tmp_path))
+    path = store.path(20, 4)
+    store.open(20, 4)
+    matrix_file = os.path.join(path, 'matrix.npy')
+    if damage == 'truncate':
+        with open(matrix_file, 'r+b') as f:
+            f.truncate(os.path.getsize(matrix_file) // 2)
+    elif damage == 'remove':
+        os.remove(os.path.join(path, 'sums.order.npy'))
+    else:
+        with open(matrix_file, 'wb') as f:
+            f.write(b'not a pool')
+    assert np.array_equal(PoolStore(str(tmp_path)).open(20, 4).matrix, pool_matrix(20, 4))
+
+
+def test_partial_builds_are_ignored(tmp_path):
+    # What a build that was killed part way leaves behind
+    os.makedirs(tmp_path / '.build-interrupted')
+    (tmp_path / '.build-interrupted' / 'matrix.npy').write_bytes(b'\x93NUMPY')
+    assert np.array_equal(PoolStore(str(tmp_path)).open(20, 4).matrix, pool_matrix(20, 4))
+
+
+def test_pools_too_large_for_the_cache_come_from_the_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'pool_store', PoolStore(str(tmp_path)))
+    monkeypatch.setattr(server, 'result_cache', ResultCache(max_bytes=1))
+    source = server.sessions.create(CombinationPool(20, 4), 20, 4, stages=[])
+    assert isinstance(server.pool_block(source).matrix, np.memmap)
+
+    spec = {'filterType': 'sum', 'minSum': 30, 'maxSum': 40}
+    data = server.app.test_client().post('/filter', json={'sessionId': source.id, 'limit': 10000, **spec}).get_json()
+    expected = [list(c) for c in CombinationPool(20, 4) if 30 <= sum(c) <= 40]
+    assert data['total'] == len(expected)
+    assert data['combinations'] == expected
+
+
+def test_mapped_pools_are_shared_with_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(parallel, 'MIN_PARALLEL_ROWS', 0)
+    block = PoolStore(str(tmp_path)).open(20, 4)
+    assert parallel._mapped_file(block.matrix) is not None
+    stages = parse_pipeline([{'filterType': 'even_odd', 'minEven': 1, 'maxEven': 2}])
+    filtered, counts = parallel.run_pipeline_parallel(block, stages, workers=2)
+    expected, expected_counts = run_pipeline(Block(pool_matrix(20, 4)), stages)
+    assert (filtered.tolist(), counts) == (expected.tolist(), expected_counts)
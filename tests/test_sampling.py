@@ -0,0 +1,101 @@
+"""
+Uniform draws from the filtered space, against brute force.
+"""
+from itertools import combinations
+
+import pytest
+
+import app as server
+from counting import Constraints
+from pipeline import parse_pipeline
+from sampling import Sampler, draw_ranks
+
+FILTERS = [
+    [],
+    [{'filterType': 'sum', 'minSum': 20, 'maxSum': 30}],
+    [{'filterType': 'include', 'mustInclude': [4]}, {'filterType': 'exclude', 'mustExclude': [5, 9]}],
+    [
+        {'filterType': 'even_odd', 'minEven': 1, 'maxEven': 2},
+        {'filterType': 'consecutive', 'maxConsecutive': 1},
+        {'filterType': 'sum', 'minSum': 18, 'maxSum': 40},
+    ],
+    [{'filterType': 'include', 'mustInclude': [1, 2, 3, 4]}],
+    [{'filterType': 'sum', 'minSum': 100, 'maxSum': 200}],
+]
+
+
+def keeps(combo, spec):
+    kind = spec['filterType']
+    if kind == 'sum':
+        return spec['minSum'] <= sum(combo) <= spec['maxSum']
+    if kind == 'include':
+        return all(number in combo for number in spec['mustInclude'])
+    if kind == 'exclude':
+        return not any(number in combo for number in spec['mustExclude'])
+    if kind == 'even_odd':
+        return spec['minEven'] <= sum(1 for number in combo if number % 2 == 0) <= spec['maxEven']
+    return server.apply_consecutive_filter(combo, spec['maxConsecutive'])
+
+
+def survivors(total, choose, specs):
+    return [
+        list(c) for c in combinations(range(1, total + 1), choose)
+        if all(keeps(list(c), spec) for spec in specs)
+    ]
+
+
+@pytest.mark.parametrize('specs', FILTERS)
+@pytest.mark.parametrize('total,choose', [(14, 4), (12, 1), (10, 10)])
+def test_unranking_visits_the_filtered_set(total, choose, specs):
+    sampler = Sampler(Constraints.from_stages(total, choose, parse_pipeline(specs)))
+    expected = survivors(total, choose, specs)
+    assert sampler.count == len(expected)
+    assert [sampler.unrank(rank) for rank in range(sampler.count)] == expected
+    with pytest.raises(IndexError):
+        sampler.unrank(sampler.count)
+
+
+def test_draw_ranks():
+    ranks = draw_ranks(100, 30, seed=1)
+    assert len(set(ranks)) == 30 and all(0 <= rank < 100 for rank in ranks)
+    assert draw_ranks(100, 30, seed=1) == ranks
+    assert sorted(draw_ranks(5, 30, seed=1)) == [0, 1, 2, 3, 4]
+    assert len(draw_ranks(5, 30, seed=1, replace=True)) == 30
+    assert draw_ranks(0, 3) == []
+
+
+def check_draws(rows, expected, num_sets):
+    assert len(rows) == num_sets
+    assert len({tuple(row) for row in rows}) == num_sets
+    assert all(row == sorted(row) for row in rows)
+    assert all(row in expected for row in rows)
+
+
+def test_filter_draws_from_a_filtered_session():
+    client = server.app.test_client()
+    specs = FILTERS[3]
+    session = client.post('/calc', json={'total': 14, 'choose': 4, 'filters': specs}).get_json()['sessionId']
+    draw = {'filterType': 'random', 'numSets': 25, 'seed': 3}
+    data = client.post('/filter', json=dict(draw, sessionId=session)).get_json()
+    check_draws(data['combinations'], survivors(14, 4, specs), 25)
+    again = client.post('/filter', json=dict(draw, sessionId=session)).get_json()
+    assert again['combinations'] == data['combinations']
+
+
+def test_pipeline_draws_without_scanning(monkeypatch):
+    sampled = []
+    sample_session = server.sample_session
+    monkeypatch.setattr(server, 'sample_session', lambda *args: sampled.append(args) or sample_session(*args))
+    client = server.app.test_client()
+    specs = FILTERS[3]
+    session = client.post('/calc', json={'total': 14, 'choose': 4}).get_json()['sessionId']
+    draw = {'filterType': 'random', 'numSets': 25, 'seed': 3}
+    data = client.post('/pipeline', json={'sessionId': session, 'filters': specs + [draw]}).get_json()
+    check_draws(data['combinations'], survivors(14, 4, specs), 25)
+    assert data['stages'][-1]['total'] == 25
+    assert len(sampled) == 1
+    # Asking for more sets than survive draws every survivor once
+    expected = survivors(14, 4, FILTERS[1])
+    draw['numSets'] = len(expected) + 10
+    data = client.post('/pipeline', json={'sessionId': session, 'filters': FILTERS[1] + [draw]}).get_json()
+    assert sorted(data['combinations']) == expected
@@ -0,0 +1,51 @@
+"""
+Session store bounds, by count and by bytes.
+"""
+import numpy as np
+import pytest
+
+from combinatorics import CombinationPool
+from incremental import PipelineRun
+from pipeline import parse_pipeline
+from sessions import SessionStore
+from vectorized import Block
+
+
+def block(rows):
+    return Block(np.zeros((rows, 6), dtype=np.uint8))
+
+
+def test_sessions_are_evicted_by_bytes():
+    store = SessionStore(max_bytes=2500)
+    created = [store.create(block(100)) for _ in range(5)]
+    assert len(store) == 4
+    assert store.get(created[-1].id) is created[-1]
+    with pytest.raises(LookupError):
+        store.get(created[0].id)
+
+
+def test_latest_session_is_kept_when_too_large():
+    store = SessionStore(max_bytes=100)
+    store.create(block(10))
+    latest = store.create(block(1000))
+    assert len(store) == 1
+    assert store.get(latest.id) is latest
+
+
+def test_pipeline_runs_are_charged():
+    store = SessionStore(max_bytes=20000)
+    pool = store.create(CombinationPool(20, 3), 20, 3, stages=[])
+    others = [store.create(block(100)) for _ in range(3)]
+    assert pool.nbytes == 0
+    stages = parse_pipeline([{'filterType': 'sum', 'minSum': 6, 'maxSum': 30}])
+    run = PipelineRun.evaluate(Block(np.array(list(CombinationPool(20, 3)), dtype=np.uint8)), stages)
+    store.keep_run(pool, run)
+    assert pool.pipeline_run is run
+    assert pool.nbytes == run.nbytes > 0
+
+    store.max_bytes = 1000
+    store.keep_run(pool, run)
+    # Too large to keep even alone, and the others no longer fit beside it
+    assert pool.pipeline_run is None
+    assert len(store) == 2
+    assert store.get(others[-1].id) is others[-1]
@@ -0,0 +1,92 @@
+"""
+Streamed responses against the same requests answered in one piece.
+"""
+import json
+
+import pytest
+
+import app as server
+import streaming
+
+SUM = {'filterType': 'sum', 'minSum': 15, 'maxSum': 25}
+PIPELINE = [SUM, {'filterType': 'even_odd', 'minEven': 1, 'maxEven': 2}]
+
+
+@pytest.fixture
+def client():
+    return server.app.test_client()
+
+
+@pytest.fixture(params=[4096, 7])
+def chunk_rows(request, monkeypatch):
+    # Also split the rows over many small chunks
+    monkeypatch.setattr(streaming, 'STREAM_CHUNK_ROWS', request.param)
+
+
+def post(client, url, **body):
+    data = client.post(url, json=body).get_json()
+    assert 'error' not in data, data['error']
+    return data
+
+
+def stream(client, url, stream_format, **body):
+    """
+    (header, rows, trailer) of a streamed response.
+    """
+    response = client.post(url, json=dict(body, stream=stream_format))
+    assert response.is_streamed
+    if stream_format == 'ndjson':
+        assert response.mimetype == 'application/x-ndjson'
+        lines = response.get_data(as_text=True).splitlines()
+        header, *rows, trailer = [json.loads(line) for line in lines]
+        return header, rows, trailer
+    assert response.mimetype == 'application/json'
+    document = json.loads(response.get_data(as_text=True))
+    rows = document.pop('combinations')
+    return document, rows, document
+
+
+def session(client):
+    return post(client, '/calc', total=12, choose=3)['sessionId']
+
+
+@pytest.mark.parametrize('stream_format', ['ndjson', 'json'])
+def test_calc_stream(client, chunk_rows, stream_format):
+    plain = post(client, '/calc', total=12, choose=3)
+    header, rows, trailer = stream(client, '/calc', stream_format, total=12, choose=3)
+    assert 'sessionId' in header
+    assert rows == plain['combinations']
+    assert trailer['total'] == plain['total'] == 220
+
+
+@pytest.mark.parametrize('stream_format', ['ndjson', 'json'])
+def test_filter_stream(client, chunk_rows, stream_format):
+    plain = post(client, '/filter', sessionId=session(client), **SUM)
+    header, rows, trailer = stream(client, '/filter', stream_format, sessionId=session(client), **SUM)
+    assert header['filterName'] == plain['filterName']
+    assert rows == plain['combinations']
+    assert trailer['total'] == plain['total']
+
+    combos = post(client, '/calc', total=12, choose=3)['combinations']
+    _, rows, _ = stream(client, '/filter', stream_format, combinations=combos, **SUM)
+    assert rows == plain['combinations']
+
+
+@pytest.mark.parametrize('stream_format', ['ndjson', 'json'])
+def test_pipeline_stream(client, chunk_rows, stream_format):
+    plain = post(client, '/pipeline', sessionId=session(client), filters=PIPELINE)
+    _, rows, trailer = stream(client, '/pipeline', stream_format, sessionId=session(client), filters=PIPELINE)
+    assert rows == plain['combinations']
+    assert trailer['total'] == plain['total']
+    assert trailer['stages'] == plain['stages']
+
+
+def test_ndjson_accept_header(client):
+    response = client.post('/calc', json={'total': 12, 'choose': 3}, headers={'Accept': 'application/x-ndjson'})
+    assert response.mimetype == 'application/x-ndjson'
+    assert len(response.get_data(as_text=True).splitlines()) == 220 + 2
+
+
+def test_unknown_stream_format(client):
+    data = client.post('/calc', json={'total': 12, 'choose': 3, 'stream': 'xml'}).get_json()
+    assert 'Unknown stream format' in data['error']
@@ -0,0 +1,68 @@
+"""
+The vectorized kernels against the original per-row filters in app.py.
+"""
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from app import (apply_consecutive_filter, apply_even_odd_filter, apply_exclude_filter, apply_include_filter,
+                 apply_sum_filter)
+from expressions import parse_expression
+from features import index_block
+from vectorized import Block, filter_combinations, to_matrix
+
+# Pools on both sides of the 64-number bitmask limit
+POOLS = [(20, 3), (64, 2), (65, 3), (70, 2), (100, 2)]
+
+CASES = [
+    ('include', ([5, 9],), lambda combos: apply_include_filter(combos, [5, 9])),
+    ('include', ([66],), lambda combos: apply_include_filter(combos, [66])),
+    ('exclude', ([1, 2, 66],), lambda combos: [c for c in combos if apply_exclude_filter(c, [1, 2, 66])]),
+    ('sum', (30, 80), lambda combos: [c for c in combos if apply_sum_filter(c, 30, 80)]),
+    ('consecutive', (1,), lambda combos: [c for c in combos if apply_consecutive_filter(c, 1)]),
+    ('even_odd', (1, 1), lambda combos: [c for c in combos if apply_even_odd_filter(c, 1, 1)]),
+]
+
+
+def pool(total, choose):
+    return [list(c) for c in combinations(range(1, total + 1), choose)]
+
+
+@pytest.mark.parametrize('total,choose', POOLS)
+@pytest.mark.parametrize('filter_type,args,expected', CASES)
+def test_kernels_match_row_filters(total, choose, filter_type, args, expected):
+    combos = pool(total, choose)
+    assert filter_combinations(combos, filter_type, *args).tolist() == expected(combos)
+
+
+@pytest.mark.parametrize('total,choose', POOLS)
+@pytest.mark.parametrize('filter_type,args,expected', CASES)
+def test_kernels_match_on_taken_indexed_blocks(total, choose, filter_type, args, expected):
+    combos = pool(total, choose)
+    block = index_block(Block(to_matrix(combos)), total)
+    # Taking rows keeps the features, including the masks of pools past 64
+    taken = block.take(np.arange(0, len(block), 2))
+    assert filter_combinations(taken, filter_type, *args).tolist() == expected(combos[::2])
+
+
+@pytest.mark.parametrize('filter_type,args,expected', CASES)
+def test_kernels_on_empty_input(filter_type, args, expected):
+    empty = Block(np.empty((0, 3), dtype=np.uint8))
+    assert filter_combinations(empty, filter_type, *args).tolist() == []
+    assert len(filter_combinations([], filter_type, *args)) == 0
+
+
+@pytest.mark.parametrize('text', ['min >= 2', 'max <= 9 and sum >= 5', 'min > 1 or max < 9'])
+@pytest.mark.parametrize('shape', [(0, 3), (0, 0)])
+def test_expressions_on_empty_input(text, shape):
+    empty = Block(np.empty(shape, dtype=np.uint8))
+    assert filter_combinations(empty, 'expression', parse_expression(text)).tolist() == []
+
+
+def test_take_keeps_missing_masks():
+    block = Block(to_matrix(pool(70, 2)))
+    assert block.masks is None
+    taken = block.take(np.array([0, 5]))
+    assert taken.masks is None
+    assert taken.tolist() == [[1, 2], [1, 7]]
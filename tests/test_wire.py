@@ -0,0 +1,47 @@
+"""
+Binary wire formats round-trip combination matrices.
+"""
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from app import app
+from wire import BINARY_MIMETYPES, MASKS_MIMETYPE, RANKS_MIMETYPE, ROWS_MIMETYPE, decode, encode
+
+POOL = np.array(list(combinations(range(1, 21), 4)), dtype=np.uint8)
+
+
+@pytest.mark.parametrize('mimetype', BINARY_MIMETYPES)
+@pytest.mark.parametrize('rows', [POOL, POOL[::7], POOL[::-3], POOL[:0]])
+def test_round_trip(mimetype, rows):
+    matrix, total = decode(encode(rows, mimetype, 20), mimetype)
+    assert total == 20
+    assert matrix.reshape(-1, 4).tolist() == rows.tolist()
+
+
+def test_ranks_sort_rows_first():
+    rows = np.array([[5, 1, 2], [9, 3, 4]], dtype=np.uint8)
+    matrix, _ = decode(encode(rows, RANKS_MIMETYPE, 9), RANKS_MIMETYPE)
+    assert matrix.tolist() == [[1, 2, 5], [3, 4, 9]]
+
+
+def test_ranks_reject_repeated_numbers():
+    with pytest.raises(ValueError):
+        encode(np.array([[1, 1, 2]], dtype=np.uint8), RANKS_MIMETYPE, 9)
+
+
+def test_posted_unsorted_rows_as_ranks():
+    client = app.test_client()
+    response = client.post('/filter', json={'filterType': 'exclude', 'mustExclude': [7],
+                                            'combinations': [[5, 1, 2], [9, 3, 4]]},
+                           headers={'Accept': RANKS_MIMETYPE})
+    matrix, _ = decode(response.get_data(), RANKS_MIMETYPE)
+    assert matrix.tolist() == [[1, 2, 5], [3, 4, 9]]
+
+
+@pytest.mark.parametrize('mimetype', [ROWS_MIMETYPE, MASKS_MIMETYPE])
+def test_rows_and_masks_keep_posted_rows(mimetype):
+    rows = np.array([[5, 1, 2]], dtype=np.uint8)
+    matrix, _ = decode(encode(rows, mimetype, 9), mimetype)
+    assert sorted(matrix[0].tolist()) == [1, 2, 5]
@@ -0,0 +1,287 @@
+"""
+Batch filter engine. Combinations are held as an (N, choose) uint8 matrix,
+one sorted combination per row, and every filter is evaluated column-wise
+as a boolean mask over all rows at once.
+"""
+from math import comb
+
+import numpy as np
+
+import bitmask
+from combinatorics import CombinationPool
+
+# Upper bound on rows generated or scanned per block
+BLOCK_ROWS = 1 << 20
+
+
+def _extend(matrix, total, choose, width):
+    """
+    Extends lexicographically ordered combination prefixes column by column
+    until they are `width` wide, keeping lexicographic order.
+    """
+    while matrix.shape[1] < width:
+        col = matrix.shape[1]
+        last = matrix[:, -1].astype(np.int64)
+        highest = total - (choose - 1 - col)
+        counts = highest - last
+        rows = int(counts.sum())
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        offsets = np.arange(rows, dtype=np.int64) - starts
+        expanded = np.repeat(matrix, counts, axis=0)
+        next_col = np.repeat(last + 1, counts) + offsets
+        matrix = np.column_stack([expanded, next_col.astype(matrix.dtype)])
+    return matrix
+
+
+def _first_column(total, choose):
+    return np.arange(1, total - choose + 2, dtype=np.uint8).reshape(-1, 1)
+
+
+def pool_blocks(total, choose, block_rows=BLOCK_ROWS, start=0, stop=None):
+    """
+    Yields the pool of all combinations as uint8 matrices in the same order
+    as itertools.combinations, at most about `block_rows` rows at a time.
+    Only rows whose lexicographic rank is in [start, stop) are generated.
+    """
+    if total > 255:
+        raise ValueError("Total numbers above 255 are not supported")
+    stop = comb(total, choose) if stop is None else min(stop, comb(total, choose))
+    if start >= stop:
+        return
+    if choose == 0:
+        yield np.empty((1, 0), dtype=np.uint8)
+        return
+    # Fix enough leading numbers that each prefix expands to a small block
+    depth = 1
+    while depth < choose and comb(total - depth, choose - depth) > block_rows:
+        depth += 1
+    prefixes = _extend(_first_column(total, choose), total, choose, depth)
+    sizes = np.array([comb(total - int(last), choose - depth) for last in prefixes[:, -1]], dtype=np.int64)
+    ends = np.cumsum(sizes)
+    # Prefixes whose rank range overlaps [start, stop)
+    first = int(np.searchsorted(ends, start, side='right'))
+    last = int(np.searchsorted(ends, stop, side='left')) + 1
+    offset = int(ends[first] - sizes[first])
+    group = first
+    rows = 0
+    for i in range(first, last):
+        if rows and rows + sizes[i] > block_rows:
+            yield _trim(_extend(prefixes[group:i], total, choose, choose), offset, start, stop)
+            offset += rows
+            group = i
+            rows = 0
+        rows += int(sizes[i])
+    yield _trim(_extend(prefixes[group:last], total, choose, choose), offset, start, stop)
+
+
+def _trim(matrix, offset, start, stop):
+    """
+    Rows of a block starting at rank `offset` that fall in [start, stop).
+    """
+    return matrix[max(start - offset, 0):stop - offset]
+
+
+class Block:
+    """
+    A batch of combinations as an (N, choose) matrix. Per-row features such
+    as the 64-bit masks are computed on first use and carried along when
+    rows are taken, so later filters over the same rows reuse them. Range
+    indexes over the features (see features.py) only apply to this block.
+    """
+
+    def __init__(self, matrix, features=None):
+        self.matrix = matrix
+        self.features = features if features is not None else {}
+        self.indexes = {}
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.take(index)
+        return self.matrix[index].tolist()
+
+    def take(self, rows):
+        """
+        New block with the selected rows (boolean mask, indices or slice).
+        """
+        # A None feature (masks of numbers past 64) still holds for the rows
+        features = {name: values[rows] if values is not None else None for name, values in self.features.items()}
+        return Block(self.matrix[rows], features)
+
+    def tolist(self):
+        return self.matrix.tolist()
+
+    @property
+    def masks(self):
+        """
+        uint64 bitmask per row, or None when the numbers do not fit.
+        """
+        if 'masks' not in self.features:
+            self.features['masks'] = bitmask.to_masks(self.matrix) if bitmask.fits(self.matrix) else None
+        return self.features['masks']
+
+    @staticmethod
+    def concat(blocks):
+        blocks = list(blocks)
+        if not blocks:
+            return Block(np.empty((0, 0), dtype=np.uint8))
+        if len(blocks) == 1:
+            return blocks[0]
+        shared = set.intersection(*(set(block.features) for block in blocks))
+        features = {
+            name: np.concatenate([block.features[name] for block in blocks])
+            for name in shared
+            if all(block.features[name] is not None for block in blocks)
+        }
+        return Block(np.concatenate([block.matrix for block in blocks]), features)
+
+
+def iter_blocks(combos, block_rows=BLOCK_ROWS):
+    """
+    Yields a combination set (pool, block or list) as blocks.
+    """
+    if isinstance(combos, CombinationPool):
+        for matrix in pool_blocks(combos.total_numbers, combos.choose, block_rows):
+            yield Block(matrix)
+        return
+    if not isinstance(combos, Block):
+        combos = Block(to_matrix(combos))
+    if len(combos) <= block_rows:
+        yield combos
+        return
+    for start in range(0, len(combos), block_rows):
+        yield combos[start:start + block_rows]
+
+
+def to_matrix(combos):
+    """
+    Converts a list of combinations to a matrix, using uint8 when every
+    number fits.
+    """
+    if isinstance(combos, np.ndarray):
+        return combos
+    if isinstance(combos, Block):
+        return combos.matrix
+    if isinstance(combos, CombinationPool):
+        return Block.concat(iter_blocks(combos)).matrix
+    if len(combos) == 0:
+        return np.empty((0, 0), dtype=np.uint8)
+    matrix = np.asarray(combos, dtype=np.int64)
+    if matrix.ndim != 2:
+        raise ValueError("Combinations must all have the same length")
+    if matrix.size and (matrix.min() < 0 or matrix.max() > 255):
+        return matrix
+    return matrix.astype(np.uint8)
+
+
+def _columns(matrix):
+    # Per-column passes over contiguous rows are much faster than
+    # reductions along the short row axis
+    return [matrix[:, col] for col in range(matrix.shape[1])]
+
+
+def row_sums(matrix):
+    sums = np.zeros(len(matrix), dtype=np.result_type(matrix.dtype, np.int32))
+    for column in _columns(matrix):
+        sums += column
+    return sums
+
+
+def even_counts(matrix):
+    evens = np.zeros(len(matrix), dtype=np.uint8)
+    for column in _columns(matrix):
+        evens += (column & 1) == 0
+    return evens
+
+
+def _is_sorted(matrix):
+    columns = _columns(matrix)
+    return all((later >= earlier).all() for earlier, later in zip(columns, columns[1:]))
+
+
+def longest_runs(matrix):
+    """
+    Length of the longest run of consecutive numbers in each row.
+    """
+    if not _is_sorted(matrix):
+        matrix = np.sort(matrix, axis=1)
+    columns = _columns(matrix)
+    longest = np.ones(len(matrix), dtype=np.uint8)
+    run = longest.copy()
+    for earlier, later in zip(columns, columns[1:]):
+        run = run * (later - earlier == 1) + 1
+        np.maximum(longest, run, out=longest)
+    return longest
+
+
+def _contains(matrix, number):
+    hit = np.zeros(len(matrix), dtype=bool)
+    for column in _columns(matrix):
+        hit |= column == number
+    return hit
+
+
+def sum_mask(block, min_sum, max_sum):
+    if 'sums' in block.indexes:
+        return block.indexes['sums'].mask(min_sum, max_sum)
+    sums = block.features.get('sums')
+    if sums is None:
+        sums = row_sums(block.matrix)
+    return (sums >= min_sum) & (sums <= max_sum)
+
+
+def even_odd_mask(block, min_even, max_even):
+    if 'evens' in block.indexes:
+        return block.indexes['evens'].mask(min_even, max_even)
+    evens = block.features.get('evens')
+    if evens is None:
+        masks = block.features.get('masks')
+        evens = bitmask.even_counts(masks) if masks is not None else even_counts(block.matrix)
+    return (evens >= min_even) & (evens <= max_even)
+
+
+def consecutive_mask(block, max_consecutive):
+    if 'runs' in block.indexes:
+        return block.indexes['runs'].mask(0, max_consecutive)
+    runs = block.features.get('runs')
+    if runs is None:
+        runs = longest_runs(block.matrix)
+    return runs <= max_consecutive
+
+
+def include_mask(block, must_include):
+    if must_include and block.masks is not None:
+        return bitmask.include_mask(block.masks, must_include)
+    mask = np.ones(len(block), dtype=bool)
+    for number in must_include:
+        mask &= _contains(block.matrix, number)
+    return mask
+
+
+def exclude_mask(block, must_exclude):
+    if must_exclude and block.masks is not None:
+        return bitmask.exclude_mask(block.masks, must_exclude)
+    mask = np.ones(len(block), dtype=bool)
+    for number in must_exclude:
+        mask &= ~_contains(block.matrix, number)
+    return mask
+
+
+KERNELS = {
+    'include': include_mask,
+    'exclude': exclude_mask,
+    'sum': sum_mask,
+    'consecutive': consecutive_mask,
+    'even_odd': even_odd_mask,
+}
+
+
+def filter_combinations(combos, filter_type, *args):
+    """
+    Applies one filter to a combination set and returns the surviving rows
+    as a block.
+    """
+    kernel = KERNELS[filter_type]
+    return Block.concat(block.take(kernel(block, *args)) for block in iter_blocks(combos))
@@ -0,0 +1,190 @@
+"""
+Compact binary wire formats for combination sets, as an alternative to
+JSON arrays. Every body starts with the same 14-byte header:
+
+    magic b'LTF1' | total_numbers (uint8) | choose (uint8) | count (uint64 LE)
+
+followed by one of three payloads, chosen by content type:
+- application/x-lottery-rows: `choose` uint8 numbers per combination;
+- application/x-lottery-masks: one uint64 LE bitmask per combination, with
+  number x as bit x - 1 (pools of up to 64 numbers);
+- application/x-lottery-ranks: each combination's position in the pool
+  (as a set: rows are sorted first), delta-encoded between rows,
+  zigzagged and written as LEB128 varints. Results in pool order cost one
+  or two bytes each.
+"""
+import struct
+from math import comb
+
+import numpy as np
+from flask import Response
+
+import bitmask
+
+ROWS_MIMETYPE = 'application/x-lottery-rows'
+MASKS_MIMETYPE = 'application/x-lottery-masks'
+RANKS_MIMETYPE = 'application/x-lottery-ranks'
+BINARY_MIMETYPES = (ROWS_MIMETYPE, MASKS_MIMETYPE, RANKS_MIMETYPE)
+
+MAGIC = b'LTF1'
+_HEADER = struct.Struct('<4sBBQ')
+
+# Response fields sent as headers alongside a binary body
+HEADER_FIELDS = {
+    'sessionId': 'X-Session-Id',
+    'filterName': 'X-Filter-Name',
+    'total': 'X-Total',
+    'offset': 'X-Offset',
+    'limit': 'X-Limit',
+    'nextCursor': 'X-Next-Cursor',
+}
+
+
+def _comb_table(total_numbers, choose):
+    if comb(total_numbers, choose) >= 2 ** 63:
+        raise ValueError("Pool too large for the ranks format")
+    return np.array(
+        [[comb(v, i) for v in range(total_numbers + 1)] for i in range(choose + 1)],
+        dtype=np.uint64,
+    )
+
+
+def lex_ranks(matrix, total_numbers):
+    """
+    Vectorized combinatorics.lex_rank over sorted rows.
+    """
+    choose = matrix.shape[1]
+    table = _comb_table(total_numbers, choose)
+    colex = np.zeros(len(matrix), dtype=np.uint64)
+    # The mirrored combination (total + 1 - x) ascending is the row reversed
+    for i in range(choose):
+        mirrored = total_numbers + 1 - matrix[:, choose - 1 - i].astype(np.int64)
+        colex += table[i + 1][mirrored - 1]
+    return np.uint64(comb(total_numbers, choose) - 1) - colex
+
+
+def lex_unrank(ranks, total_numbers, choose):
+    """
+    Vectorized combinatorics.lex_unrank; returns a uint8 matrix.
+    """
+    table = _comb_table(total_numbers, choose)
+    colex = np.uint64(comb(total_numbers, choose) - 1) - ranks.astype(np.uint64)
+    matrix = np.empty((len(ranks), choose), dtype=np.uint8)
+    for i in range(choose, 0, -1):
+        c = np.searchsorted(table[i], colex, side='right') - 1
+        colex -= table[i][c]
+        # Mirrored element i - 1 is c + 1, which lands in column choose - i
+        matrix[:, choose - i] = total_numbers - c
+    return matrix
+
+
+def _varint_encode(values):
+    lengths = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        lengths += rest > 0
+        rest >>= np.uint64(7)
+    out = np.empty(int(lengths.sum()), dtype=np.uint8)
+    starts = np.cumsum(lengths) - lengths
+    for b in range(int(lengths.max(initial=0))):
+        sel = lengths > b
+        byte = (values[sel] >> np.uint64(7 * b)) & np.uint64(0x7F)
+        more = (lengths[sel] > b + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[sel] + b] = (byte | more).astype(np.uint8)
+    return out.tobytes()
+
+
+def _varint_decode(payload):
+    data = np.frombuffer(payload, dtype=np.uint8)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1]).astype(np.int64)
+    lengths = ends - starts + 1
+    values = np.zeros(len(ends), dtype=np.uint64)
+    for b in range(int(lengths.max(initial=0))):
+        sel = lengths > b
+        byte = (data[starts[sel] + b] & 0x7F).astype(np.uint64)
+        values[sel] |= byte << np.uint64(7 * b)
+    return values
+
+
+def encode(matrix, mimetype, total_numbers=None):
+    """
+    Binary body for a combination matrix in the given format.
+    """
+    choose = matrix.shape[1] if matrix.ndim == 2 else 0
+    if total_numbers is None:
+        total_numbers = int(matrix.max(initial=0))
+    header = _HEADER.pack(MAGIC, total_numbers, choose, len(matrix))
+    if mimetype == ROWS_MIMETYPE:
+        if matrix.dtype != np.uint8:
+            raise ValueError("The rows format only supports numbers up to 255")
+        return header + matrix.tobytes()
+    if mimetype == MASKS_MIMETYPE:
+        if not bitmask.fits(matrix):
+            raise ValueError("The masks format only supports numbers 1 to 64")
+        return header + bitmask.to_masks(matrix).astype('<u8').tobytes()
+    if mimetype == RANKS_MIMETYPE:
+        if choose > 1 and not (matrix[:, 1:] > matrix[:, :-1]).all():
+            matrix = np.sort(matrix, axis=1)
+            if not (matrix[:, 1:] > matrix[:, :-1]).all():
+                raise ValueError("The ranks format does not support repeated numbers in a combination")
+        if len(matrix) and (matrix.min() < 1 or matrix.max() > total_numbers):
+            raise ValueError(f"The ranks format only supports numbers 1 to {total_numbers}")
+        ranks = lex_ranks(matrix, total_numbers).astype(np.int64)
+        deltas = np.diff(ranks, prepend=np.int64(0))
+        zigzag = ((deltas << 1) ^ (deltas >> 63)).astype(np.uint64)
+        return header + _varint_encode(zigzag)
+    raise ValueError(f"Unknown wire format: {mimetype}")
+
+
+def decode(body, mimetype):
+    """
+    Returns (matrix, total_numbers) from a binary body.
+    """
+    if len(body) < _HEADER.size:
+        raise ValueError("Binary body is too short")
+    magic, total_numbers, choose, count = _HEADER.unpack_from(body)
+    if magic != MAGIC:
+        raise ValueError("Not a lottery wire format body")
+    payload = body[_HEADER.size:]
+    if mimetype == ROWS_MIMETYPE:
+        if len(payload) != count * choose:
+            raise ValueError("Row payload does not match the header")
+        matrix = np.frombuffer(payload, dtype=np.uint8).reshape(count, choose)
+    elif mimetype == MASKS_MIMETYPE:
+        if len(payload) != count * 8:
+            raise ValueError("Mask payload does not match the header")
+        masks = np.frombuffer(payload, dtype='<u8').astype(np.uint64)
+        if count and not (bitmask.popcount(masks) == choose).all():
+            raise ValueError("Every mask must have exactly choose bits set")
+        matrix = np.empty((count, choose), dtype=np.uint8)
+        for col in range(choose):
+            # Peel off the lowest set bit; its position is the next number
+            lowest = masks & (~masks + np.uint64(1))
+            matrix[:, col] = bitmask.popcount(lowest - np.uint64(1)) + 1
+            masks ^= lowest
+    elif mimetype == RANKS_MIMETYPE:
+        zigzag = _varint_decode(payload)
+        if len(zigzag) != count:
+            raise ValueError("Rank payload does not match the header")
+        deltas = (zigzag >> np.uint64(1)).astype(np.int64) ^ -(zigzag & np.uint64(1)).astype(np.int64)
+        ranks = np.cumsum(deltas)
+        if count and (ranks.min() < 0 or ranks.max() >= comb(total_numbers, choose)):
+            raise ValueError("Rank out of range for the pool")
+        matrix = lex_unrank(ranks, total_numbers, choose)
+    else:
+        raise ValueError(f"Unknown wire format: {mimetype}")
+    return matrix, total_numbers
+
+
+def binary_response(mimetype, matrix, total_numbers, fields):
+    """
+    Binary response for a combination matrix, with the JSON response
+    fields moved into headers.
+    """
+    headers = {
+        HEADER_FIELDS[name]: str(value)
+        for name, value in fields.items()
+        if name in HEADER_FIELDS and value is not None
+    }
+    return Response(encode(matrix, mimetype, total_numbers), mimetype=mimetype, headers=headers)